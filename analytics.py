@@ -0,0 +1,210 @@
+"""Columnar analytics over ``CustomerInteraction`` history.
+
+Interactions are stored as NumPy columns (one array per field, categorical
+fields as small integer codes) instead of a list of Pydantic objects, so the
+dashboard aggregates run as vectorized operations:
+
+* resolution rate and time-to-resolution percentiles;
+* CSAT (``satisfaction_score``) mean and count by category, tier or channel;
+* escalation rate by category, tier or channel.
+
+The store grows by appending (amortized O(1) per row, capacity doubles), so
+new interactions are added incrementally without rebuilding the columns.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from support_system import CustomerDetails, CustomerInteraction, CustomerTier, QueryCategory
+
+CATEGORIES = [c.value for c in QueryCategory]
+TIERS = [t.value for t in CustomerTier]
+
+COLUMNS = {
+    "timestamp": np.float64,   # epoch seconds
+    "ttr": np.float64,         # seconds to resolution, NaN when unresolved
+    "csat": np.float64,        # 1-5, NaN when not rated
+    "resolved": np.bool_,
+    "escalated": np.bool_,
+    "category": np.int8,
+    "tier": np.int8,
+    "channel": np.int16,
+}
+DIMENSIONS = ("category", "tier", "channel")
+
+
+class InteractionStore:
+    """Append-only columnar store of customer interactions."""
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._lock = threading.Lock()
+        self._columns = {name: np.empty(capacity, dtype) for name, dtype in COLUMNS.items()}
+        self.channels: List[str] = []
+        self._channel_codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._columns["timestamp"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self._columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _channel_code(self, channel: str) -> int:
+        code = self._channel_codes.get(channel)
+        if code is None:
+            code = self._channel_codes[channel] = len(self.channels)
+            self.channels.append(channel)
+        return code
+
+    def append_columns(self, timestamp: Sequence[float], ttr: Sequence[float], csat: Sequence[float],
+                       resolved: Sequence[bool], escalated: Sequence[bool], category: Sequence[int],
+                       tier: Sequence[int], channel: Sequence[int]):
+        """Bulk append of already-encoded rows (codes index ``CATEGORIES``, ``TIERS``, ``channels``)."""
+        rows = {"timestamp": timestamp, "ttr": ttr, "csat": csat, "resolved": resolved,
+                "escalated": escalated, "category": category, "tier": tier, "channel": channel}
+        count = len(timestamp)
+        with self._lock:
+            self._reserve(count)
+            start, end = self._size, self._size + count
+            for name, values in rows.items():
+                self._columns[name][start:end] = values
+            self._size = end
+
+    def extend(self, interactions: Iterable[CustomerInteraction], tier: CustomerTier):
+        """Append interactions of a customer of the given tier."""
+        interactions = list(interactions)
+        if not interactions:
+            return
+        with self._lock:
+            channels = [self._channel_code(i.channel) for i in interactions]
+        self.append_columns(
+            timestamp=[i.timestamp.timestamp() for i in interactions],
+            ttr=[(i.resolution_time - i.timestamp).total_seconds() if i.resolved and i.resolution_time
+                 else np.nan for i in interactions],
+            csat=[i.satisfaction_score if i.satisfaction_score is not None else np.nan for i in interactions],
+            resolved=[i.resolved for i in interactions],
+            escalated=[i.escalated for i in interactions],
+            category=[CATEGORIES.index(i.query_type.value) for i in interactions],
+            tier=[TIERS.index(tier.value)] * len(interactions),
+            channel=channels,
+        )
+
+    def append(self, interaction: CustomerInteraction, tier: CustomerTier):
+        self.extend([interaction], tier)
+
+    def add_customer(self, customer: CustomerDetails):
+        self.extend(customer.interaction_history, customer.tier)
+
+    def _view(self, since: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        # Rows below _size are never rewritten, so slices stay consistent after the lock
+        with self._lock:
+            view = {name: column[:self._size] for name, column in self._columns.items()}
+        if since is not None:
+            mask = view["timestamp"] >= since.timestamp()
+            view = {name: column[mask] for name, column in view.items()}
+        return view
+
+    def _labels(self, dimension: str) -> List[str]:
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension}")
+        return {"category": CATEGORIES, "tier": TIERS, "channel": self.channels}[dimension]
+
+    def resolution_rate(self, since: Optional[datetime] = None) -> float:
+        resolved = self._view(since)["resolved"]
+        return float(resolved.mean()) if len(resolved) else 0.0
+
+    def ttr_percentiles(self, percentiles: Sequence[float] = (50, 90, 99),
+                        since: Optional[datetime] = None) -> Dict[float, float]:
+        """Time-to-resolution percentiles in seconds, over resolved interactions."""
+        ttr = self._view(since)["ttr"]
+        ttr = ttr[~np.isnan(ttr)]
+        if not len(ttr):
+            return {p: float("nan") for p in percentiles}
+        return dict(zip(percentiles, np.percentile(ttr, percentiles).tolist()))
+
+    def csat_by(self, dimension: str, since: Optional[datetime] = None) -> Dict[str, dict]:
+        """Mean CSAT and number of ratings per value of ``dimension``."""
+        labels = self._labels(dimension)
+        view = self._view(since)
+        rated = ~np.isnan(view["csat"])
+        codes = view[dimension][rated]
+        counts = np.bincount(codes, minlength=len(labels))
+        totals = np.bincount(codes, weights=view["csat"][rated], minlength=len(labels))
+        return {
+            label: {"mean": float(totals[i] / counts[i]), "count": int(counts[i])}
+            for i, label in enumerate(labels) if counts[i]
+        }
+
+    def escalation_rate_by(self, dimension: str, since: Optional[datetime] = None) -> Dict[str, dict]:
+        """Share of escalated interactions per value of ``dimension``."""
+        labels = self._labels(dimension)
+        view = self._view(since)
+        counts = np.bincount(view[dimension], minlength=len(labels))
+        escalated = np.bincount(view[dimension], weights=view["escalated"], minlength=len(labels))
+        return {
+            label: {"rate": float(escalated[i] / counts[i]), "count": int(counts[i])}
+            for i, label in enumerate(labels) if counts[i]
+        }
+
+    def summary(self, since: Optional[datetime] = None) -> dict:
+        view = self._view(since)
+        total = len(view["resolved"])
+        csat = view["csat"][~np.isnan(view["csat"])]
+        return {
+            "interactions": total,
+            "resolution_rate": float(view["resolved"].mean()) if total else 0.0,
+            "escalation_rate": float(view["escalated"].mean()) if total else 0.0,
+            "csat": float(csat.mean()) if len(csat) else float("nan"),
+            "ttr_percentiles": self.ttr_percentiles(since=since),
+        }
+
+
+def load_demo_interactions(store: InteractionStore, count: int, seed: int = 0,
+                           days: int = 90):
+    """Fill ``store`` with ``count`` synthetic interactions (vectorized)."""
+    rng = np.random.default_rng(seed)
+    with store._lock:
+        channels = [store._channel_code(c) for c in ("chat", "email", "phone")]
+    now = datetime.utcnow().timestamp()
+    category = rng.integers(0, len(CATEGORIES), count)
+    tier = rng.choice(len(TIERS), count, p=[0.7, 0.25, 0.05])
+    escalated = rng.random(count) < np.where(category == CATEGORIES.index("billing"), 0.2, 0.06)
+    resolved = rng.random(count) < np.where(escalated, 0.6, 0.9)
+    ttr = np.where(resolved, rng.lognormal(np.log(1800), 1.0, count), np.nan)
+    rated = rng.random(count) < 0.4
+    csat = np.where(rated, np.clip(np.round(rng.normal(np.where(resolved, 4.2, 2.5), 0.8)), 1, 5), np.nan)
+    store.append_columns(
+        timestamp=now - rng.random(count) * timedelta(days=days).total_seconds(),
+        ttr=ttr,
+        csat=csat,
+        resolved=resolved,
+        escalated=escalated,
+        category=category,
+        tier=tier,
+        channel=np.asarray(channels)[rng.integers(0, len(channels), count)],
+    )
+
+
+# Almacén global de interacciones
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_interaction_store() -> InteractionStore:
+    """Obtiene o crea el almacén global de interacciones."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = InteractionStore()
+        return _store
@@ -1,15 +1,47 @@
+import functools
+import json
+import os
+import threading
+import uuid
 import streamlit as st
 from datetime import datetime, timedelta
+from typing import Optional
 from support_system import (
     CustomerDetails, 
+    CustomerInteraction,
     CustomerTier, 
     Order,
     OrderStatus,
     Item,
     agent,
+    customer_context,
+    model_backend,
+    model_ready,
+    record_prompt_usage,
     shipping_info_db,
-    knowledge_base
+    kb_store
 )
+from tool_cache import ToolResultCache, conversation_cache
+from cascade import cascade_enabled, get_cascade
+from scheduler import SchedulerRejected, get_scheduler, scheduler_enabled
+from work_queue import enqueue_response_side_effects, get_work_queue
+import tracing
+import fast_path
+from startup import get_orchestrator
+from analytics import get_interaction_store, load_demo_interactions
+from customer_directory import CustomerDirectory, get_customer_directory
+from profile_cache import get_profile_cache
+import memory_profile
+from prewarm import record_first_reply, session_prewarm, start_prewarm
+from single_flight import coalesce_key, get_single_flight, single_flight_enabled
+from cancellation import CancelToken, RunCancelled, RunTimedOut, request_deadline, run_sync
+from cancellation import scope as cancellation_scope
+
+# Perfilado de memoria opcional (MEMORY_PROFILING=true)
+memory_profile.get_memory_profiler()
+
+# Messages rendered per page of the chat log (0 renders the whole history)
+CHAT_WINDOW = int(os.getenv('CHAT_WINDOW', '20'))
 
 # Page configuration
 st.set_page_config(
@@ -79,10 +111,18 @@ st.markdown("""
 # Initialize session state
 if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
-    
-if 'current_customer' not in st.session_state:
-    # Initialize demo customer
-    st.session_state.current_customer = CustomerDetails(
+
+if 'chat_window' not in st.session_state:
+    st.session_state.chat_window = CHAT_WINDOW
+
+if 'tool_cache' not in st.session_state:
+    # Tool results memoized for the lifetime of this conversation
+    st.session_state.tool_cache = ToolResultCache()
+
+
+def demo_customer() -> CustomerDetails:
+    """The demo customer shown when a session starts."""
+    return CustomerDetails(
         customer_id="CUST001",
         name="John Doe",
         email="john.doe@example.com",
@@ -113,185 +153,621 @@ if 'current_customer' not in st.session_state:
         ]
     )
 
-# Sidebar - Customer Information
-with st.sidebar:
+
+@st.cache_resource(show_spinner="Loading customer directory...")
+def customer_directory() -> CustomerDirectory:
+    """Process-wide customer directory, with the demo customer registered."""
+    directory = get_customer_directory()
+    # The directory outlives this resource cache (cleared cache, reloaded page)
+    if directory.lookup("customer_id", "CUST001") is None:
+        directory.add_profile(demo_customer())
+    return directory
+
+
+
+def open_customer(customer: CustomerDetails):
+    """Make ``customer`` the session's customer and start the speculative prewarm."""
+    st.session_state.current_customer = customer
+    # Prefetch orders and pre-fill the prompt while the user types
+    st.session_state.prewarm = (start_prewarm(customer, st.session_state.tool_cache)
+                                if session_prewarm else None)
+
+
+if 'current_customer' not in st.session_state:
+    # Initialize demo customer (a reference to the shared cached profile)
+    open_customer(customer_directory().get_profile("CUST001"))
+
+ORDER_STATUS_COLORS = {
+    OrderStatus.SHIPPED: "#28a745",
+    OrderStatus.PENDING: "#ffc107",
+    OrderStatus.PROCESSING: "#17a2b8",
+    OrderStatus.DELIVERED: "#28a745",
+    OrderStatus.CANCELLED: "#dc3545"
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def build_sidebar_view(customer_json: str, shipping_json: str) -> dict:
+    """Pre-render the sidebar content; recomputed only when the customer or tracking data change."""
+    customer = CustomerDetails.model_validate_json(customer_json)
+    shipping = json.loads(shipping_json)
+    last_purchase = (customer.last_purchase_date.strftime('%Y-%m-%d')
+                     if customer.last_purchase_date else "-")
+    orders = []
+    for order in customer.orders or []:
+        status_color = ORDER_STATUS_COLORS.get(order.status, "#6c757d")
+        badge = f"""
+            <div style='display: flex; justify-content: space-between; align-items: center;'>
+                <span>Order {order.order_id}</span>
+                <span style='background-color: {status_color}; color: white; padding: 2px 8px; border-radius: 10px;'>
+                    {order.status.value.upper()}
+                </span>
+            </div>
+        """
+        details = (
+            f"**Date:** {order.order_date.strftime('%Y-%m-%d')}  \n"
+            f"**Total:** ${order.total_amount:.2f}\n\n"
+            "**Items:**\n\n"
+            + "\n".join(f"• {item.name} (x{item.quantity})  " for item in order.items)
+        )
+        tracking_info = shipping.get(order.order_id) if order.tracking_number else None
+        if tracking_info:
+            details += (
+                "\n\n**Tracking Information**\n\n"
+                f"**Carrier:** {tracking_info['carrier']}  \n"
+                f"**Status:** {tracking_info['status']}  \n"
+                f"**Location:** {tracking_info['current_location']}"
+            )
+        orders.append({"title": f"Order {order.order_id}", "badge": badge, "details": details})
+    return {
+        "tier": customer.tier.value.upper(),
+        "customer_id": customer.customer_id,
+        "name": customer.name,
+        "email": customer.email,
+        "phone": customer.phone or "-",
+        "last_purchase": last_purchase,
+        "total_orders": customer.total_orders,
+        "total_spent": f"${customer.total_spent:.2f}",
+        "orders": orders,
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def build_kb_view(kb_json: str) -> dict:
+    """Pre-render the knowledge base panels as one markdown block per section."""
+    kb = json.loads(kb_json)
+    return {
+        section: "\n\n".join(f"**{key.title()}**  \n{value}" for key, value in kb.get(section, {}).items())
+        for section in ("shipping_policies", "return_policies", "warranty_info")
+    }
+
+
+def message_html(role: str, content: str) -> str:
+    css_class, label = ("user-message", "You") if role == "user" else ("assistant-message", "Support AI")
+    return f"""
+        <div class="{css_class}">
+            <strong>{label}:</strong><br>{content}
+        </div>
+    """
+
+
+def select_customer(customer_id: str):
+    """Switch the session to another customer; the conversation starts over."""
+    if customer_id == st.session_state.current_customer.customer_id:
+        return
+    profile = customer_directory().get_profile(customer_id)
+    if profile is None:
+        return
+    prewarm = st.session_state.get("prewarm")
+    if prewarm is not None:
+        prewarm.cancel()
+    clear_chat()
+    open_customer(profile)
+
+
+def customer_search():
+    """Type-ahead over the customer directory by id, email or phone."""
+    query = st.text_input("Find customer", placeholder="ID, email or phone", key="customer_query")
+    if not query:
+        return
+    matches = customer_directory().search(query, limit=8)
+    if not matches:
+        st.caption("No matching customers")
+    for match in matches:
+        if st.button(f"{match.name} · {match.email}", key=f"pick_{match.customer_id}",
+                     help=f"{match.customer_id} · +{match.phone}", use_container_width=True):
+            select_customer(match.customer_id)
+            # The chat belongs to the previous customer: rerun the whole page
+            st.rerun()
+
+
+@st.fragment
+def customer_sidebar():
+    """Customer profile; as a fragment it is not re-run by chat interactions."""
+    customer_search()
+    customer = st.session_state.current_customer
+    relevant_shipping = {
+        o.order_id: shipping_info_db[o.order_id]
+        for o in customer.orders or [] if o.order_id in shipping_info_db
+    }
+    view = build_sidebar_view(
+        customer.model_dump_json(), json.dumps(relevant_shipping, sort_keys=True, default=str))
+
     st.title("Customer Profile")
-    
+
     # Profile header with tier badge
     st.markdown(f"""
         <h2 style='margin-bottom: 0;'>Customer Profile</h2>
-        <span style='background-color: #1f77b4; color: white; padding: 2px 8px; border-radius: 10px;'>{st.session_state.current_customer.tier.value.upper()}</span>
+        <span style='background-color: #1f77b4; color: white; padding: 2px 8px; border-radius: 10px;'>{view['tier']}</span>
     """, unsafe_allow_html=True)
-    
+
     # Customer Information Card
     st.markdown("""---""")
     st.subheader("Basic Information")
     cols = st.columns(2)
     with cols[0]:
-        st.markdown("**ID**")
-        st.markdown("**Name**")
-        st.markdown("**Email**")
-        st.markdown("**Phone**")
-        st.markdown("**Joined**")
+        st.markdown("**ID**  \n**Name**  \n**Email**  \n**Phone**  \n**Joined**")
     with cols[1]:
-        st.markdown(f"`{st.session_state.current_customer.customer_id}`")
-        st.markdown(st.session_state.current_customer.name)
-        st.markdown(f"[{st.session_state.current_customer.email}](mailto:{st.session_state.current_customer.email})")
-        st.markdown(st.session_state.current_customer.phone)
-        st.markdown(st.session_state.current_customer.last_purchase_date.strftime('%Y-%m-%d'))
+        st.markdown(
+            f"`{view['customer_id']}`  \n{view['name']}  \n"
+            f"[{view['email']}](mailto:{view['email']})  \n"
+            f"{view['phone']}  \n{view['last_purchase']}"
+        )
 
     # Customer Statistics
     st.markdown("""---""")
     st.subheader("Statistics")
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Orders", st.session_state.current_customer.total_orders)
+        st.metric("Orders", view['total_orders'])
     with col2:
-        st.metric("Total Spent", f"${st.session_state.current_customer.total_spent:.2f}")
+        st.metric("Total Spent", view['total_spent'])
     with col3:
-        st.metric("Last Order", st.session_state.current_customer.last_purchase_date.strftime('%Y-%m-%d'))
+        st.metric("Last Order", view['last_purchase'])
 
     # Recent Orders
     st.markdown("""---""")
     st.subheader("Recent Orders")
-    for order in st.session_state.current_customer.orders:
-        with st.expander(f"Order {order.order_id}", expanded=True):
-            # Order status badge
-            status_color = {
-                OrderStatus.SHIPPED: "#28a745",
-                OrderStatus.PENDING: "#ffc107",
-                OrderStatus.PROCESSING: "#17a2b8",
-                OrderStatus.DELIVERED: "#28a745",
-                OrderStatus.CANCELLED: "#dc3545"
-            }.get(order.status, "#6c757d")
-            
-            st.markdown(f"""
-                <div style='display: flex; justify-content: space-between; align-items: center;'>
-                    <span>Order {order.order_id}</span>
-                    <span style='background-color: {status_color}; color: white; padding: 2px 8px; border-radius: 10px;'>
-                        {order.status.value.upper()}
-                    </span>
-                </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown(f"""
-                **Date:** {order.order_date.strftime('%Y-%m-%d')}  
-                **Total:** ${order.total_amount:.2f}
-                
-                **Items:**
-            """)
-            for item in order.items:
-                st.markdown(f"• {item.name} (x{item.quantity})")
-
-            if order.tracking_number and order.order_id in shipping_info_db:
-                st.markdown("**Tracking Information**")
-                tracking_info = shipping_info_db.get(order.order_id, {})
-                if tracking_info:
-                    st.markdown(f"""
-                        **Carrier:** {tracking_info['carrier']}  
-                        **Status:** {tracking_info['status']}  
-                        **Location:** {tracking_info['current_location']}
-                    """)
-
-# Main chat area
-main_container = st.container()
-with main_container:
-    st.title("AI Customer Support System")
-    
-    # Chat messages
+    for order in view['orders']:
+        with st.expander(order['title'], expanded=True):
+            st.markdown(order['badge'], unsafe_allow_html=True)
+            st.markdown(order['details'])
+
+    cache = get_profile_cache().stats()
+    st.caption(f"Profile cache: {cache['hit_rate']:.0%} hits · {cache['entries']} profiles · "
+               f"{cache['bytes'] / 1024:.0f} KiB")
+    prewarm = st.session_state.get("prewarm")
+    if prewarm is not None and prewarm.done.is_set() and prewarm.error is None:
+        prefill = (f"prompt prefilled ({prewarm.prefill_usage['input_tokens']} tokens)"
+                   if prewarm.prefilled else "no prefill")
+        st.caption(f"Session prewarm: {prewarm.prefetched} lookups cached · {prefill} · "
+                   f"{prewarm.timings['total'] * 1000:.0f} ms")
+
+
+def render_message_details(metadata: dict):
+    with st.expander("Response Details"):
+        cols = st.columns(3)
+        with cols[0]:
+            st.markdown(f"**Sentiment:** {metadata['sentiment']}")
+        with cols[1]:
+            st.markdown(f"**Confidence:** {metadata['confidence_score']:.2%}")
+        with cols[2]:
+            st.markdown(f"**Type:** {metadata['response_type']}")
+        usage = metadata.get('usage')
+        if usage:
+            st.caption(
+                f"Prompt tokens: {usage['input_tokens']} "
+                f"(cached: {usage['cached_tokens']}, {usage['cached_ratio']:.0%}) · "
+                f"Output tokens: {usage['output_tokens']}"
+            )
+        if metadata.get('model_tier'):
+            tier_note = f"Answered by: {metadata['model_tier']} model"
+            if metadata.get('escalation_reason'):
+                tier_note += f" (escalated: {metadata['escalation_reason']})"
+            st.caption(tier_note)
+        cache_stats = metadata.get('tool_cache')
+        if cache_stats and (cache_stats['hits'] or cache_stats['misses']):
+            st.caption(
+                f"Tool cache: {cache_stats['hits']} hits / "
+                f"{cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%})"
+            )
+        if metadata.get('trace_id'):
+            st.caption(f"Trace: `{metadata['trace_id']}`")
+
+
+def show_older_messages():
+    st.session_state.chat_window += CHAT_WINDOW
+
+
+def clear_chat():
+    # A reply still running belongs to the conversation being dropped
+    stop_generation()
+    st.session_state.pending_reply = None
+    st.session_state.chat_history = []
+    st.session_state.chat_window = CHAT_WINDOW
+    st.session_state.tool_cache.clear()
+
+
+class PendingReply:
+    """A reply being generated in the background for this session."""
+
+    def __init__(self, user_input: str, customer: CustomerDetails, tool_cache: ToolResultCache):
+        self.user_input = user_input
+        self.customer = customer
+        self.tool_cache = tool_cache
+        self.asked_at = datetime.utcnow()
+        self.token = CancelToken(request_deadline)
+        self.done = threading.Event()
+        self.response = None
+        self.trace_id = None
+        self.flight_id = None
+        self.shared = False
+        self.error: Optional[Exception] = None
+        # Prewarm state when a session's first question was asked (None for later ones)
+        self.first_reply_prewarm: Optional[str] = None
+
+
+def generate_reply(pending: PendingReply):
+    """Worker thread: run the agent pipeline for ``pending``. No Streamlit calls here."""
+    customer = pending.customer
+    run = get_cascade().run_sync if cascade_enabled else functools.partial(run_sync, agent.run)
+
+    def traced_run(**kwargs):
+        with tracing.span("agent.run", customer_id=customer.customer_id,
+                          tier=customer.tier.value, cascade=cascade_enabled) as span:
+            result = run(**kwargs)
+            span.set_attribute("model_tier", getattr(result, "tier", None))
+            return result, span.trace_id
+
+    def scheduled_run(**kwargs):
+        if scheduler_enabled:
+            # Queue behind other sessions by customer tier
+            return get_scheduler(model_backend).run(customer.tier.value, traced_run, **kwargs)
+        return traced_run(**kwargs)
+
+    try:
+        # The whole run reads one knowledge base version, even if it is swapped meanwhile
+        with cancellation_scope(pending.token), conversation_cache(pending.tool_cache), \
+                kb_store.pinned() as kb_snapshot, memory_profile.request("reply"):
+            if single_flight_enabled:
+                # Identical in-flight questions for this customer share one run
+                key = coalesce_key(customer.customer_id, pending.user_input,
+                                   f"{customer_context(customer)}|kb:{kb_snapshot.version}")
+                (pending.response, pending.trace_id), flight, pending.shared = get_single_flight().do(
+                    key, scheduled_run,
+                    user_prompt=pending.user_input,
+                    deps=customer
+                )
+                pending.flight_id = flight.id
+            else:
+                pending.response, pending.trace_id = scheduled_run(
+                    user_prompt=pending.user_input,
+                    deps=customer
+                )
+    except Exception as e:
+        pending.error = e
+    finally:
+        if pending.first_reply_prewarm is not None and pending.error is None:
+            record_first_reply(pending.first_reply_prewarm,
+                               (datetime.utcnow() - pending.asked_at).total_seconds())
+        pending.done.set()
+
+
+def send_message():
+    """Start a reply for the current input; invoked as a button callback before the rerun."""
+    user_input = st.session_state.user_input
+    st.session_state.chat_error = None
+    if not user_input:
+        return
+
+    previous = st.session_state.get("pending_reply")
+    if previous is not None:
+        if previous.user_input == user_input:
+            # Double-click: the same question is already being answered
+            return
+        # A new question supersedes the one still being answered
+        previous.token.cancel("superseded")
+        st.session_state.pending_reply = None
+
+    first_question = not any(m["role"] == "assistant" for m in st.session_state.chat_history)
+
+    # Add user message to history
+    st.session_state.chat_history.append({
+        "role": "user",
+        "content": user_input
+    })
+
+    customer = st.session_state.current_customer
+    if not model_ready():
+        # The local model is still starting: answer from order/policy data
+        response = fast_path.answer(user_input, customer)
+        append_response(user_input, customer, response, None, datetime.utcnow())
+        return
+
+    pending = PendingReply(user_input, customer, st.session_state.tool_cache)
+    if first_question:
+        prewarm = st.session_state.get("prewarm")
+        pending.first_reply_prewarm = "off" if prewarm is None else prewarm.state
+    st.session_state.pending_reply = pending
+    threading.Thread(target=generate_reply, args=(pending,), name="agent-reply", daemon=True).start()
+
+
+def stop_generation():
+    pending = st.session_state.get("pending_reply")
+    if pending is not None:
+        pending.token.cancel("stopped")
+
+
+def drop_user_turn(user_input: str):
+    """Remove the question of a reply that will not be shown, if it is still the last turn."""
+    history = st.session_state.chat_history
+    if history and history[-1]["role"] == "user" and history[-1]["content"] == user_input:
+        history.pop()
+
+
+def finish_reply(pending: PendingReply):
+    """Move a finished background reply into the chat history."""
+    st.session_state.pending_reply = None
+    error = pending.error
+    if isinstance(error, RunTimedOut):
+        st.session_state.chat_error = ("warning", "⏱️ The reply took too long and was stopped. Please try again.")
+    elif isinstance(error, RunCancelled):
+        st.session_state.chat_error = ("warning", "⏹️ Reply stopped.")
+    elif isinstance(error, SchedulerRejected):
+        drop_user_turn(pending.user_input)
+        st.session_state.chat_error = ("warning", f"⏳ High demand right now ({error}). Please retry in ~{error.retry_after:.0f}s.")
+    elif error is not None:
+        st.session_state.chat_error = ("error", f"Error: {str(error)}")
+    elif pending.shared and st.session_state.get("last_flight_id") == pending.flight_id:
+        # Same session sent it twice: the reply is already shown
+        drop_user_turn(pending.user_input)
+    else:
+        st.session_state.last_flight_id = pending.flight_id
+        append_response(pending.user_input, pending.customer, pending.response, pending.trace_id,
+                        pending.asked_at, side_effects=not pending.shared)
+
+
+def reply_progress():
+    """Polled while a reply is being generated: Stop control, then the finished reply."""
+    pending = st.session_state.get("pending_reply")
+    if pending is None:
+        return
+    if pending.done.is_set():
+        finish_reply(pending)
+        st.rerun()
+    col1, col2 = st.columns([7, 2])
+    with col1:
+        st.caption("✍️ Support AI is typing…")
+    with col2:
+        st.button("⏹ Stop", use_container_width=True, on_click=stop_generation)
+
+
+def append_response(user_input: str, customer: CustomerDetails, response, trace_id, asked_at: datetime,
+                    side_effects: bool = True):
+    # Add AI response to history
+    st.session_state.chat_history.append({
+        "role": "assistant",
+        "content": response.output.response,
+        "metadata": {
+            "sentiment": response.output.sentiment,
+            "needs_escalation": response.output.needs_escalation,
+            "follow_up_required": response.output.follow_up_required,
+            "response_type": response.output.response_type.value,
+            "confidence_score": response.output.confidence_score,
+            "suggested_actions": response.output.suggested_actions,
+            "usage": record_prompt_usage(response),
+            "tool_cache": st.session_state.tool_cache.stats(),
+            "model_tier": getattr(response, "tier", None),
+            "escalation_reason": getattr(response, "escalation_reason", None),
+            "trace_id": trace_id
+        }
+    })
+
+    # Feed the analytics dashboard
+    output = response.output
+    resolved = not (output.needs_escalation or output.follow_up_required)
+    get_interaction_store().append(CustomerInteraction(
+        interaction_id=uuid.uuid4().hex,
+        timestamp=asked_at,
+        channel="chat",
+        query_type=output.response_type,
+        resolved=resolved,
+        escalated=output.needs_escalation,
+        resolution_time=datetime.utcnow() if resolved else None,
+    ), customer.tier)
+
+    # Escalations, follow-ups and auto actions run in background workers;
+    # a reply shared with a coalesced request already enqueued them
+    if not side_effects:
+        return
+    try:
+        enqueue_response_side_effects(
+            get_work_queue(), customer.customer_id, user_input, response.output)
+    except Exception as e:
+        print(f"⚠️  No se pudieron encolar las acciones de seguimiento: {e}")
+
+
+@st.fragment
+def chat_panel():
+    """Chat log and input; sending a message re-runs only this fragment."""
+    history = st.session_state.chat_history
+    window = st.session_state.chat_window
+
+    # Chat messages: only the most recent window is rendered
     chat_container = st.container()
     with chat_container:
-        for message in st.session_state.chat_history:
-            if message["role"] == "user":
-                st.markdown(f"""
-                    <div class="user-message">
-                        <strong>You:</strong><br>{message['content']}
-                    </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                    <div class="assistant-message">
-                        <strong>Support AI:</strong><br>{message['content']}
-                    </div>
-                """, unsafe_allow_html=True)
-                if "metadata" in message:
-                    with st.expander("Response Details"):
-                        cols = st.columns(3)
-                        with cols[0]:
-                            st.markdown(f"**Sentiment:** {message['metadata']['sentiment']}")
-                        with cols[1]:
-                            st.markdown(f"**Confidence:** {message['metadata']['confidence_score']:.2%}")
-                        with cols[2]:
-                            st.markdown(f"**Type:** {message['metadata']['response_type']}")
+        hidden = len(history) - window if window and len(history) > window else 0
+        if hidden:
+            st.button(f"Show older messages ({hidden} hidden)", key="show_older",
+                      on_click=show_older_messages)
+        for message in history[hidden:]:
+            if "html" not in message:
+                message["html"] = message_html(message["role"], message["content"])
+            st.markdown(message["html"], unsafe_allow_html=True)
+            if message["role"] != "user" and "metadata" in message:
+                render_message_details(message["metadata"])
 
     # Input area
     st.markdown("""---""")
+    if scheduler_enabled:
+        pressure = get_scheduler(model_backend).pressure()
+        if pressure["level"] != "ok":
+            st.caption(f"⏳ Support AI is {pressure['level']}: "
+                       f"{sum(pressure['queue_depth'].values())} request(s) waiting")
     input_container = st.container()
     with input_container:
         col1, col2, col3 = st.columns([6, 2, 1])
         with col1:
-            user_input = st.text_input("Type your message...", key="user_input", placeholder="Ask about orders, shipping, returns, or any other support...")
+            st.text_input("Type your message...", key="user_input", placeholder="Ask about orders, shipping, returns, or any other support...")
         with col2:
-            send_pressed = st.button("Send Message", use_container_width=True)
+            st.button("Send Message", use_container_width=True, on_click=send_message)
         with col3:
-            clear_pressed = st.button("Clear", use_container_width=True)
+            st.button("Clear", use_container_width=True, on_click=clear_chat)
 
-        if clear_pressed:
-            st.session_state.chat_history = []
-            st.rerun()
+        chat_error = st.session_state.get("chat_error")
+        if chat_error:
+            level, text = chat_error
+            (st.warning if level == "warning" else st.error)(text)
 
-        if send_pressed and user_input:
-            # Add user message to history
-            st.session_state.chat_history.append({
-                "role": "user",
-                "content": user_input
-            })
-            
-            try:
-                # Get AI response
-                response = agent.run_sync(
-                    user_prompt=user_input,
-                    deps=st.session_state.current_customer
-                )
-                
-                # Add AI response to history
-                st.session_state.chat_history.append({
-                    "role": "assistant",
-                    "content": response.output.response,
-                    "metadata": {
-                        "sentiment": response.output.sentiment,
-                        "needs_escalation": response.output.needs_escalation,
-                        "follow_up_required": response.output.follow_up_required,
-                        "response_type": response.output.response_type.value,
-                        "confidence_score": response.output.confidence_score,
-                        "suggested_actions": response.output.suggested_actions
-                    }
-                })
-                st.rerun()
-                
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
-
-# Knowledge base in collapsed sections at the bottom
-st.markdown("""---""")
-kb_container = st.container()
-with kb_container:
+    if st.session_state.get("pending_reply") is not None and not st.session_state.get("reply_polling"):
+        # A reply started from this fragment: rerun the page to start polling for it
+        st.rerun()
+
+
+STARTUP_MESSAGES = {
+    "pending": "Preparing the local model…",
+    "installing": "Installing Ollama…",
+    "starting": "Starting the Ollama server…",
+    "pulling": "Downloading the model",
+    "warming": "Loading the model into memory…",
+}
+
+
+def startup_banner():
+    """Local model readiness; polled as a fragment until the model is ready."""
+    status = get_orchestrator().snapshot()
+    if status["state"] == "ready":
+        st.success("✅ Support AI is ready.")
+    elif status["state"] == "degraded":
+        st.warning(f"⚠️ The AI model is unavailable ({status['reason']}). "
+                   "Answering order and policy questions only.")
+    else:
+        message = STARTUP_MESSAGES.get(status["state"], status["state"])
+        if status["pull_progress"] is not None and status["state"] == "pulling":
+            message += f" ({status['pull_progress']:.0%})"
+        st.info(f"⏳ {message} Quick answers are available in the meantime.")
+
+
+@st.fragment
+def knowledge_base_panels():
+    """Knowledge base in collapsed sections at the bottom."""
+    snapshot = kb_store.current()
+    view = build_kb_view(json.dumps(snapshot.as_dict(), sort_keys=True))
     col1, col2, col3 = st.columns(3)
     
     with col1:
         with st.expander("📦 Shipping Policies"):
-            for method, duration in knowledge_base["shipping_policies"].items():
-                st.markdown(f"**{method.title()}**  \n{duration}")
+            st.markdown(view["shipping_policies"])
     
     with col2:
         with st.expander("↩️ Return Policies"):
-            for tier, policy in knowledge_base["return_policies"].items():
-                st.markdown(f"**{tier.title()}**  \n{policy}")
+            st.markdown(view["return_policies"])
     
     with col3:
         with st.expander("⚡ Warranty Information"):
-            for category, info in knowledge_base["warranty_info"].items():
-                st.markdown(f"**{category.title()}**  \n{info}")
+            st.markdown(view["warranty_info"])
+    st.caption(f"Knowledge base v{snapshot.version}")
+
+
+ANALYTICS_PERIODS = {"Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90, "All time": None}
+
+
+def load_demo_data():
+    load_demo_interactions(get_interaction_store(), 100_000, seed=len(get_interaction_store()))
+
+
+def format_duration(seconds: float) -> str:
+    if seconds != seconds:  # NaN
+        return "-"
+    return f"{seconds / 60:.0f} min" if seconds < 7200 else f"{seconds / 3600:.1f} h"
+
+
+def support_page():
+    # Sidebar - Customer Information
+    with st.sidebar:
+        customer_sidebar()
+
+    # Main chat area
+    main_container = st.container()
+    with main_container:
+        st.title("AI Customer Support System")
+        if not model_ready():
+            st.fragment(startup_banner, run_every=2)()
+        st.session_state.reply_polling = st.session_state.get("pending_reply") is not None
+        chat_panel()
+        if st.session_state.reply_polling:
+            st.fragment(reply_progress, run_every=0.5)()
+
+    st.markdown("""---""")
+    kb_container = st.container()
+    with kb_container:
+        knowledge_base_panels()
+
+
+def analytics_page():
+    """Support KPIs aggregated from the columnar interaction store."""
+    st.title("Support Analytics")
+    store = get_interaction_store()
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        period = st.selectbox("Period", list(ANALYTICS_PERIODS))
+    with col2:
+        st.button("Load demo data", use_container_width=True, on_click=load_demo_data,
+                  help="Add 100,000 synthetic interactions")
+    if not len(store):
+        st.info("No interactions recorded yet. Chat with the assistant or load demo data.")
+        return
+
+    days = ANALYTICS_PERIODS[period]
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    summary = store.summary(since)
+    ttr = summary["ttr_percentiles"]
+    cols = st.columns(5)
+    cols[0].metric("Interactions", f"{summary['interactions']:,}")
+    cols[1].metric("Resolution rate", f"{summary['resolution_rate']:.1%}")
+    cols[2].metric("Escalation rate", f"{summary['escalation_rate']:.1%}")
+    cols[3].metric("CSAT", "-" if summary["csat"] != summary["csat"] else f"{summary['csat']:.2f} / 5")
+    cols[4].metric("Time to resolution (p50)", format_duration(ttr[50]))
+    st.caption(f"Time to resolution: p90 {format_duration(ttr[90])} · p99 {format_duration(ttr[99])}")
+
+    for tab, dimension in zip(st.tabs(["By category", "By tier", "By channel"]),
+                              ("category", "tier", "channel")):
+        with tab:
+            csat = store.csat_by(dimension, since)
+            escalation = store.escalation_rate_by(dimension, since)
+            left, right = st.columns(2)
+            with left:
+                st.subheader("CSAT")
+                if csat:
+                    st.bar_chart({"CSAT": {k: v["mean"] for k, v in csat.items()}})
+                else:
+                    st.caption("No ratings in this period.")
+            with right:
+                st.subheader("Escalation rate")
+                st.bar_chart({"Escalation rate": {k: v["rate"] for k, v in escalation.items()}})
+            st.dataframe(
+                [{dimension: k, "interactions": v["count"], "escalation_rate": round(v["rate"], 3),
+                  "csat": round(csat[k]["mean"], 2) if k in csat else None,
+                  "ratings": csat[k]["count"] if k in csat else 0}
+                 for k, v in escalation.items()],
+                use_container_width=True, hide_index=True)
+
+
+page = st.navigation([
+    st.Page(support_page, title="Support", icon="💬", default=True),
+    st.Page(analytics_page, title="Analytics", icon="📊", url_path="analytics"),
+])
+page.run()
 
 if __name__ == "__main__":
-    st.info("Customer Support System is ready to assist!")
\ No newline at end of file
+    st.info("Customer Support System is ready to assist!")
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Benchmark reproducible del pipeline del agente.
+
+Ejecuta un conjunto fijo de consultas sobre un cliente de demostración y
+desglosa el tiempo por etapa (contexto, modelo, herramientas y el resto del
+pipeline: validación y grafo del agente) a partir de las trazas.
+
+Para medir solo el overhead propio, primero se graba un cassette con el
+modelo real y luego se reproduce sin red:
+
+    MODEL_CASSETTE_MODE=record python bench_agent.py --runs 1
+    MODEL_CASSETTE_MODE=replay python bench_agent.py --runs 20
+
+Con ``--schema both`` repite el conjunto con el esquema de salida completo y
+con el reducido (RESPONSE_SCHEMA=lean) y compara los tokens generados.
+
+Con ``--order-tools`` ejecuta además consultas sobre varios pedidos con la
+herramienta en bloque (get_orders_status) y sin ella (una llamada a
+get_order_and_shipping_status por pedido) y compara los turnos del modelo.
+
+Con ``--prewarm`` mide la latencia de la primera respuesta de una sesión nueva
+sin precalentamiento y tras el precalentamiento de sesión (precarga de pedidos
+y prefill del prompt, ver prewarm.py). Cada sesión usa un cliente distinto para
+que la caché de prefijo del proveedor no se comparta entre ellas; el prefill
+solo se envía a un modelo real (no en modo cassette).
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Las trazas alimentan el desglose por etapa
+TRACE_FILE = os.path.join(tempfile.mkdtemp(prefix="bench-agent-"), "traces.jsonl")
+os.environ["TRACING_ENABLED"] = "true"
+os.environ["TRACE_FILE"] = TRACE_FILE
+
+import prewarm
+import support_system
+import tracing
+from support_system import (
+    CustomerDetails,
+    CustomerTier,
+    Item,
+    Order,
+    OrderStatus,
+    agent,
+    response_output_type,
+)
+from tool_cache import ToolResultCache, conversation_cache
+
+PROMPTS = [
+    "What's the status of my last order?",
+    "Where is order 12345?",
+    "Can you check order #67890 and tell me when it arrives?",
+    "What is your return policy for premium customers?",
+    "I was charged twice for my headphones, what can I do?",
+]
+
+MULTI_ORDER_PROMPTS = [
+    "Where are all my orders?",
+    "Which of my orders have shipped and when will they arrive?",
+    "Check orders 12345 and 67890 for me.",
+]
+
+
+def demo_customer(order_count: int = 3, session: int = 0) -> CustomerDetails:
+    """Cliente de demostración con varios pedidos."""
+    now = datetime(2024, 12, 1)
+    orders = []
+    for i in range(order_count):
+        order_id = ["#12345", "#67890"][i] if i < 2 else f"#{20000 + i}"
+        orders.append(Order(
+            order_id=order_id,
+            status=[OrderStatus.SHIPPED, OrderStatus.DELIVERED, OrderStatus.PROCESSING][i % 3],
+            items=[Item(item_id=f"ITEM{i:03d}", name=f"Product {i}", quantity=1 + i % 2,
+                        price=49.99 + i, sku=f"SKU{i:03d}", category="Electronics")],
+            total_amount=49.99 + i,
+            order_date=now - timedelta(days=i * 3),
+            tracking_number=f"TRK{i:09d}",
+        ))
+    return CustomerDetails(
+        customer_id=f"BENCH{session + 1:03d}",
+        name="Bench Customer" if session == 0 else f"Bench Customer {session}",
+        email="bench@example.com",
+        tier=CustomerTier.PREMIUM,
+        total_orders=order_count,
+        total_spent=sum(o.total_amount for o in orders),
+        orders=orders,
+    )
+
+
+def run_prompt(prompt: str, customer: CustomerDetails, schema: str = "full") -> dict:
+    start = time.perf_counter()
+    with tracing.span("agent.run", schema=schema):
+        result = agent.run_sync(prompt, deps=customer, output_type=response_output_type(schema))
+    elapsed = time.perf_counter() - start
+    usage = result.usage()
+    return {
+        "elapsed": elapsed,
+        "requests": usage.requests,
+        "tool_calls": usage.tool_calls,
+        "input_tokens": usage.input_tokens,
+        "output_tokens": usage.output_tokens,
+        "cached_tokens": usage.cache_read_tokens or 0,
+    }
+
+
+def compare_order_tools(customer: CustomerDetails, runs: int) -> dict:
+    """Model turns and latency of multi-order questions with and without the bulk tool."""
+    results = {}
+    for mode, enabled in (("per-order", False), ("bulk", True)):
+        support_system.bulk_order_tool = enabled
+        results[mode] = [run_prompt(prompt, customer)
+                         for _ in range(runs) for prompt in MULTI_ORDER_PROMPTS]
+    support_system.bulk_order_tool = True
+    return results
+
+
+def compare_prewarm(order_count: int, runs: int) -> dict:
+    """First-reply latency of fresh sessions, cold and after the session prewarm."""
+    results = {"cold": [], "prewarmed": []}
+    prewarm_seconds = []
+    session = 0
+    for _ in range(runs):
+        for prompt in PROMPTS:
+            for mode in results:
+                session += 1
+                customer = demo_customer(order_count, session)
+                cache = ToolResultCache()
+                if mode == "prewarmed":
+                    handle = prewarm.prewarm_session(customer, cache)
+                    prewarm_seconds.append(handle.timings["total"])
+                with conversation_cache(cache):
+                    results[mode].append(run_prompt(prompt, customer))
+    results["prewarm_seconds"] = prewarm_seconds
+    return results
+
+
+def stage_breakdown() -> dict:
+    """Total milliseconds per stage, from the recorded spans."""
+    tracing.flush()
+    totals = defaultdict(float)
+    with open(TRACE_FILE, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    # The session prewarm runs outside the measured replies
+    prewarm_traces = {span["trace_id"] for span in spans if span["name"] == "session.prewarm"}
+    for span in spans:
+        if span["trace_id"] in prewarm_traces:
+            continue
+        name = span["name"]
+        stage = "tools" if name.startswith("tool.") else name
+        totals[stage] += span["duration_ms"]
+    other = totals.get("agent.run", 0.0) - sum(
+        totals.get(k, 0.0) for k in ("add_customer_context", "model.request", "tools"))
+    return {
+        "context": totals.get("add_customer_context", 0.0),
+        "model": totals.get("model.request", 0.0),
+        "tools": totals.get("tools", 0.0),
+        "pipeline (validation, graph)": other,
+        "total": totals.get("agent.run", 0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reproducible del pipeline del agente")
+    parser.add_argument("--runs", type=int, default=5, help="repeticiones del conjunto de consultas")
+    parser.add_argument("--orders", type=int, default=3, help="pedidos del cliente de demostración")
+    parser.add_argument("--schema", choices=["full", "lean", "both"], default="full",
+                        help="esquema de salida del modelo")
+    parser.add_argument("--order-tools", action="store_true",
+                        help="comparar la herramienta de pedidos en bloque con la de un pedido")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="comparar la primera respuesta con y sin precalentamiento de sesión")
+    args = parser.parse_args()
+
+    customer = demo_customer(args.orders)
+    schemas = ["full", "lean"] if args.schema == "both" else [args.schema]
+    by_schema = {schema: [] for schema in schemas}
+    for _ in range(args.runs):
+        for prompt in PROMPTS:
+            for schema in schemas:
+                by_schema[schema].append(run_prompt(prompt, customer, schema))
+    samples = [s for schema in schemas for s in by_schema[schema]]
+
+    latencies = sorted(s["elapsed"] * 1000 for s in samples)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"Consultas: {len(samples)} (modo cassette: {os.getenv('MODEL_CASSETTE_MODE', 'off')})")
+    print(f"Latencia p50: {statistics.median(latencies):.1f} ms  p95: {p95:.1f} ms")
+    for key in ("requests", "tool_calls", "input_tokens", "output_tokens"):
+        print(f"{key:>14}: {statistics.mean(s[key] for s in samples):.1f} por consulta")
+    if len(schemas) > 1:
+        print("Esquema de salida:")
+        for schema, runs in by_schema.items():
+            print(f"  {schema:<5} output_tokens {statistics.mean(s['output_tokens'] for s in runs):>7.1f}"
+                  f"  latencia p50 {statistics.median(s['elapsed'] for s in runs) * 1000:>8.1f} ms")
+    if args.order_tools:
+        print("Consultas sobre varios pedidos:")
+        for mode, runs in compare_order_tools(customer, args.runs).items():
+            print(f"  {mode:<9} turnos del modelo {statistics.mean(s['requests'] for s in runs):>5.2f}"
+                  f"  tool_calls {statistics.mean(s['tool_calls'] for s in runs):>5.2f}"
+                  f"  latencia p50 {statistics.median(s['elapsed'] for s in runs) * 1000:>8.1f} ms")
+    if args.prewarm:
+        comparison = compare_prewarm(args.orders, args.runs)
+        print(f"Primera respuesta de la sesión (prefill: "
+              f"{'sí' if prewarm.session_prefill and prewarm.prefill_available() else 'no'}):")
+        for mode in ("cold", "prewarmed"):
+            runs = comparison[mode]
+            print(f"  {mode:<9} latencia p50 {statistics.median(s['elapsed'] for s in runs) * 1000:>8.1f} ms"
+                  f"  media {statistics.mean(s['elapsed'] for s in runs) * 1000:>8.1f} ms"
+                  f"  cached/input {statistics.mean(s['cached_tokens'] for s in runs):>6.0f}"
+                  f"/{statistics.mean(s['input_tokens'] for s in runs):.0f}")
+        print(f"  precalentamiento p50 {statistics.median(comparison['prewarm_seconds']) * 1000:.1f} ms"
+              f" (fuera de la latencia de la respuesta)")
+    print("Desglose por etapa (ms totales):")
+    for stage, ms in stage_breakdown().items():
+        print(f"  {stage:<30} {ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark del tiempo de rerun de app.py según la longitud del historial de chat.
+
+Compara el registro de chat por ventanas (CHAT_WINDOW) con el renderizado
+completo (CHAT_WINDOW=0). No llama al modelo: el historial se genera
+sintéticamente y solo se mide el renderizado de Streamlit.
+
+Uso:
+    python bench_app_rerun.py [--lengths 0,50,200,1000] [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import time
+
+# Sin proveedor configurado se usa un endpoint ficticio: el benchmark nunca
+# llama al modelo y así no arranca Ollama al importar support_system.
+if not os.getenv('LLM_TOKEN'):
+    os.environ.update({
+        "LLM_TOKEN": "benchmark",
+        "LLM_ENDPOINT": "http://localhost:9/v1",
+        "LLM_MODEL": "benchmark",
+    })
+
+from streamlit.testing.v1 import AppTest
+
+
+def make_history(length: int) -> list:
+    history = []
+    for i in range(length):
+        if i % 2 == 0:
+            history.append({"role": "user", "content": f"Where is my order #{10000 + i}?"})
+        else:
+            history.append({
+                "role": "assistant",
+                "content": "Your order shipped yesterday and should arrive within 2-3 business days. " * 3,
+                "metadata": {
+                    "sentiment": "neutral",
+                    "needs_escalation": False,
+                    "follow_up_required": False,
+                    "response_type": "shipping",
+                    "confidence_score": 0.9,
+                    "suggested_actions": [],
+                },
+            })
+    return history
+
+
+def time_reruns(length: int, window: int, runs: int) -> float:
+    """Median seconds of a full app rerun with ``length`` messages in history."""
+    os.environ["CHAT_WINDOW"] = str(window)
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    at = AppTest.from_file(app_path, default_timeout=120)
+    at.session_state["chat_history"] = make_history(length)
+    at.session_state["chat_window"] = window
+    at.run()  # Primer run: imports y cachés en frío
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        at.run()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", default="0,50,200,1000")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--window", type=int, default=20)
+    args = parser.parse_args()
+
+    lengths = [int(n) for n in args.lengths.split(",")]
+    print(f"{'mensajes':>10} {'completo (ms)':>15} {f'ventana={args.window} (ms)':>18}")
+    for length in lengths:
+        full = time_reruns(length, 0, args.runs)
+        windowed = time_reruns(length, args.window, args.runs)
+        print(f"{length:>10} {full * 1000:>15.1f} {windowed * 1000:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
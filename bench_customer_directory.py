@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Benchmark del directorio de clientes.
+
+Carga N clientes sintéticos y mide la latencia de las búsquedas exactas
+(id, email, teléfono) y por prefijo (autocompletado) que usa la barra
+lateral:
+
+    python bench_customer_directory.py --customers 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from customer_directory import CustomerDirectory, demo_profile, demo_summaries
+
+
+def measure(fn, queries) -> dict:
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p99": timings[max(0, int(len(timings) * 0.99) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del directorio de clientes")
+    parser.add_argument("--customers", type=int, default=1_000_000, help="clientes en el directorio")
+    parser.add_argument("--queries", type=int, default=10_000, help="búsquedas por tipo")
+    args = parser.parse_args()
+
+    directory = CustomerDirectory(loader=demo_profile)
+    start = time.perf_counter()
+    directory.extend(demo_summaries(args.customers))
+    print(f"Carga de {len(directory):,} clientes: {time.perf_counter() - start:.1f} s")
+
+    rng = random.Random(1)
+    sample = [directory.lookup("customer_id", f"CUST{rng.randint(2, args.customers + 1):07d}")
+              for _ in range(args.queries)]
+    cases = {
+        "exacta por id": (lambda q: directory.lookup("customer_id", q), [s.customer_id for s in sample]),
+        "exacta por email": (lambda q: directory.lookup("email", q), [s.email for s in sample]),
+        "exacta por teléfono": (lambda q: directory.lookup("phone", q), [s.phone for s in sample]),
+        "prefijo de email": (directory.search, [s.email[:rng.randint(3, 12)] for s in sample]),
+        "prefijo de teléfono": (directory.search, [s.phone[:rng.randint(4, 9)] for s in sample]),
+        "prefijo de id": (directory.search, [s.customer_id[:rng.randint(6, 10)].lower() for s in sample]),
+        "perfil completo": (directory.get_profile, [s.customer_id for s in sample[:1000]]),
+    }
+    print(f"{'búsqueda':<22} {'p50 (µs)':>10} {'p99 (µs)':>10}")
+    for name, (fn, queries) in cases.items():
+        result = measure(fn, queries)
+        print(f"{name:<22} {result['p50']:>10.1f} {result['p99']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
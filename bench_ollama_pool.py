@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark del throughput agregado (tokens/s) según el número de instancias de Ollama.
+
+Para cada tamaño de pool arranca N servidores ``ollama serve`` en puertos
+consecutivos (cada uno fijado a su grupo de CPUs), precalienta el modelo en
+todos y lanza consultas concurrentes repartidas entre las instancias. Los
+tokens generados salen de ``eval_count`` de cada respuesta.
+
+Uso:
+    python bench_ollama_pool.py [--instances 1,2,4] [--concurrency 8] [--requests 32]
+"""
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from ollama_manager import OllamaManager, OllamaPool
+
+PROMPT = "Summarize the return policy for a premium customer in two sentences."
+
+
+def generate(base_url: str, model: str, num_predict: int) -> int:
+    response = requests.post(
+        f"{base_url}/api/generate",
+        json={"model": model, "prompt": PROMPT, "stream": False,
+              "options": {"num_predict": num_predict, "temperature": 0}},
+        timeout=600,
+    )
+    response.raise_for_status()
+    return response.json().get("eval_count", 0)
+
+
+def run_pool(size: int, args) -> dict:
+    base = OllamaManager(f"http://127.0.0.1:{args.base_port}")
+    pool = OllamaPool(base, size, pin_cpus=not args.no_pin)
+    try:
+        if not pool.start() or not base.pull_model(args.model):
+            raise RuntimeError(f"no se pudo preparar el pool de {size} instancias")
+        # Precalentar: la carga del modelo no cuenta en la medición
+        with ThreadPoolExecutor(max_workers=size) as executor:
+            list(executor.map(lambda url: generate(url, args.model, 1), pool.urls))
+
+        targets = itertools.cycle(pool.urls)
+        jobs = [next(targets) for _ in range(args.requests)]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            tokens = sum(executor.map(lambda url: generate(url, args.model, args.num_predict), jobs))
+        elapsed = time.perf_counter() - start
+        return {"tokens": tokens, "elapsed": elapsed}
+    finally:
+        pool.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--instances", default="1,2,4")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--num-predict", type=int, default=64)
+    parser.add_argument("--model", default=os.getenv('OLLAMA_MODEL', 'qwen2.5:0.5b'))
+    # Puerto distinto del 11434 para no reutilizar un servidor ya en marcha
+    parser.add_argument("--base-port", type=int, default=11500)
+    parser.add_argument("--no-pin", action="store_true", help="no fijar CPUs por instancia")
+    args = parser.parse_args()
+
+    print(f"CPUs disponibles: {os.cpu_count()}  modelo: {args.model}  concurrencia: {args.concurrency}")
+    print(f"{'instancias':>10} {'tokens':>8} {'tiempo (s)':>11} {'tokens/s':>10}")
+    for size in [int(n) for n in args.instances.split(",")]:
+        result = run_pool(size, args)
+        print(f"{size:>10} {result['tokens']:>8} {result['elapsed']:>11.2f} "
+              f"{result['tokens'] / result['elapsed']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
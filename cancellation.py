@@ -0,0 +1,151 @@
+"""Cancellation tokens and deadlines for agent runs.
+
+A ``CancelToken`` is created per user request and travels in a context
+variable (``scope``), so every layer the request passes through can see it:
+the scheduler stops queueing it, single-flight detaches it, and
+``run_sync`` cancels the asyncio task that drives ``agent.run``. Cancelling
+that task closes the in-flight HTTP request, and Ollama stops generating
+for a closed connection, so the backend slot is freed right away instead of
+when the generation would have finished.
+
+A token may carry a wall-clock deadline (``REQUEST_DEADLINE_SECONDS``); when
+it passes the token cancels itself with reason ``"timeout"``.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, List, Optional
+
+from metrics import metrics
+
+request_deadline = float(os.getenv('REQUEST_DEADLINE_SECONDS', '120'))
+
+
+class RunCancelled(Exception):
+    """The run was cancelled before it finished."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"run cancelled ({reason})")
+        self.reason = reason
+
+
+class RunTimedOut(RunCancelled):
+    """The run exceeded its deadline."""
+
+    def __init__(self):
+        super().__init__("timeout")
+
+
+class CancelToken:
+    """Thread-safe cancellation flag with an optional deadline."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def is_set(self) -> bool:
+        """True once cancelled or past the deadline."""
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("timeout")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without deadline)."""
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def error(self) -> RunCancelled:
+        return RunTimedOut() if self.reason == "timeout" else RunCancelled(self.reason or "cancelled")
+
+    def raise_if_cancelled(self):
+        if self.is_set():
+            raise self.error()
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Call ``callback`` on cancellation (immediately if already cancelled); returns a remover."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove_callback(callback)
+        callback()
+        return lambda: None
+
+    def _remove_callback(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar("cancel_token", default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current_token.get()
+
+
+@contextmanager
+def scope(token: Optional[CancelToken]):
+    """Make ``token`` the cancellation token of the enclosed block."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def _thread_loop() -> asyncio.AbstractEventLoop:
+    # Same policy as pydantic-ai's run_sync: one reusable loop per thread
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        loop = None
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop
+
+
+def run_sync(run: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+    """Run the coroutine function ``run`` (e.g. ``agent.run``) under the current token.
+
+    Raises ``RunCancelled``/``RunTimedOut`` if the token is cancelled or its
+    deadline passes; the underlying task is cancelled so its HTTP request is
+    aborted.
+    """
+    token = current_token()
+    loop = _thread_loop()
+    if token is None:
+        return loop.run_until_complete(run(*args, **kwargs))
+
+    token.raise_if_cancelled()
+    task = loop.create_task(run(*args, **kwargs))
+    remove = token.add_callback(lambda: loop.call_soon_threadsafe(task.cancel))
+    timer = None
+    if token.deadline is not None:
+        timer = loop.call_later(token.remaining(), token.cancel, "timeout")
+    try:
+        return loop.run_until_complete(task)
+    except asyncio.CancelledError:
+        if not token.is_set():
+            raise
+        metrics.inc("agent_runs_cancelled_total", 1, {"reason": token.reason})
+        raise token.error() from None
+    finally:
+        remove()
+        if timer is not None:
+            timer.cancel()
@@ -0,0 +1,207 @@
+"""Confidence-based model cascade.
+
+Every query first runs on a small, fast local Ollama model. It is re-run on
+the larger configured model only when the small model's answer is not good
+enough: its confidence is below the threshold, its output failed validation,
+or its category is one that always goes to the large tier (e.g. BILLING).
+
+Enable with ``MODEL_CASCADE=true``; see ``.env.example`` for the knobs.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from pydantic_ai.exceptions import AgentRunError, UnexpectedModelBehavior
+from pydantic_ai.usage import RunUsage
+
+from metrics import metrics
+from ollama_manager import ensure_ollama_ready
+import cancellation
+import tracing
+import replay_model
+from support_system import (
+    OLLAMA_BASE_URL,
+    agent,
+    model as configured_model,
+    ollama_chat_model,
+)
+
+cascade_enabled = os.getenv('MODEL_CASCADE', 'false').lower() == 'true'
+small_model_name = os.getenv('CASCADE_SMALL_MODEL', 'qwen2.5:0.5b')
+# Ollama model for the large tier; defaults to the configured provider model
+large_model_name = os.getenv('CASCADE_LARGE_MODEL')
+confidence_threshold = float(os.getenv('CASCADE_CONFIDENCE_THRESHOLD', '0.7'))
+escalate_categories = {
+    c.strip().lower()
+    for c in os.getenv('CASCADE_ESCALATE_CATEGORIES', 'billing').split(',')
+    if c.strip()
+}
+
+
+@dataclass
+class CascadeResult:
+    """Agent run result plus which tier answered it."""
+    result: Any
+    tier: str
+    escalation_reason: Optional[str]
+    small_latency: Optional[float]
+    large_latency: Optional[float]
+    latency_saved: float = 0.0
+    # Spent on the small tier before escalating (None when it answered)
+    small_usage: Optional[RunUsage] = None
+
+    @property
+    def output(self):
+        return self.result.output
+
+    def usage(self):
+        """Usage of both tiers when the query escalated."""
+        if self.small_usage is None:
+            return self.result.usage()
+        return self.small_usage + self.result.usage()
+
+
+class ModelCascade:
+    """Runs the agent on a small model and escalates to a large one when needed."""
+
+    def __init__(self, small_model_name: str, large_model: Any,
+                 threshold: float, categories: set):
+        self.small_model_name = small_model_name
+        self.large_model = large_model
+        self.threshold = threshold
+        self.categories = categories
+        self._small_model = None
+        self._lock = threading.Lock()
+        self.small_answers = 0
+        self.large_answers = 0
+        self.latency_saved = 0.0
+        self._large_latency_avg: Optional[float] = None
+
+    def _get_small_model(self):
+        with self._lock:
+            if self._small_model is None:
+                if (not replay_model.replaying()
+                        and not ensure_ollama_ready(self.small_model_name, OLLAMA_BASE_URL)):
+                    raise RuntimeError(
+                        f"Failed to initialize Ollama with cascade model '{self.small_model_name}'.")
+                self._small_model = tracing.traced_model(
+                    replay_model.cassette_model(ollama_chat_model(self.small_model_name)))
+            return self._small_model
+
+    def first_model(self):
+        """The model every query starts on (the one worth pre-warming)."""
+        return self._get_small_model()
+
+    def escalation_reason(self, output) -> Optional[str]:
+        """Why the small model's answer must be re-run on the large model, if at all."""
+        if output.confidence_score < self.threshold:
+            return "low_confidence"
+        if output.response_type.value in self.categories:
+            return f"category:{output.response_type.value}"
+        return None
+
+    def run_sync(self, user_prompt: str, deps: Any, **kwargs: Any) -> CascadeResult:
+        start = time.perf_counter()
+        # Collected here so a failed small run still counts
+        small_usage = RunUsage()
+        with tracing.span("cascade.small", model=self.small_model_name) as span:
+            try:
+                small_result = cancellation.run_sync(
+                    agent.run, user_prompt, deps=deps, model=self._get_small_model(),
+                    usage=small_usage, **kwargs)
+                reason = self.escalation_reason(small_result.output)
+            except UnexpectedModelBehavior:
+                small_result, reason = None, "validation_failed"
+            except AgentRunError:
+                small_result, reason = None, "small_model_error"
+            span.set_attribute("escalation_reason", reason)
+        small_latency = time.perf_counter() - start
+
+        if reason is None:
+            saved = self._record_small_answer(small_latency)
+            return CascadeResult(small_result, "small", None, small_latency, None, saved)
+
+        start = time.perf_counter()
+        with tracing.span("cascade.large", reason=reason):
+            large_result = cancellation.run_sync(
+                agent.run, user_prompt, deps=deps, model=self.large_model, **kwargs)
+        large_latency = time.perf_counter() - start
+        saved = self._record_large_answer(large_latency, reason, small_latency)
+        return CascadeResult(large_result, "large", reason, small_latency, large_latency, saved, small_usage)
+
+    def _record_small_answer(self, small_latency: float) -> float:
+        with self._lock:
+            self.small_answers += 1
+            # Savings are estimated against the running average of the large tier;
+            # nothing is claimed until the large tier has been observed at least once.
+            saved = 0.0
+            if self._large_latency_avg is not None:
+                saved = max(self._large_latency_avg - small_latency, 0.0)
+            self.latency_saved += saved
+        metrics.inc("cascade_answers_total", labels={"tier": "small"})
+        metrics.inc("cascade_latency_saved_seconds_total", saved)
+        metrics.observe("cascade_latency_seconds", small_latency, {"tier": "small"})
+        self._publish_share()
+        return saved
+
+    def _record_large_answer(self, large_latency: float, reason: str, small_latency: float = 0.0) -> float:
+        """Record an escalated answer; returns the (negative) savings: the small tier's time is lost."""
+        with self._lock:
+            self.large_answers += 1
+            if self._large_latency_avg is None:
+                self._large_latency_avg = large_latency
+            else:
+                self._large_latency_avg = 0.8 * self._large_latency_avg + 0.2 * large_latency
+            self.latency_saved -= small_latency
+        metrics.inc("cascade_answers_total", labels={"tier": "large"})
+        metrics.inc("cascade_latency_wasted_seconds_total", small_latency)
+        metrics.inc("cascade_escalations_total", labels={"reason": reason.split(":")[0]})
+        metrics.observe("cascade_latency_seconds", large_latency, {"tier": "large"})
+        self._publish_share()
+        return -small_latency
+
+    def _publish_share(self):
+        metrics.set_gauge("cascade_small_tier_share", self.stats()["small_tier_share"])
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.small_answers + self.large_answers
+            return {
+                "small_answers": self.small_answers,
+                "large_answers": self.large_answers,
+                "small_tier_share": self.small_answers / total if total else 0.0,
+                "latency_saved_seconds": self.latency_saved,
+            }
+
+
+# Instancia global de la cascada
+_cascade = None
+
+
+def get_cascade() -> ModelCascade:
+    """Obtiene o crea la cascada global configurada por variables de entorno."""
+    global _cascade
+    if _cascade is None:
+        large_model = tracing.traced_model(configured_model)
+        if large_model_name:
+            if (not replay_model.replaying()
+                    and not ensure_ollama_ready(large_model_name, OLLAMA_BASE_URL)):
+                raise RuntimeError(
+                    f"Failed to initialize Ollama with cascade model '{large_model_name}'.")
+            large_model = tracing.traced_model(
+                replay_model.cassette_model(ollama_chat_model(large_model_name)))
+        _cascade = ModelCascade(small_model_name, large_model,
+                                confidence_threshold, escalate_categories)
+    return _cascade
+
+
+def ready_first_model():
+    """The cascade's entry model if it is already initialized, else None.
+
+    Never blocks: unlike ``first_model`` it does not create the cascade or
+    start the small model.
+    """
+    cascade = _cascade
+    return cascade._small_model if cascade is not None else None
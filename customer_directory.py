@@ -0,0 +1,320 @@
+"""Customer directory: find a customer by id, email or phone among millions.
+
+The directory keeps only a compact summary per customer (id, name, email,
+phone, tier) in parallel columns; the full ``CustomerDetails`` with orders
+and history is loaded lazily by ``get_profile`` through a pluggable loader
+and the shared profile cache (``profile_cache``).
+
+Lookups never scan:
+
+* exact matches use one hash index (dict) per field, O(1);
+* type-ahead uses a sorted index per field: ``bisect`` finds the first key
+  with the prefix and matches are read in order, O(log n + k).
+
+The sorted indexes are built once by the bulk load. Customers added one at a
+time go to a small sorted side list (``insort``) that is merged into the main
+index once it reaches 1/256 of its size, so an addition does not shift a list
+of millions of keys.
+
+Emails are indexed lowercased and phones as digits only, so
+``"+1 (555) 010-"`` and ``"1555010"`` are the same prefix. Customer ids are
+matched case-insensitively against the canonical upper-case ids.
+"""
+import heapq
+import os
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+from profile_cache import get_profile_cache
+from support_system import CustomerDetails, CustomerTier, Item, Order, OrderStatus
+
+# Clientes sintéticos cargados en el directorio de demostración
+directory_demo_size = int(os.getenv('CUSTOMER_DIRECTORY_DEMO_SIZE', '100000'))
+
+FIELDS = ("customer_id", "email", "phone")
+TIERS = list(CustomerTier)
+
+
+class CustomerSummary(NamedTuple):
+    customer_id: str
+    name: str
+    email: str
+    phone: str
+    tier: CustomerTier
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def normalize_phone(phone: str) -> str:
+    return "".join(ch for ch in phone if ch.isdigit())
+
+
+def normalize_customer_id(customer_id: str) -> str:
+    return customer_id.strip().upper()
+
+
+NORMALIZERS = {"customer_id": normalize_customer_id, "email": normalize_email, "phone": normalize_phone}
+
+
+class PrefixIndex:
+    """Sorted keys with their row numbers, for prefix range queries.
+
+    Single inserts land in a sorted side list that is merged into the main
+    arrays once it holds ``MIN_MERGE`` entries or 1/``MERGE_RATIO`` of them.
+    """
+
+    MIN_MERGE = 1024
+    MERGE_RATIO = 256
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.rows = array("I")
+        self._pending: List[Tuple[str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.keys) + len(self._pending)
+
+    def rebuild(self, column: List[str]):
+        order = sorted(range(len(column)), key=column.__getitem__)
+        self.keys = [column[row] for row in order]
+        self.rows = array("I", order)
+        self._pending = []
+
+    def insert(self, key: str, row: int):
+        insort(self._pending, (key, row))
+        if len(self._pending) >= max(self.MIN_MERGE, len(self.keys) // self.MERGE_RATIO):
+            self._merge()
+
+    def _merge(self):
+        # One pass of slice copies: O(n) memory moves per merge instead of per insert
+        keys: List[str] = []
+        rows = array("I")
+        previous = 0
+        for key, row in self._pending:
+            position = bisect_right(self.keys, key, previous)
+            keys += self.keys[previous:position]
+            rows += self.rows[previous:position]
+            keys.append(key)
+            rows.append(row)
+            previous = position
+        keys += self.keys[previous:]
+        rows += self.rows[previous:]
+        self.keys, self.rows = keys, rows
+        self._pending = []
+
+    def _main_range(self, prefix: str, limit: int) -> Iterator[Tuple[str, int]]:
+        start = bisect_left(self.keys, prefix)
+        for position in range(start, min(start + limit, len(self.keys))):
+            key = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            yield key, self.rows[position]
+
+    def _pending_range(self, prefix: str, limit: int) -> Iterator[Tuple[str, int]]:
+        start = bisect_left(self._pending, (prefix,))
+        for position in range(start, min(start + limit, len(self._pending))):
+            key, row = self._pending[position]
+            if not key.startswith(prefix):
+                break
+            yield key, row
+
+    def prefix(self, prefix: str, limit: int) -> List[int]:
+        if not prefix:
+            return []
+        matches = heapq.merge(self._main_range(prefix, limit), self._pending_range(prefix, limit))
+        return [row for _, row in islice(matches, limit)]
+
+
+class CustomerDirectory:
+    """Summaries of all customers with exact and prefix indexes on id, email and phone."""
+
+    def __init__(self, loader: Optional[Callable[[CustomerSummary], CustomerDetails]] = None):
+        self.loader = loader
+        self._lock = threading.RLock()
+        self._columns: Dict[str, List[str]] = {field: [] for field in FIELDS}
+        self._names: List[str] = []
+        self._tiers = bytearray()
+        self._exact: Dict[str, Dict[str, int]] = {field: {} for field in FIELDS}
+        self._prefix: Dict[str, PrefixIndex] = {field: PrefixIndex() for field in FIELDS}
+        self._profiles: Dict[str, CustomerDetails] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _append(self, customer_id: str, name: str, email: str, phone: str, tier: CustomerTier) -> int:
+        row = len(self._names)
+        values = {"customer_id": normalize_customer_id(customer_id),
+                  "email": normalize_email(email), "phone": normalize_phone(phone or "")}
+        if values["customer_id"] in self._exact["customer_id"]:
+            raise ValueError(f"Duplicate customer id: {customer_id}")
+        for field, value in values.items():
+            self._columns[field].append(value)
+            if value:
+                self._exact[field].setdefault(value, row)
+        self._names.append(name)
+        self._tiers.append(TIERS.index(tier))
+        return row
+
+    def extend(self, summaries: Iterable[CustomerSummary]):
+        """Bulk load; the prefix indexes are re-sorted once at the end."""
+        with self._lock:
+            for summary in summaries:
+                self._append(*summary)
+            for field in FIELDS:
+                self._prefix[field].rebuild(self._columns[field])
+
+    def add(self, summary: CustomerSummary) -> int:
+        """Add one customer, keeping the prefix indexes sorted."""
+        with self._lock:
+            row = self._append(*summary)
+            for field in FIELDS:
+                if self._columns[field][row]:
+                    self._prefix[field].insert(self._columns[field][row], row)
+            return row
+
+    def add_profile(self, customer: CustomerDetails):
+        """Add a customer whose full profile is already in memory."""
+        with self._lock:
+            self.add(CustomerSummary(customer.customer_id, customer.name, customer.email,
+                                     customer.phone or "", customer.tier))
+            self._profiles[normalize_customer_id(customer.customer_id)] = customer
+
+    def _summary(self, row: int) -> CustomerSummary:
+        return CustomerSummary(
+            self._columns["customer_id"][row], self._names[row], self._columns["email"][row],
+            self._columns["phone"][row], TIERS[self._tiers[row]])
+
+    def lookup(self, field: str, value: str) -> Optional[CustomerSummary]:
+        """Exact match on ``customer_id``, ``email`` or ``phone``."""
+        row = self._exact[field].get(NORMALIZERS[field](value))
+        return None if row is None else self._summary(row)
+
+    def find(self, query: str) -> Optional[CustomerSummary]:
+        """Exact match of ``query`` against any indexed field."""
+        for field in FIELDS:
+            summary = self.lookup(field, query)
+            if summary is not None:
+                return summary
+        return None
+
+    def prefix(self, field: str, prefix: str, limit: int = 10) -> List[CustomerSummary]:
+        """Customers whose ``field`` starts with ``prefix``, in key order."""
+        with self._lock:
+            rows = self._prefix[field].prefix(NORMALIZERS[field](prefix), limit)
+        return [self._summary(row) for row in rows]
+
+    def search(self, query: str, limit: int = 10) -> List[CustomerSummary]:
+        """Type-ahead: picks the fields from the shape of ``query``."""
+        start = time.perf_counter()
+        query = query.strip()
+        if "@" in query:
+            fields = ["email"]
+        elif len(normalize_phone(query)) >= 3 and not query.strip("+()- 0123456789"):
+            fields = ["phone"]
+        else:
+            fields = ["customer_id", "email"]
+        results: List[CustomerSummary] = []
+        seen = set()
+        for field in fields:
+            for summary in self.prefix(field, query, limit):
+                if summary.customer_id not in seen and len(results) < limit:
+                    seen.add(summary.customer_id)
+                    results.append(summary)
+        metrics.observe("customer_directory_search_seconds", time.perf_counter() - start,
+                        {"field": "+".join(fields)})
+        return results
+
+    def get_profile(self, customer_id: str) -> Optional[CustomerDetails]:
+        """Full profile (orders, history), loaded on demand.
+
+        Goes through the process-wide profile cache, so sessions viewing the
+        same customer share one (frozen) object; changes go through
+        ``support_system.update_order_record``, which replaces it.
+        """
+        summary = self.lookup("customer_id", customer_id)
+        if summary is None:
+            return None
+        return get_profile_cache().get(summary.customer_id, lambda: self._load_profile(summary))
+
+    def _load_profile(self, summary: CustomerSummary) -> Optional[CustomerDetails]:
+        profile = self._profiles.get(summary.customer_id)
+        if profile is not None:
+            return profile.model_copy(deep=True)
+        if self.loader is None:
+            return None
+        return self.loader(summary)
+
+
+FIRST_NAMES = ["John", "Jane", "Maria", "Luis", "Ana", "Wei", "Fatima", "Olivia", "Noah", "Sofia",
+               "Liam", "Emma", "Carlos", "Yuki", "Amir", "Chloe", "Diego", "Hannah", "Ivan", "Lucia"]
+LAST_NAMES = ["Smith", "Garcia", "Chen", "Johnson", "Lopez", "Kim", "Brown", "Martinez", "Nguyen",
+              "Silva", "Khan", "Rossi", "Meyer", "Tanaka", "Patel", "Dubois", "Novak", "Cohen"]
+DOMAINS = ["example.com", "mail.com", "shop.net", "corp.io"]
+
+
+def demo_summaries(count: int, seed: int = 0, start: int = 2) -> Iterable[CustomerSummary]:
+    """``count`` synthetic customers with unique ids, emails and phones."""
+    rng = random.Random(seed)
+    tiers = rng.choices(TIERS, weights=[70, 25, 5], k=count)
+    for i in range(count):
+        number = start + i
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield CustomerSummary(
+            f"CUST{number:07d}",
+            f"{first} {last}",
+            f"{first.lower()}.{last.lower()}{number}@{rng.choice(DOMAINS)}",
+            f"+1555{number:07d}",
+            tiers[i],
+        )
+
+
+def demo_profile(summary: CustomerSummary) -> CustomerDetails:
+    """Deterministic synthetic profile with a few orders for a directory entry."""
+    rng = random.Random(summary.customer_id)
+    now = datetime.utcnow()
+    orders = []
+    for i in range(rng.randint(0, 4)):
+        price = round(rng.uniform(9.99, 399.99), 2)
+        orders.append(Order(
+            order_id=f"#{rng.randint(10000, 99999)}",
+            status=rng.choice([OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED]),
+            items=[Item(item_id=f"ITEM{i:03d}", name=f"Product {rng.randint(1, 500)}", quantity=1,
+                        price=price, sku=f"SKU{rng.randint(100, 999)}", category="Electronics")],
+            total_amount=price,
+            order_date=now - timedelta(days=rng.randint(1, 120)),
+        ))
+    return CustomerDetails(
+        customer_id=summary.customer_id,
+        name=summary.name,
+        email=summary.email,
+        phone=f"+{summary.phone}",
+        tier=summary.tier,
+        orders=orders,
+        total_orders=len(orders),
+        total_spent=round(sum(o.total_amount for o in orders), 2),
+        last_purchase_date=max((o.order_date for o in orders), default=None),
+    )
+
+
+# Directorio global de clientes
+_directory = None
+_directory_lock = threading.Lock()
+
+
+def get_customer_directory() -> CustomerDirectory:
+    """Obtiene o crea el directorio global, con los clientes de demostración."""
+    global _directory
+    with _directory_lock:
+        if _directory is None:
+            _directory = CustomerDirectory(loader=demo_profile)
+            _directory.extend(demo_summaries(directory_demo_size))
+        return _directory
@@ -0,0 +1,159 @@
+"""Pluggable async data source for the agent tools.
+
+The tools read shipping records and knowledge base sections through a
+``DataSource`` instead of touching the module-level dicts, so the same tool
+code can run against the in-memory demo data or a real backend without
+blocking the event loop. When the model issues several tool calls in one
+turn, pydantic-ai runs async tools as concurrent tasks, so their lookups
+overlap instead of running one after another.
+
+* ``InMemoryDataSource``: the demo shipping dict and the knowledge base (optionally
+  with a simulated latency, ``DATA_SOURCE_LATENCY``, to exercise concurrency);
+* ``HTTPDataSource``: a JSON HTTP backend (``GET /shipping/{order_id}``,
+  ``GET /policies/{policy_type}``) through pooled ``httpx.AsyncClient``s.
+
+``DATA_SOURCE`` selects the implementation and ``set_data_source`` replaces
+it at runtime. ``with_timeout`` bounds each tool call with its own timeout
+(``TOOL_TIMEOUT_SECONDS``, overridable per tool in ``TOOL_TIMEOUTS``).
+"""
+import abc
+import asyncio
+import json
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Dict, Optional
+
+from metrics import metrics
+
+data_source_kind = os.getenv('DATA_SOURCE', 'memory').lower()
+data_source_url = os.getenv('DATA_SOURCE_URL', 'http://localhost:8080')
+data_source_latency = float(os.getenv('DATA_SOURCE_LATENCY', '0'))
+tool_timeout = float(os.getenv('TOOL_TIMEOUT_SECONDS', '5'))
+TOOL_TIMEOUTS: Dict[str, float] = json.loads(os.getenv('TOOL_TIMEOUTS', '{}'))
+
+
+class ToolTimeout(Exception):
+    """A tool did not finish within its timeout."""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"{tool_name} timed out after {timeout:.1f}s")
+        self.tool_name = tool_name
+        self.timeout = timeout
+
+
+class DataSource(abc.ABC):
+    """Interface of the records the tools read."""
+
+    @abc.abstractmethod
+    async def get_shipping_info(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """Shipping record of ``order_id``, or None if there is none."""
+
+    @abc.abstractmethod
+    async def get_policy(self, policy_type: str) -> Optional[Dict[str, Any]]:
+        """Knowledge base section ``policy_type``, or None if there is none."""
+
+    async def aclose(self):
+        pass
+
+
+class InMemoryDataSource(DataSource):
+    """Serves the in-process shipping dict and knowledge base snapshots.
+
+    Writes to the dict are visible immediately; policies come from the
+    snapshot pinned by the run (or the latest one).
+    """
+
+    def __init__(self, shipping: Dict[str, Dict[str, Any]], kb_store: Any, latency: float = 0.0):
+        self.shipping = shipping
+        self.kb_store = kb_store
+        self.latency = latency
+
+    async def _io(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def get_shipping_info(self, order_id: str) -> Optional[Dict[str, Any]]:
+        await self._io()
+        return self.shipping.get(order_id)
+
+    async def get_policy(self, policy_type: str) -> Optional[Dict[str, Any]]:
+        await self._io()
+        return self.kb_store.current().article(policy_type)
+
+
+class HTTPDataSource(DataSource):
+    """JSON HTTP backend; a 404 means the record does not exist.
+
+    Agent runs use one event loop per thread, and an ``AsyncClient`` can't be
+    shared across loops, so each loop gets its own pooled client.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _client(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                client = self._clients[loop] = httpx.AsyncClient(base_url=self.base_url, timeout=tool_timeout)
+            return client
+
+    async def _get(self, path: str) -> Optional[Dict[str, Any]]:
+        response = await self._client().get(path)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
+    async def get_shipping_info(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return await self._get(f"/shipping/{order_id.lstrip('#')}")
+
+    async def get_policy(self, policy_type: str) -> Optional[Dict[str, Any]]:
+        return await self._get(f"/policies/{policy_type}")
+
+    async def aclose(self):
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+async def with_timeout(tool_name: str, awaitable: Awaitable[Any]) -> Any:
+    """Await ``awaitable`` within the timeout of ``tool_name``; raises ``ToolTimeout``."""
+    timeout = float(TOOL_TIMEOUTS.get(tool_name, tool_timeout))
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        metrics.inc("tool_timeouts_total", 1, {"tool": tool_name})
+        raise ToolTimeout(tool_name, timeout) from None
+
+
+# Fuente de datos global
+_data_source: Optional[DataSource] = None
+_data_source_lock = threading.Lock()
+
+
+def get_data_source() -> DataSource:
+    """Obtiene o crea la fuente de datos configurada en DATA_SOURCE."""
+    global _data_source
+    with _data_source_lock:
+        if _data_source is None:
+            if data_source_kind == 'http':
+                _data_source = HTTPDataSource(data_source_url)
+            else:
+                from kb_store import get_kb_store
+                from support_system import shipping_info_db
+                _data_source = InMemoryDataSource(shipping_info_db, get_kb_store(), data_source_latency)
+        return _data_source
+
+
+def set_data_source(source: DataSource):
+    """Replace the data source used by the tools (e.g. a real backend or a test double)."""
+    global _data_source
+    with _data_source_lock:
+        _data_source = source
@@ -0,0 +1,187 @@
+"""Versioned, hot-reloadable knowledge base snapshots.
+
+The knowledge base lives in ``KB_PATH`` (default ``knowledge_base/``), one
+JSON file per article (``return_policies.json`` → article
+``return_policies``). It is loaded into an immutable ``KBSnapshot``: the
+articles are kept as canonical JSON text with a content hash each, plus a
+small inverted index for search, and every read returns a fresh copy.
+
+A reload (file watcher, ``SIGHUP`` or ``reload()``) builds the next snapshot
+off to the side and then swaps the reference atomically; if any file is
+invalid the current snapshot stays. Agent runs pin the snapshot they start
+with (``pinned``), so a request in flight during a swap finishes on the old
+version. Tool results built from an article are tagged ``kb:<article>`` and
+only the articles whose hash changed are invalidated.
+"""
+import hashlib
+import json
+import os
+import re
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import tool_cache
+from metrics import metrics
+
+KB_PATH = os.getenv('KB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge_base'))
+# Segundos entre comprobaciones de cambios en KB_PATH (0 desactiva el vigilante)
+kb_watch_interval = float(os.getenv('KB_WATCH_INTERVAL', '2'))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _tokens(text: str) -> set:
+    return set(_TOKEN.findall(text.lower()))
+
+
+class KBSnapshot:
+    """One immutable version of the knowledge base."""
+
+    def __init__(self, version: int, articles: Dict[str, Any]):
+        self.version = version
+        self._raw = {name: json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+                     for name, content in articles.items()}
+        self.hashes = {name: hashlib.sha256(raw.encode()).hexdigest()[:16] for name, raw in self._raw.items()}
+        self._index: Dict[str, set] = {}
+        for name, raw in self._raw.items():
+            for token in _tokens(name.replace("_", " ")) | _tokens(raw):
+                self._index.setdefault(token, set()).add(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._raw
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(self._raw)
+
+    def article(self, name: str) -> Optional[Any]:
+        """A copy of the article, or None."""
+        raw = self._raw.get(name)
+        return None if raw is None else json.loads(raw)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: json.loads(raw) for name, raw in self._raw.items()}
+
+    def search(self, text: str, limit: int = 3) -> List[str]:
+        """Articles sharing the most words with ``text``."""
+        scores: Dict[str, int] = {}
+        for token in _tokens(text.replace("_", " ")):
+            for name in self._index.get(token, ()):
+                scores[name] = scores.get(name, 0) + 1
+        return sorted(scores, key=lambda name: (-scores[name], name))[:limit]
+
+    def diff(self, other: "KBSnapshot") -> List[str]:
+        """Articles added, removed or changed between ``other`` and this snapshot."""
+        return sorted(name for name in set(self.hashes) | set(other.hashes)
+                      if self.hashes.get(name) != other.hashes.get(name))
+
+
+def load_articles(path: str) -> Dict[str, Any]:
+    articles = {}
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".json"):
+            with open(os.path.join(path, filename), encoding="utf-8") as f:
+                articles[filename[:-len(".json")]] = json.load(f)
+    return articles
+
+
+_pinned: ContextVar[Optional[KBSnapshot]] = ContextVar("kb_snapshot", default=None)
+
+
+class KnowledgeBaseStore:
+    """Holds the current snapshot and swaps in new versions."""
+
+    def __init__(self, path: str = KB_PATH):
+        self.path = path
+        self._reload_lock = threading.Lock()
+        self._snapshot = KBSnapshot(1, load_articles(path))
+        self._signature = self._files_signature()
+        self._watcher: Optional[threading.Thread] = None
+        metrics.set_gauge("kb_version", self._snapshot.version)
+
+    def current(self) -> KBSnapshot:
+        """The snapshot pinned by the enclosing run, else the latest one."""
+        pinned = _pinned.get()
+        return self._snapshot if pinned is None else pinned
+
+    @contextmanager
+    def pinned(self) -> Iterator[KBSnapshot]:
+        """Serve the enclosed run from the snapshot current when it starts."""
+        reset = _pinned.set(self.current())
+        try:
+            yield _pinned.get()
+        finally:
+            _pinned.reset(reset)
+
+    def _files_signature(self) -> Tuple:
+        try:
+            return tuple((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                         for entry in sorted(os.scandir(self.path), key=lambda e: e.name)
+                         if entry.name.endswith(".json"))
+        except OSError:
+            return ()
+
+    def reload(self) -> List[str]:
+        """Rebuild from disk and swap; returns the changed articles."""
+        with self._reload_lock:
+            # Recorded even on failure: the watcher retries on the next edit, not every poll
+            self._signature = self._files_signature()
+            try:
+                articles = load_articles(self.path)
+            except (OSError, ValueError) as e:
+                metrics.inc("kb_reload_failures_total")
+                print(f"⚠️ Base de conocimiento no recargada, se mantiene la versión {self._snapshot.version}: {e}")
+                return []
+            old = self._snapshot
+            candidate = KBSnapshot(old.version + 1, articles)
+            changed = candidate.diff(old)
+            if not changed:
+                return []
+            # Atomic swap: runs already pinned keep using ``old``
+            self._snapshot = candidate
+        for name in changed:
+            tool_cache.invalidate(tool_cache.kb_tag(name))
+        metrics.inc("kb_reloads_total")
+        metrics.inc("kb_articles_changed_total", len(changed))
+        metrics.set_gauge("kb_version", candidate.version)
+        print(f"📚 Base de conocimiento v{candidate.version}: {', '.join(changed)}")
+        return changed
+
+    def reload_in_background(self):
+        threading.Thread(target=self.reload, name="kb-reload", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(kb_watch_interval)
+            if self._files_signature() != self._signature:
+                self.reload()
+
+    def start_watcher(self):
+        """Poll ``path`` for changes and reload SIGHUP; both are idempotent."""
+        if self._watcher is None and kb_watch_interval > 0:
+            self._watcher = threading.Thread(target=self._watch, name="kb-watcher", daemon=True)
+            self._watcher.start()
+        try:
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.reload_in_background())
+        except (AttributeError, ValueError):
+            # No SIGHUP on Windows; signal handlers can only be set from the main thread
+            pass
+
+
+# Almacén global de la base de conocimiento
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_kb_store() -> KnowledgeBaseStore:
+    """Obtiene o crea el almacén global y arranca el vigilante de cambios."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = KnowledgeBaseStore()
+            _store.start_watcher()
+        return _store
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""Opt-in memory profiling and leak detection with ``tracemalloc``.
+
+With ``MEMORY_PROFILING=true`` allocations are traced and attributed to a
+component by walking each allocation's traceback (most recent frame first)
+until a frame belongs to one of:
+
+* ``context``: building the customer context and the system prompt;
+* ``tools``: the agent tools and their data source;
+* ``model_client``: pydantic-ai, the OpenAI/HTTP clients and model wrappers;
+* ``caches``: tool, profile, single-flight and knowledge base caches;
+* ``ui``: ``app.py`` and Streamlit.
+
+Everything else is ``other``. ``request()`` records the change in traced
+memory over one request (``tracemalloc.get_traced_memory``, no snapshot), so
+it adds next to nothing to a reply. A sampled subset of requests
+(``MEMORY_REQUEST_SAMPLE``) also takes a snapshot before and after and
+splits the delta per component and source file with a cheap ``filename``
+compare. Other threads allocating meanwhile are counted too, so read both as
+an upper bound under load. The full traceback attribution is left to the
+background thread, which diffs a snapshot every ``MEMORY_SNAPSHOT_INTERVAL``
+seconds against the previous one and the first, and writes the top growers
+to ``MEMORY_PROFILE_FILE``.
+
+When profiling is off nothing is traced: ``request()`` returns a shared
+no-op context manager after a single flag check.
+
+Run as a script to print the latest report of a running process (``--now``
+asks it to write a fresh one first)::
+
+    python memory_profile.py --now --top 15
+"""
+import argparse
+import inspect
+import itertools
+import json
+import linecache
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import nullcontext
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+memory_profiling = os.getenv('MEMORY_PROFILING', 'false').lower() == 'true'
+memory_profile_frames = int(os.getenv('MEMORY_PROFILE_FRAMES', '16'))
+memory_snapshot_interval = float(os.getenv('MEMORY_SNAPSHOT_INTERVAL', '300'))
+# Fracción de consultas con desglose por componente (dos snapshots por consulta)
+memory_request_sample = float(os.getenv('MEMORY_REQUEST_SAMPLE', '0.05'))
+MEMORY_PROFILE_FILE = os.getenv('MEMORY_PROFILE_FILE', 'memory_profile.json')
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Módulos del proyecto y paquetes → componente
+MODULE_GROUPS = {
+    "app.py": "ui",
+    "fast_path.py": "ui",
+    "data_source.py": "tools",
+    "rate_governor.py": "model_client",
+    "model_pool.py": "model_client",
+    "replay_model.py": "model_client",
+    "cascade.py": "model_client",
+    "tool_cache.py": "caches",
+    "profile_cache.py": "caches",
+    "single_flight.py": "caches",
+    "kb_store.py": "caches",
+    "customer_directory.py": "caches",
+}
+PACKAGE_GROUPS = {
+    "streamlit": "ui",
+    "pydantic_ai": "model_client",
+    "openai": "model_client",
+    "httpx": "model_client",
+    "httpcore": "model_client",
+    "h11": "model_client",
+}
+# Funciones de support_system.py: el módulo mezcla contexto y herramientas
+FUNCTION_GROUPS = {
+    "context": ("build_customer_context", "customer_context", "add_customer_context"),
+    "tools": ("_select_order", "_order_payload", "_fetch_order_status", "_order_status_response",
+              "order_status_lookup", "get_order_and_shipping_status", "_order_row",
+              "_fetch_orders_status", "orders_status_lookup", "get_orders_status", "get_policy_info"),
+}
+GROUPS = ("context", "tools", "model_client", "caches", "ui", "other")
+
+
+class _Attribution:
+    """Maps ``(filename, lineno)`` to a component, memoized."""
+
+    def __init__(self):
+        self._ranges: List[Tuple[str, int, int, str]] = []
+        self._memo: Dict[Tuple[str, int], Optional[str]] = {}
+
+    def add_function_ranges(self, module):
+        for group, names in FUNCTION_GROUPS.items():
+            for name in names:
+                func = getattr(module, name, None)
+                func = getattr(func, "function", func)  # pydantic-ai Tool wrappers
+                try:
+                    func = inspect.unwrap(func)
+                    lines, first = inspect.getsourcelines(func)
+                except (TypeError, OSError):
+                    continue
+                path = os.path.abspath(func.__code__.co_filename)
+                self._ranges.append((path, first, first + len(lines) - 1, group))
+        self._memo.clear()
+
+    def frame_group(self, filename: str, lineno: int) -> Optional[str]:
+        key = (filename, lineno)
+        if key in self._memo:
+            return self._memo[key]
+        group = None
+        filename = os.path.abspath(filename)
+        for path, first, last, range_group in self._ranges:
+            if filename == path and first <= lineno <= last:
+                group = range_group
+                break
+        if group is None:
+            if os.path.dirname(filename) == _PROJECT_DIR:
+                group = MODULE_GROUPS.get(os.path.basename(filename))
+            else:
+                parts = filename.replace("\\", "/").split("/")
+                for package, package_group in PACKAGE_GROUPS.items():
+                    if package in parts:
+                        group = package_group
+                        break
+        self._memo[key] = group
+        return group
+
+    def group(self, traceback: tracemalloc.Traceback) -> str:
+        for frame in reversed(traceback):
+            group = self.frame_group(frame.filename, frame.lineno)
+            if group is not None:
+                return group
+        return "other"
+
+
+_attribution = _Attribution()
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, linecache.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+
+
+def group_diff(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot) -> Dict[str, Dict[str, int]]:
+    """Size and delta in bytes per component between two snapshots."""
+    groups = {group: {"size": 0, "delta": 0, "count_delta": 0} for group in GROUPS}
+    for stat in new.compare_to(old, "traceback"):
+        group = groups[_attribution.group(stat.traceback)]
+        group["size"] += stat.size
+        group["delta"] += stat.size_diff
+        group["count_delta"] += stat.count_diff
+    return groups
+
+
+def file_diff(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot,
+              limit: int = 5) -> Tuple[Dict[str, int], List[Tuple[str, int]]]:
+    """Delta per component and the top growing files, from a ``filename`` compare.
+
+    Only the allocating file is known here, so support_system.py counts as
+    ``other`` and libraries outside ``PACKAGE_GROUPS`` are not charged to the
+    project code that called them.
+    """
+    groups: Dict[str, int] = {}
+    files = []
+    for stat in new.compare_to(old, "filename"):
+        if not stat.size_diff:
+            continue
+        filename = stat.traceback[0].filename
+        group = _attribution.frame_group(filename, 0) or "other"
+        groups[group] = groups.get(group, 0) + stat.size_diff
+        files.append((os.path.basename(filename), stat.size_diff))
+    return groups, files[:limit]
+
+
+def top_growers(new: tracemalloc.Snapshot, old: tracemalloc.Snapshot, limit: int = 20) -> List[Dict[str, Any]]:
+    growers = []
+    for stat in new.compare_to(old, "traceback"):
+        if stat.size_diff <= 0 or len(growers) >= limit:
+            continue
+        frame = stat.traceback[-1]
+        growers.append({
+            "where": f"{frame.filename}:{frame.lineno}",
+            "code": linecache.getline(frame.filename, frame.lineno).strip(),
+            "group": _attribution.group(stat.traceback),
+            "delta": stat.size_diff,
+            "count_delta": stat.count_diff,
+            "size": stat.size,
+        })
+    return growers
+
+
+class _RequestProfile:
+    """Traced-memory delta of one request; per component when sampled."""
+
+    def __init__(self, profiler: "MemoryProfiler", name: str, sampled: bool):
+        self.profiler = profiler
+        self.name = name
+        self.sampled = sampled
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        self.before = _snapshot() if self.sampled else None
+        self.traced = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *exc):
+        delta = tracemalloc.get_traced_memory()[0] - self.traced
+        record = {
+            "name": self.name,
+            "at": time.time(),
+            "duration_ms": round((time.monotonic() - self.start) * 1000, 1),
+            "delta": delta,
+        }
+        metrics.observe("memory_request_delta_bytes", delta, {"group": "total"})
+        if self.sampled:
+            groups, files = file_diff(_snapshot(), self.before)
+            record["groups"] = groups
+            record["top_files"] = files
+            for name, group_delta in groups.items():
+                metrics.observe("memory_request_delta_bytes", group_delta, {"group": name})
+        self.profiler.record_request(record)
+        return False
+
+
+class MemoryProfiler:
+    """Traces allocations and keeps per-request deltas and periodic reports."""
+
+    def __init__(self, path: str = MEMORY_PROFILE_FILE, interval: float = 300.0,
+                 frames: int = 16, history: int = 50, sample: float = 0.05):
+        self.path = path
+        self.interval = interval
+        self.frames = frames
+        # Every n-th request is broken down per component
+        self.sample_every = max(1, round(1 / sample)) if sample > 0 else 0
+        self._requests_seen = itertools.count()
+        self.requests: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        import support_system
+        _attribution.add_function_ranges(support_system)
+        self._baseline = self._previous = _snapshot()
+        self._thread = threading.Thread(target=self._loop, name="memory-profiler", daemon=True)
+        self._thread.start()
+
+    def request(self, name: str) -> _RequestProfile:
+        sampled = bool(self.sample_every) and next(self._requests_seen) % self.sample_every == 0
+        return _RequestProfile(self, name, sampled)
+
+    def record_request(self, record: Dict[str, Any]):
+        with self._lock:
+            self.requests.append(record)
+
+    def report(self, limit: int = 20) -> Dict[str, Any]:
+        """Diff against the previous report (recent growth) and the first snapshot (since start)."""
+        current = _snapshot()
+        with self._lock:
+            previous, self._previous = self._previous, current
+            requests = list(self.requests)
+        traced, peak = tracemalloc.get_traced_memory()
+        report = {
+            "pid": os.getpid(),
+            "at": time.time(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "groups": group_diff(current, previous),
+            "groups_since_start": group_diff(current, self._baseline),
+            "top_growers": top_growers(current, previous, limit),
+            "top_growers_since_start": top_growers(current, self._baseline, limit),
+            "recent_requests": requests[-10:],
+        }
+        metrics.set_gauge("memory_traced_bytes", traced)
+        for name, group in report["groups_since_start"].items():
+            metrics.set_gauge("memory_group_bytes", group["size"], {"group": name})
+        return report
+
+    def dump(self, limit: int = 20) -> Dict[str, Any]:
+        report = self.report(limit)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp, self.path)
+        return report
+
+    def _loop(self):
+        trigger = f"{self.path}.request"
+        next_report = time.monotonic() + self.interval
+        while True:
+            time.sleep(1.0)
+            # ``memory_profile.py --now`` asks for a report by creating the trigger file
+            requested = os.path.exists(trigger)
+            if requested or time.monotonic() >= next_report:
+                if requested:
+                    os.remove(trigger)
+                self.dump()
+                next_report = time.monotonic() + self.interval
+
+
+_profiler: Optional[MemoryProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def get_memory_profiler() -> Optional[MemoryProfiler]:
+    """Obtiene o crea el perfilador global; None si MEMORY_PROFILING está desactivado."""
+    global _profiler
+    if not memory_profiling:
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = MemoryProfiler(MEMORY_PROFILE_FILE, memory_snapshot_interval, memory_profile_frames,
+                                       sample=memory_request_sample)
+            _profiler.start()
+        return _profiler
+
+
+_NOOP = nullcontext()
+
+
+def request(name: str):
+    """Profile the enclosed request; a no-op when profiling is off."""
+    if not memory_profiling:
+        return _NOOP
+    return get_memory_profiler().request(name)
+
+
+def _format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:+.0f} {unit}" if unit == "B" else f"{size:+.1f} {unit}"
+        size /= 1024
+    return f"{size:+.1f} GiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Informe de memoria de un proceso con MEMORY_PROFILING=true")
+    parser.add_argument("--file", default=MEMORY_PROFILE_FILE, help="informe escrito por el proceso")
+    parser.add_argument("--now", action="store_true", help="pedir un informe nuevo y esperarlo")
+    parser.add_argument("--top", type=int, default=10, help="líneas con más crecimiento a mostrar")
+    parser.add_argument("--since-start", action="store_true", help="crecimiento desde el arranque")
+    args = parser.parse_args()
+
+    if args.now:
+        previous = os.path.getmtime(args.file) if os.path.exists(args.file) else 0
+        open(f"{args.file}.request", "w").close()
+        deadline = time.time() + 60
+        while time.time() < deadline and (not os.path.exists(args.file) or os.path.getmtime(args.file) == previous):
+            time.sleep(0.5)
+    if not os.path.exists(args.file):
+        parser.error(f"{args.file} no existe: ¿el proceso corre con MEMORY_PROFILING=true?")
+    with open(args.file, encoding="utf-8") as f:
+        report = json.load(f)
+
+    suffix = "_since_start" if args.since_start else ""
+    print(f"PID {report['pid']} · {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(report['at']))}"
+          f" · trazado {report['traced_bytes'] / 2**20:.1f} MiB (pico {report['peak_bytes'] / 2**20:.1f} MiB)")
+    print(f"{'componente':<14} {'tamaño':>12} {'crecimiento':>14}")
+    for name, group in report[f"groups{suffix}"].items():
+        print(f"{name:<14} {group['size'] / 2**20:>8.1f} MiB {_format_bytes(group['delta']):>14}")
+    print("Mayor crecimiento:")
+    for grower in report[f"top_growers{suffix}"][:args.top]:
+        print(f"  {_format_bytes(grower['delta']):>12}  [{grower['group']}] {grower['where']}")
+        if grower["code"]:
+            print(f"  {'':>12}  {grower['code']}")
+    if report["recent_requests"]:
+        print("Últimas consultas:")
+        for record in report["recent_requests"]:
+            groups = ", ".join(f"{k} {_format_bytes(v)}" for k, v in record.get("groups", {}).items())
+            print(f"  {record['name']:<10} {_format_bytes(record['delta']):>12}  {groups}")
+
+
+if __name__ == "__main__":
+    main()
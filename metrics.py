@@ -0,0 +1,109 @@
+"""Registro de métricas en proceso para el sistema de soporte.
+
+Contadores, gauges y resúmenes con etiquetas, seguros entre hilos. Se pueden
+exportar como diccionario (``snapshot``) o en formato de texto Prometheus
+(``to_prometheus``).
+"""
+import threading
+from typing import Dict, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class MetricsRegistry:
+    """Registro simple de métricas con etiquetas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, Dict[str, float]]] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        """Incrementa un contador."""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """Fija el valor actual de un gauge."""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """Registra una observación (p. ej. una latencia) en un resumen."""
+        key = _label_key(labels)
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(
+                key, {"count": 0, "sum": 0.0, "max": 0.0})
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+
+    def counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Devuelve el valor actual de un contador."""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def gauge(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Devuelve el valor actual de un gauge."""
+        with self._lock:
+            return self._gauges.get(name, {}).get(_label_key(labels), 0.0)
+
+    def summary(self, name: str, labels: Optional[Dict[str, str]] = None) -> Dict[str, float]:
+        """Devuelve count/sum/max/avg de un resumen."""
+        with self._lock:
+            summary = dict(self._summaries.get(name, {}).get(
+                _label_key(labels), {"count": 0, "sum": 0.0, "max": 0.0}))
+        summary["avg"] = summary["sum"] / summary["count"] if summary["count"] else 0.0
+        return summary
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """Copia de todas las series, con etiquetas serializadas como ``k=v,...``."""
+        def fmt(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key)
+
+        with self._lock:
+            return {
+                "counters": {n: {fmt(k): v for k, v in s.items()} for n, s in self._counters.items()},
+                "gauges": {n: {fmt(k): v for k, v in s.items()} for n, s in self._gauges.items()},
+                "summaries": {n: {fmt(k): dict(v) for k, v in s.items()} for n, s in self._summaries.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """Exporta las métricas en formato de texto Prometheus."""
+        def fmt(name: str, key: LabelKey, suffix: str = "") -> str:
+            labels = ",".join(f'{k}="{v}"' for k, v in key)
+            return f"{name}{suffix}{{{labels}}}" if labels else f"{name}{suffix}"
+
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{fmt(name, k)} {v}" for k, v in series.items())
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{fmt(name, k)} {v}" for k, v in series.items())
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for k, v in series.items():
+                    lines.append(f"{fmt(name, k, '_count')} {v['count']}")
+                    lines.append(f"{fmt(name, k, '_sum')} {v['sum']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Borra todas las series (útil en benchmarks)."""
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+# Registro global del proceso
+metrics = MetricsRegistry()
@@ -0,0 +1,74 @@
+"""Load-balanced model over a pool of equivalent backends.
+
+``BalancedModel`` spreads requests across several models that serve the same
+weights, typically one ``ollama_chat_model`` per ``OllamaPool`` instance. Each
+request goes to the healthy backend with the fewest requests in flight (ties
+broken round-robin); if the chosen backend refuses the connection, the request
+is retried once on the next healthy one.
+"""
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from typing import Any, Callable, List, Optional
+
+from openai import APIConnectionError
+from pydantic_ai.models.wrapper import WrapperModel
+
+from metrics import metrics
+
+
+class BalancedModel(WrapperModel):
+    """Dispatches each request to the least-loaded healthy backend."""
+
+    def __init__(self, backends: List[Any], names: List[str],
+                 is_healthy: Optional[Callable[[int], bool]] = None):
+        super().__init__(backends[0])
+        self.backends = backends
+        self.names = names
+        self.is_healthy = is_healthy or (lambda index: True)
+        self.in_flight = [0] * len(backends)
+        self._lock = threading.Lock()
+        self._tiebreak = itertools.count()
+
+    def _acquire(self, exclude: Optional[int] = None) -> int:
+        with self._lock:
+            candidates = [i for i in range(len(self.backends)) if i != exclude and self.is_healthy(i)]
+            if not candidates:
+                # Nothing reported healthy: try them all rather than fail outright
+                candidates = [i for i in range(len(self.backends)) if i != exclude] or [0]
+            offset = next(self._tiebreak)
+            index = min(candidates, key=lambda i: (self.in_flight[i], (i - offset) % len(self.backends)))
+            self.in_flight[index] += 1
+        metrics.set_gauge("model_pool_in_flight", self.in_flight[index], {"backend": self.names[index]})
+        metrics.inc("model_pool_requests_total", 1, {"backend": self.names[index]})
+        return index
+
+    def _release(self, index: int):
+        with self._lock:
+            self.in_flight[index] -= 1
+        metrics.set_gauge("model_pool_in_flight", self.in_flight[index], {"backend": self.names[index]})
+
+    async def request(self, *args: Any, **kwargs: Any):
+        index = self._acquire()
+        try:
+            return await self.backends[index].request(*args, **kwargs)
+        except APIConnectionError:
+            if len(self.backends) == 1:
+                raise
+            metrics.inc("model_pool_failovers_total", 1, {"backend": self.names[index]})
+            retry = self._acquire(exclude=index)
+            try:
+                return await self.backends[retry].request(*args, **kwargs)
+            finally:
+                self._release(retry)
+        finally:
+            self._release(index)
+
+    @asynccontextmanager
+    async def request_stream(self, *args: Any, **kwargs: Any):
+        index = self._acquire()
+        try:
+            async with self.backends[index].request_stream(*args, **kwargs) as stream:
+                yield stream
+        finally:
+            self._release(index)
@@ -1,18 +1,228 @@
+import hashlib
+import json
 import subprocess
+import threading
 import time
 import requests
 import os
+import shutil
 import sys
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse
+
+from metrics import metrics
+import tracing
+
+# Verificar localmente el sha256 de cada capa descargada (además de la
+# verificación que hace el propio servidor). Solo aplica si los blobs son
+# accesibles desde este proceso.
+verify_digests = os.getenv('OLLAMA_VERIFY_DIGESTS', 'false').lower() == 'true'
+
+# Pool de servidores: N procesos ``ollama serve`` en puertos consecutivos a
+# partir del de OLLAMA_BASE_URL, cada uno fijado a su propio grupo de CPUs.
+pool_size = int(os.getenv('OLLAMA_POOL_SIZE', '1'))
+pool_pin_cpus = os.getenv('OLLAMA_POOL_PIN_CPUS', 'true').lower() == 'true'
+pool_check_interval = float(os.getenv('OLLAMA_POOL_CHECK_INTERVAL', '5'))
+# Espera máxima entre reintentos de una instancia que no consigue arrancar
+POOL_RESTART_MAX_BACKOFF = 300.0
+
+
+def _error_message(response: requests.Response) -> str:
+    try:
+        return response.json()["error"]
+    except (ValueError, KeyError, TypeError):
+        return f"HTTP {response.status_code}: {response.text.strip()}"
+
+
+_TASKSET = shutil.which("taskset")
+
+
+def _blobs_dir() -> str:
+    models_dir = os.getenv('OLLAMA_MODELS', os.path.join(os.path.expanduser('~'), '.ollama', 'models'))
+    return os.path.join(models_dir, 'blobs')
+
+
+class PullError(RuntimeError):
+    """Error informado por el servidor (modelo inexistente, sin espacio...); no se reintenta."""
+
+
+class DigestMismatch(ValueError):
+    """Una capa no coincide con su digest; al reintentar se vuelve a descargar."""
+
+
+class PullJob:
+    """Descarga de un modelo vía el endpoint en streaming ``/api/pull``.
+
+    Sigue el progreso de cada capa, reintenta con backoff si la conexión se
+    corta (Ollama conserva las capas parciales y reanuda desde donde quedó) o
+    si un digest no coincide, y comprueba que el servidor haya verificado los
+    digests antes de dar la descarga por buena. Los errores que informa el
+    servidor fallan de inmediato.
+    """
+
+    PENDING = "pending"
+    PULLING = "pulling"
+    VERIFYING = "verifying"
+    SUCCESS = "success"
+    ERROR = "error"
+
+    def __init__(self, manager: "OllamaManager", model_name: str,
+                 max_attempts: int = 5, read_timeout: float = 300.0):
+        self.manager = manager
+        self.model_name = model_name
+        self.max_attempts = max_attempts
+        self.read_timeout = read_timeout
+        self.state = self.PENDING
+        self.status_message = ""
+        self.error: Optional[str] = None
+        self.attempts = 0
+        self.layers: Dict[str, Dict[str, int]] = {}
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self._verified_by_server = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name=f"ollama-pull-{model_name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine la descarga. Devuelve True si terminó."""
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def progress(self) -> float:
+        """Fracción descargada (0-1) sumando todas las capas conocidas."""
+        with self._lock:
+            total = sum(layer["total"] for layer in self.layers.values())
+            completed = sum(layer["completed"] for layer in self.layers.values())
+        if self.state == self.SUCCESS:
+            return 1.0
+        return completed / total if total else 0.0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            layers = {digest: dict(layer) for digest, layer in self.layers.items()}
+        return {
+            "model": self.model_name,
+            "state": self.state,
+            "status": self.status_message,
+            "progress": self.progress(),
+            "attempts": self.attempts,
+            "layers": layers,
+            "error": self.error,
+            "elapsed": (self.finished_at or time.time()) - self.started_at,
+        }
+
+    def describe(self) -> str:
+        mb_done = sum(l["completed"] for l in self.layers.values()) / 1e6
+        mb_total = sum(l["total"] for l in self.layers.values()) / 1e6
+        return (f"{self.model_name}: {self.status_message or self.state} "
+                f"{self.progress():.0%} ({mb_done:.0f}/{mb_total:.0f} MB)")
+
+    def _run(self):
+        try:
+            while True:
+                self.attempts += 1
+                try:
+                    self._stream_pull()
+                    self._verify()
+                    self.state = self.SUCCESS
+                    return
+                except (requests.RequestException, DigestMismatch) as e:
+                    if self.attempts >= self.max_attempts:
+                        raise
+                    delay = min(2 ** self.attempts, 60)
+                    self.status_message = f"conexión interrumpida, reanudando en {delay}s"
+                    print(f"⚠️  Descarga de '{self.model_name}' interrumpida ({e}); "
+                          f"reanudando en {delay}s (intento {self.attempts + 1}/{self.max_attempts})")
+                    time.sleep(delay)
+        except Exception as e:
+            self.state = self.ERROR
+            self.error = str(e)
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    def _stream_pull(self):
+        self.state = self.PULLING
+        with requests.post(
+            f"{self.manager.base_url}/api/pull",
+            json={"model": self.model_name, "stream": True},
+            stream=True,
+            timeout=(10, self.read_timeout),
+        ) as response:
+            if 400 <= response.status_code < 500:
+                raise PullError(_error_message(response))
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    if "digest mismatch" in event["error"]:
+                        # Ollama descarta la capa corrupta; reintentar la vuelve a descargar
+                        raise DigestMismatch(event["error"])
+                    raise PullError(event["error"])
+                self._handle_event(event)
+                if event.get("status") == "success":
+                    return
+        raise requests.ConnectionError("stream closed before 'success'")
+
+    def _handle_event(self, event: dict):
+        status = event.get("status", "")
+        self.status_message = status
+        digest = event.get("digest")
+        if digest and "total" in event:
+            with self._lock:
+                self.layers[digest] = {
+                    "total": int(event.get("total", 0)),
+                    "completed": int(event.get("completed", 0)),
+                }
+        if status.startswith("verifying"):
+            self.state = self.VERIFYING
+            self._verified_by_server = True
+
+    def _verify(self):
+        """Comprueba los digests: el servidor debe haberlos verificado y,
+        opcionalmente, se recalcula el sha256 de cada blob local."""
+        if self.layers and not self._verified_by_server:
+            raise DigestMismatch("el servidor no verificó los digests de las capas")
+        if not verify_digests:
+            return
+        self.state = self.VERIFYING
+        for digest in list(self.layers):
+            path = os.path.join(_blobs_dir(), digest.replace(":", "-"))
+            if not os.path.exists(path):
+                continue
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(chunk)
+            if f"sha256:{sha.hexdigest()}" != digest:
+                raise DigestMismatch(f"digest incorrecto en la capa {digest}")
+
 
 class OllamaManager:
     """Gestor del ciclo de vida del servidor Ollama y disponibilidad de modelos."""
 
-    def __init__(self, base_url: str = "http://localhost:11434", timeout: int = 30):
+    def __init__(self, base_url: str = "http://localhost:11434", timeout: int = 30,
+                 cpus: Optional[Set[int]] = None):
         self.base_url = base_url.rstrip('/')
         self.timeout = timeout
+        # CPUs a las que se fija el proceso del servidor (None = sin restricción)
+        self.cpus = cpus
         self.process: Optional[subprocess.Popen] = None
+        self._pull_jobs: Dict[str, "PullJob"] = {}
+        self._pull_lock = threading.Lock()
 
+    @tracing.traced("ollama.install")
     def _install_ollama_binary(self) -> bool:
         """Instala Ollama usando el script oficial (método comprobado para Codespaces).
         Basado en: https://github.com/BlackTechX011/Ollama-in-GitHub-Codespaces
@@ -50,6 +260,7 @@ class OllamaManager:
             print(f"❌ Error en instalación: {e}")
             return False
 
+    @tracing.traced("ollama.setup")
     def _run_setup_if_needed(self) -> bool:
         """Ejecuta la instalación automática si Ollama no está disponible."""
         try:
@@ -86,6 +297,7 @@ class OllamaManager:
         print("📋 Instala manualmente: curl -fsSL https://ollama.com/install.sh | sh")
         return False
 
+    @tracing.traced("ollama.is_running")
     def is_running(self) -> bool:
         """Check if Ollama server is running."""
         try:
@@ -94,6 +306,7 @@ class OllamaManager:
         except requests.RequestException:
             return False
 
+    @tracing.traced("ollama.start_server")
     def start_server(self) -> bool:
         """Inicia el servidor Ollama si no está ejecutándose."""
         if self.is_running():
@@ -101,13 +314,18 @@ class OllamaManager:
             return True
 
         try:
-            print("🖥️  Iniciando servidor Ollama...")
+            print(f"🖥️  Iniciando servidor Ollama en {self.base_url}...")
+            env = os.environ.copy()
+            env["OLLAMA_HOST"] = urlparse(self.base_url).netloc
             self.process = subprocess.Popen(
-                ["ollama", "serve"],
+                self._pinned(["ollama", "serve"]),
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
+                env=env,
                 start_new_session=True
             )
+            if self.cpus and not _TASKSET:
+                os.sched_setaffinity(self.process.pid, self.cpus)
 
             # Esperar a que el servidor inicie
             start_time = time.time()
@@ -134,6 +352,22 @@ class OllamaManager:
             print(f"❌ Error iniciando servidor Ollama: {e}")
             return False
 
+    def _pinned(self, command: List[str]) -> List[str]:
+        # Con taskset la afinidad se fija antes del exec, así que todos los
+        # hilos y el runner la heredan y dimensionan sus hilos según las CPUs
+        # visibles; sin él se fija tras el Popen (sin preexec_fn, que no es
+        # seguro desde los hilos que arrancan el pool)
+        if not self.cpus or not _TASKSET:
+            return command
+        if shutil.which(command[0]) is None:
+            raise FileNotFoundError(command[0])
+        return [_TASKSET, "-c", ",".join(str(cpu) for cpu in sorted(self.cpus))] + command
+
+    def process_exited(self) -> bool:
+        """True si el servidor que lanzamos ha terminado por su cuenta."""
+        return self.process is not None and self.process.poll() is not None
+
+    @tracing.traced("ollama.stop_server")
     def stop_server(self):
         """Stop the Ollama server if we started it."""
         if self.process:
@@ -152,6 +386,7 @@ class OllamaManager:
             finally:
                 self.process = None
 
+    @tracing.traced("ollama.model_available")
     def model_available(self, model_name: str) -> bool:
         """Verifica si un modelo específico está disponible."""
         try:
@@ -163,45 +398,47 @@ class OllamaManager:
         except requests.RequestException:
             return False
 
+    @tracing.traced("ollama.pull_model")
     def pull_model(self, model_name: str) -> bool:
-        """Descarga un modelo si no está disponible."""
+        """Descarga un modelo si no está disponible, mostrando el progreso por capa."""
         if self.model_available(model_name):
             print(f"✅ Modelo '{model_name}' ya está disponible")
             return True
 
-        try:
-            print(f"📥 Descargando modelo '{model_name}'...")
-            print("⏳ Esto puede tomar varios minutos...")
-            result = subprocess.run(
-                ["ollama", "pull", model_name],
-                capture_output=True,
-                text=True,
-                timeout=600  # 10 minutos
-            )
+        print(f"📥 Descargando modelo '{model_name}'...")
+        job = self.pull_model_async(model_name)
+        last_report = 0.0
+        while not job.wait(timeout=2):
+            if time.time() - last_report >= 10:
+                print(f"   {job.describe()}")
+                last_report = time.time()
 
-            if result.returncode == 0:
-                print(f"✅ Modelo '{model_name}' descargado correctamente")
-                return True
-            else:
-                print(f"❌ Error descargando modelo '{model_name}': {result.stderr}")
-                return False
+        if job.state == PullJob.SUCCESS:
+            print(f"✅ Modelo '{model_name}' descargado correctamente")
+            return True
+        print(f"❌ Error descargando modelo '{model_name}': {job.error}")
+        return False
 
-        except subprocess.TimeoutExpired:
-            print(f"⏰ Tiempo agotado descargando modelo '{model_name}'")
-            return False
-        except FileNotFoundError:
-            print("❌ Comando 'ollama' no encontrado. Intentando instalación automática...")
-            if self._run_setup_if_needed():
-                # Reintentar después de la instalación
-                return self.pull_model(model_name)
-            else:
-                print("❌ Instalación automática falló")
-                print("📋 Instala manualmente: curl -fsSL https://ollama.com/install.sh | sh")
-                return False
-        except Exception as e:
-            print(f"❌ Error descargando modelo: {e}")
-            return False
+    def pull_model_async(self, model_name: str) -> "PullJob":
+        """Inicia (o reutiliza) la descarga en segundo plano de un modelo.
 
+        Descargas de modelos distintos avanzan en paralelo; pedir un modelo que
+        ya se está descargando devuelve el mismo trabajo.
+        """
+        with self._pull_lock:
+            job = self._pull_jobs.get(model_name)
+            if job is None or job.state in (PullJob.SUCCESS, PullJob.ERROR):
+                job = PullJob(self, model_name)
+                self._pull_jobs[model_name] = job
+                job.start()
+            return job
+
+    def pull_status(self) -> dict:
+        """Estado de las descargas conocidas, por modelo."""
+        with self._pull_lock:
+            return {name: job.snapshot() for name, job in self._pull_jobs.items()}
+
+    @tracing.traced("ollama.ensure_ready")
     def ensure_ready(self, model_name: str) -> bool:
         """Asegura que el servidor Ollama esté ejecutándose y el modelo disponible."""
         print(f"\n🤖 Preparando Ollama con modelo '{model_name}'...")
@@ -215,8 +452,140 @@ class OllamaManager:
         print("✅ Ollama listo para usar\n")
         return True
 
+
+def _split_cpus(size: int) -> List[Optional[Set[int]]]:
+    """Reparte las CPUs disponibles en ``size`` grupos contiguos del mismo tamaño."""
+    if not hasattr(os, "sched_getaffinity"):
+        return [None] * size
+    cpus = sorted(os.sched_getaffinity(0))
+    per_instance = len(cpus) // size
+    if per_instance == 0:
+        return [None] * size
+    return [set(cpus[i * per_instance:(i + 1) * per_instance]) for i in range(size)]
+
+
+class OllamaPool:
+    """Varios servidores Ollama supervisados, uno por puerto.
+
+    La instancia 0 es el gestor de ``base_url``; las demás escuchan en los
+    puertos siguientes. Todas comparten el directorio de modelos, así que un
+    modelo descargado en una está disponible en todas. Un hilo supervisor
+    relanza las instancias que gestiona el pool (las que no estaban ya
+    corriendo por fuera) si su proceso termina o si un arranque falló, con
+    espera exponencial entre intentos. Cada relanzamiento va en su propio
+    hilo para no frenar la supervisión de las demás.
+    """
+
+    def __init__(self, base: OllamaManager, size: int, pin_cpus: bool = True,
+                 check_interval: float = 5.0):
+        parsed = urlparse(base.base_url)
+        cpu_sets = _split_cpus(size) if pin_cpus else [None] * size
+        self.instances: List[OllamaManager] = [base]
+        for i in range(1, size):
+            url = f"{parsed.scheme}://{parsed.hostname}:{(parsed.port or 11434) + i}"
+            self.instances.append(OllamaManager(url, base.timeout))
+        for instance, cpus in zip(self.instances, cpu_sets):
+            instance.cpus = cpus
+        self.check_interval = check_interval
+        self.restarts = [0] * size
+        self._healthy = [False] * size
+        self._owned = [True] * size
+        self._failures = [0] * size
+        self._retry_at = [0.0] * size
+        self._restarting: Set[int] = set()
+        self._stop = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [instance.base_url for instance in self.instances]
+
+    def is_healthy(self, index: int) -> bool:
+        return self._healthy[index]
+
+    def _set_healthy(self, index: int, healthy: bool):
+        self._healthy[index] = healthy
+        metrics.set_gauge("ollama_pool_healthy", 1.0 if healthy else 0.0,
+                          {"instance": self.instances[index].base_url})
+
+    @tracing.traced("ollama.pool.start")
+    def start(self) -> bool:
+        """Arranca todas las instancias en paralelo y el supervisor; True si alguna responde."""
+        with ThreadPoolExecutor(max_workers=len(self.instances)) as pool:
+            started = list(pool.map(lambda instance: instance.start_server(), self.instances))
+        for index, ok in enumerate(started):
+            self._set_healthy(index, ok)
+            # Arrancada sin proceso propio: ya corría fuera del pool
+            self._owned[index] = not (ok and self.instances[index].process is None)
+            self._failures[index] = 0 if ok else 1
+            self._retry_at[index] = time.monotonic() + (0.0 if ok else self._backoff(index))
+        if self._supervisor is None:
+            self._supervisor = threading.Thread(
+                target=self._supervise, name="ollama-pool-supervisor", daemon=True)
+            self._supervisor.start()
+        print(f"🧩 Pool de Ollama: {sum(started)}/{len(started)} instancias activas")
+        return any(started)
+
+    def _supervise(self):
+        while not self._stop.wait(self.check_interval):
+            for index in range(len(self.instances)):
+                self._check(index)
+
+    def _check(self, index: int):
+        instance = self.instances[index]
+        if index in self._restarting:
+            return
+        if instance.process_exited():
+            code = instance.process.returncode
+            instance.process = None
+            self._failures[index] = 0
+            self._retry_at[index] = 0.0
+            print(f"♻️  Instancia {instance.base_url} terminó (código {code}); reiniciando")
+        elif not (self._owned[index] and instance.process is None):
+            self._set_healthy(index, instance.is_running())
+            return
+        # Caída, o su último arranque falló
+        self._set_healthy(index, False)
+        if time.monotonic() >= self._retry_at[index]:
+            self._restart(index)
+
+    def _backoff(self, index: int) -> float:
+        return min(self.check_interval * 2 ** self._failures[index], POOL_RESTART_MAX_BACKOFF)
+
+    def _restart(self, index: int):
+        instance = self.instances[index]
+        self._restarting.add(index)
+        self.restarts[index] += 1
+        metrics.inc("ollama_pool_restarts_total", 1, {"instance": instance.base_url})
+
+        def run():
+            try:
+                ok = instance.start_server()
+                if self._stop.is_set():
+                    instance.stop_server()
+                    ok = False
+                if ok:
+                    self._failures[index] = 0
+                else:
+                    self._failures[index] += 1
+                    self._retry_at[index] = time.monotonic() + self._backoff(index)
+                self._set_healthy(index, ok)
+            finally:
+                self._restarting.discard(index)
+
+        threading.Thread(target=run, name=f"ollama-pool-restart-{index}", daemon=True).start()
+
+    def stop(self):
+        """Detiene el supervisor y los servidores que lanzó el pool."""
+        self._stop.set()
+        for index, instance in enumerate(self.instances):
+            instance.stop_server()
+            self._set_healthy(index, False)
+
+
 # Instancia global del gestor
 _manager = None
+_pool = None
 
 def get_ollama_manager(base_url: str = "http://localhost:11434") -> OllamaManager:
     """Obtiene o crea la instancia global del gestor Ollama."""
@@ -225,6 +594,16 @@ def get_ollama_manager(base_url: str = "http://localhost:11434") -> OllamaManage
         _manager = OllamaManager(base_url)
     return _manager
 
+def get_ollama_pool(base_url: str = "http://localhost:11434") -> Optional[OllamaPool]:
+    """Obtiene el pool global si ``OLLAMA_POOL_SIZE`` > 1 (sin arrancarlo)."""
+    global _pool
+    if pool_size <= 1:
+        return None
+    if _pool is None:
+        _pool = OllamaPool(get_ollama_manager(base_url), pool_size,
+                           pin_cpus=pool_pin_cpus, check_interval=pool_check_interval)
+    return _pool
+
 def ensure_ollama_ready(model_name: str, base_url: str = "http://localhost:11434") -> bool:
     """Función de conveniencia para asegurar que Ollama esté listo con el modelo especificado."""
     manager = get_ollama_manager(base_url)
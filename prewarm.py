@@ -0,0 +1,224 @@
+"""Speculative prefetch and prompt pre-warming when a customer session opens.
+
+Between opening a customer and the first message the session is idle, so
+``start_prewarm`` spends that time, in a background thread, on what the first
+reply would otherwise pay for:
+
+* prefetch: the customer's most recent orders (and the all-orders bulk view)
+  are looked up through the tools' own code path into the conversation's tool
+  cache, so the first tool calls of the reply are cache hits;
+* context: the customer context is rendered and memoized
+  (``support_system.customer_context``);
+* prefill: one request with the same system prompt, tool schemas and customer
+  context as a real run, limited to a single output token, so a provider with
+  prefix caching (OpenAI, the llama.cpp KV cache behind Ollama) already holds
+  the prompt and the first reply only prefills the user turn.
+
+The prefill request is built by the agent itself (the model is wrapped in one
+that stops the run after its first request), so its prefix is byte-identical
+to the one the reply will send. It waits for a scheduler slot at the lowest
+priority (``basic``), so real replies go first. It is skipped while the local
+model is still starting, under the cascade until a reply has started the
+small tier, and in cassette record/replay mode.
+
+Each prewarm has its own ``CancelToken``; switching the session to another
+customer cancels it, including a prefill still queued for a slot.
+
+First-reply latency is recorded in ``first_reply_seconds`` labeled by the
+prewarm state when the question was sent (``off``, ``pending`` or ``done``);
+``bench_agent.py --prewarm`` compares both paths.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from pydantic_ai.models.wrapper import WrapperModel
+
+import cancellation
+import data_source
+import replay_model
+import support_system
+import tracing
+from metrics import metrics
+from scheduler import get_scheduler, scheduler_enabled
+from support_system import CustomerDetails, customer_context, order_status_lookup, orders_status_lookup
+from tool_cache import ToolResultCache, conversation_cache
+
+session_prewarm = os.getenv('SESSION_PREWARM', 'true').lower() == 'true'
+# Petición de prefill (1 token de salida) para calentar la caché de prefijo del proveedor
+session_prefill = os.getenv('SESSION_PREFILL', 'true').lower() == 'true'
+# Pedidos más recientes cuyo estado se precarga en la caché de herramientas
+prefetch_orders = int(os.getenv('SESSION_PREFETCH_ORDERS', '5'))
+prewarm_timeout = float(os.getenv('SESSION_PREWARM_TIMEOUT', '30'))
+
+# The user turn is not part of the shared prefix; any short text will do
+PREFILL_PROMPT = "Hello"
+
+
+class _Prefilled(Exception):
+    """Stops the agent run once the prefill request has been answered."""
+
+    def __init__(self, response: Any):
+        super().__init__("prefill done")
+        self.response = response
+
+
+class PrefillModel(WrapperModel):
+    """Sends the run's first request with a one-token output limit, then stops the run."""
+
+    async def request(self, messages, model_settings, model_request_parameters, *args, **kwargs):
+        settings = {**(model_settings or {}), "max_tokens": 1}
+        response = await super().request(messages, settings, model_request_parameters, *args, **kwargs)
+        raise _Prefilled(response)
+
+
+class SessionPrewarm:
+    """Speculative work started when a session opens a customer."""
+
+    def __init__(self, customer_id: str):
+        self.customer_id = customer_id
+        self.done = threading.Event()
+        self.prefetched = 0
+        self.prefilled = False
+        self.prefill_usage: Optional[Dict[str, int]] = None
+        self.timings: Dict[str, float] = {}
+        self.error: Optional[Exception] = None
+        self.token = cancellation.CancelToken()
+
+    @property
+    def state(self) -> str:
+        return "done" if self.done.is_set() else "pending"
+
+    def cancel(self, reason: str = "customer_changed"):
+        """Abandon the speculative work (the session moved on)."""
+        self.token.cancel(reason)
+
+
+def prefill_available() -> bool:
+    """A prefill only helps (and only works) against a live model; never blocks."""
+    return (replay_model.cassette_mode == 'off' and support_system.model_ready()
+            and _entry_model() is not None)
+
+
+def _entry_model():
+    """The model the first reply will run on, or None if it is not initialized yet.
+
+    Under the cascade that is the small tier, which is not started from here
+    (that may pull the model and start its server).
+    """
+    from cascade import cascade_enabled, ready_first_model
+
+    return ready_first_model() if cascade_enabled else support_system.agent.model
+
+
+async def prefetch(customer: CustomerDetails, limit: int = prefetch_orders) -> int:
+    """Warm the active tool cache with the customer's order lookups; returns how many."""
+    recent = sorted(customer.orders or [], key=lambda o: o.order_date, reverse=True)[:limit]
+    lookups = [("get_order_and_shipping_status", order_status_lookup(customer, None))]
+    lookups += [("get_order_and_shipping_status", order_status_lookup(customer, order.order_id))
+                for order in recent]
+    if support_system.bulk_order_tool and customer.orders:
+        lookups.append(("get_orders_status", orders_status_lookup(customer)))
+    results = await asyncio.gather(
+        *(data_source.with_timeout(name, lookup) for name, lookup in lookups), return_exceptions=True)
+    return sum(1 for result in results if isinstance(result, dict) and result.get("status") == "success")
+
+
+async def prefill(customer: CustomerDetails, model: Any) -> Dict[str, int]:
+    """Send the prompt prefix of a run for ``customer``; returns the request's token usage."""
+    try:
+        await support_system.agent.run(PREFILL_PROMPT, deps=customer, model=PrefillModel(model))
+    except _Prefilled as done:
+        usage = done.response.usage
+        return {"input_tokens": usage.input_tokens or 0, "cached_tokens": usage.cache_read_tokens or 0}
+    raise RuntimeError("prefill run finished without a model request")
+
+
+async def _bounded_prefill(customer: CustomerDetails, model: Any) -> Dict[str, int]:
+    return await asyncio.wait_for(prefill(customer, model), prewarm_timeout)
+
+
+def _scheduled_prefill(customer: CustomerDetails) -> Optional[Dict[str, int]]:
+    """Blocking: prefill on the entry model behind real replies; None if it is not initialized."""
+    model = _entry_model()
+    if model is None:
+        return None
+    if scheduler_enabled:
+        return get_scheduler(support_system.model_backend).run(
+            "basic", cancellation.run_sync, _bounded_prefill, customer, model)
+    return cancellation.run_sync(_bounded_prefill, customer, model)
+
+
+async def _prewarm(handle: SessionPrewarm, customer: CustomerDetails, with_prefill: bool):
+    async def timed(stage: str, awaitable):
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            handle.timings[stage] = time.perf_counter() - start
+            metrics.observe("session_prewarm_seconds", handle.timings[stage], {"stage": stage})
+
+    start = time.perf_counter()
+    customer_context(customer)
+    handle.timings["context"] = time.perf_counter() - start
+    stages = [timed("prefetch", prefetch(customer))]
+    if with_prefill:
+        # Queued in its own thread so the prefetch is not held up meanwhile
+        stages.append(timed("prefill", asyncio.to_thread(_scheduled_prefill, customer)))
+    results = await asyncio.gather(*stages, return_exceptions=True)
+    if isinstance(results[0], Exception):
+        raise results[0]
+    handle.prefetched = results[0]
+    if with_prefill:
+        if isinstance(results[1], Exception):
+            # The reply will simply prefill the whole prompt itself
+            metrics.inc("session_prefill_failures_total")
+            print(f"⚠️ Prefill de la sesión fallido: {results[1]!r}")
+        elif results[1] is not None:
+            handle.prefilled = True
+            handle.prefill_usage = results[1]
+
+
+def prewarm_session(customer: CustomerDetails, cache: ToolResultCache,
+                    with_prefill: bool = session_prefill) -> SessionPrewarm:
+    """Run the speculative work for ``customer`` in this thread and return its outcome."""
+    handle = SessionPrewarm(customer.customer_id)
+    _run(handle, customer, cache, with_prefill)
+    return handle
+
+
+def start_prewarm(customer: CustomerDetails, cache: ToolResultCache,
+                  with_prefill: bool = session_prefill) -> SessionPrewarm:
+    """Start the speculative work for ``customer`` in the background."""
+    handle = SessionPrewarm(customer.customer_id)
+    threading.Thread(target=_run, args=(handle, customer, cache, with_prefill),
+                     name="session-prewarm", daemon=True).start()
+    return handle
+
+
+def _run(handle: SessionPrewarm, customer: CustomerDetails, cache: ToolResultCache, with_prefill: bool):
+    with_prefill = with_prefill and prefill_available()
+    start = time.perf_counter()
+    try:
+        with tracing.span("session.prewarm", customer_id=customer.customer_id, prefill=with_prefill) as span, \
+                conversation_cache(cache), cancellation.scope(handle.token):
+            cancellation.run_sync(_prewarm, handle, customer, with_prefill)
+            span.set_attribute("prefetched", handle.prefetched)
+        metrics.inc("session_prewarm_total", 1, {"prefill": str(handle.prefilled).lower()})
+    except cancellation.RunCancelled as e:
+        handle.error = e
+        metrics.inc("session_prewarm_cancelled_total")
+    except Exception as e:
+        handle.error = e
+        metrics.inc("session_prewarm_failures_total")
+        print(f"⚠️ Precalentamiento de la sesión fallido: {e!r}")
+    finally:
+        handle.timings["total"] = time.perf_counter() - start
+        handle.done.set()
+
+
+def record_first_reply(state: str, seconds: float):
+    """Latency of a session's first reply, by prewarm state when it was asked."""
+    metrics.observe("first_reply_seconds", seconds, {"prewarm": state})
@@ -0,0 +1,291 @@
+"""Process-wide read-through cache of customer profiles.
+
+Sessions that open the same customer share one ``CustomerDetails`` object
+instead of each loading and holding its own copy. Cached profiles are
+immutable (frozen models): a change to a customer goes through ``replace``
+with an updated copy, or ``invalidate``; both bump the customer's version so
+the next read gets the new object (sessions still holding the old one keep a
+consistent snapshot).
+
+* LRU eviction by size: each entry is charged the size of its JSON
+  serialization and the least recently used entries are evicted once the
+  total exceeds ``PROFILE_CACHE_MAX_BYTES``.
+* Optional second tier (``PROFILE_CACHE_DB``): a SQLite file shared by
+  every worker process. Misses are served from it before calling the
+  loader, and versions live there too, so an invalidation in one process
+  is seen by the others within ``PROFILE_CACHE_RECHECK`` seconds.
+
+Hit rate and resident bytes are reported by ``stats`` and the metrics.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from metrics import metrics
+
+profile_cache_max_bytes = int(os.getenv('PROFILE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# Archivo SQLite compartido entre procesos; vacío = solo caché en memoria
+PROFILE_CACHE_DB = os.getenv('PROFILE_CACHE_DB', '')
+profile_cache_recheck = float(os.getenv('PROFILE_CACHE_RECHECK', '1.0'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profile_versions (
+    customer_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    customer_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    stored_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteProfileStore:
+    """Cross-process tier: serialized profiles and the authoritative versions."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Short-lived connection; one per call keeps the store thread-safe."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def version(self, customer_id: str) -> int:
+        with self.connect() as conn:
+            row = conn.execute("SELECT version FROM profile_versions WHERE customer_id = ?",
+                               (customer_id,)).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, customer_id: str) -> int:
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO profile_versions (customer_id, version) VALUES (?, 1) "
+                "ON CONFLICT(customer_id) DO UPDATE SET version = version + 1", (customer_id,))
+            conn.execute("DELETE FROM profiles WHERE customer_id = ?", (customer_id,))
+            version = conn.execute("SELECT version FROM profile_versions WHERE customer_id = ?",
+                                   (customer_id,)).fetchone()[0]
+            conn.execute("COMMIT")
+        return version
+
+    def get(self, customer_id: str) -> Optional[Tuple[int, str]]:
+        """``(version, json)`` of the stored profile if it is the current version."""
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT p.version, p.data FROM profiles p "
+                "LEFT JOIN profile_versions v ON v.customer_id = p.customer_id "
+                "WHERE p.customer_id = ? AND p.version = COALESCE(v.version, 0)",
+                (customer_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, customer_id: str, version: int, data: str):
+        # A reader that loaded before an update must not overwrite the newer profile
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO profiles (customer_id, version, data, stored_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(customer_id) DO UPDATE SET version = excluded.version, data = excluded.data, "
+                "stored_at = excluded.stored_at WHERE excluded.version >= profiles.version",
+                (customer_id, version, data, time.time()))
+
+    def replace(self, customer_id: str, data: str) -> int:
+        """Bump the version and store ``data`` as that version, atomically."""
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO profile_versions (customer_id, version) VALUES (?, 1) "
+                "ON CONFLICT(customer_id) DO UPDATE SET version = version + 1", (customer_id,))
+            version = conn.execute("SELECT version FROM profile_versions WHERE customer_id = ?",
+                                   (customer_id,)).fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO profiles (customer_id, version, data, stored_at) "
+                         "VALUES (?, ?, ?, ?)", (customer_id, version, data, time.time()))
+            conn.execute("COMMIT")
+        return version
+
+
+class _Entry:
+    __slots__ = ("profile", "version", "size", "checked_at")
+
+    def __init__(self, profile: BaseModel, version: int, size: int):
+        self.profile = profile
+        self.version = version
+        self.size = size
+        self.checked_at = time.monotonic()
+
+
+class ProfileCache:
+    """Read-through LRU of immutable profiles, bounded by total size in bytes."""
+
+    def __init__(self, model_type: Type[BaseModel], max_bytes: int = 64 * 1024 * 1024,
+                 store: Optional[SQLiteProfileStore] = None, recheck: float = 1.0):
+        self.model_type = model_type
+        self.max_bytes = max_bytes
+        self.store = store
+        self.recheck = recheck
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _version(self, customer_id: str) -> int:
+        if self.store is not None:
+            return self.store.version(customer_id)
+        return self._versions.get(customer_id, 0)
+
+    def _cached(self, customer_id: str) -> Optional[BaseModel]:
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is None:
+                return None
+            stale_check = self.store is not None and time.monotonic() - entry.checked_at > self.recheck
+        if stale_check:
+            # Another process may have invalidated it
+            current = self.store.version(customer_id)
+            with self._lock:
+                if current != entry.version:
+                    self._drop(customer_id)
+                    return None
+                entry.checked_at = time.monotonic()
+        with self._lock:
+            if self._entries.get(customer_id) is not entry:
+                return None
+            self._entries.move_to_end(customer_id)
+            self.hits += 1
+        metrics.inc("profile_cache_hits_total", labels={"tier": "memory"})
+        return entry.profile
+
+    def get(self, customer_id: str, load: Callable[[], Optional[BaseModel]]) -> Optional[BaseModel]:
+        """The cached profile, else the shared tier, else ``load()`` (then cached)."""
+        profile = self._cached(customer_id)
+        if profile is not None:
+            return profile
+
+        version = self._version(customer_id)
+        stored = self.store.get(customer_id) if self.store is not None else None
+        if stored is not None:
+            version, data = stored
+            profile = self.model_type.model_validate_json(data)
+            with self._lock:
+                self.store_hits += 1
+            metrics.inc("profile_cache_hits_total", labels={"tier": "sqlite"})
+        else:
+            profile = load()
+            if profile is None:
+                return None
+            data = profile.model_dump_json()
+            if self.store is not None:
+                self.store.put(customer_id, version, data)
+            with self._lock:
+                self.misses += 1
+            metrics.inc("profile_cache_misses_total")
+        self._insert(customer_id, profile, version, len(data))
+        return profile
+
+    def _insert(self, customer_id: str, profile: BaseModel, version: int, size: int):
+        with self._lock:
+            if self._version_changed(customer_id, version):
+                # Invalidated while loading: serve it once but don't cache it
+                return
+            self._store_entry(customer_id, profile, version, size)
+
+    def _store_entry(self, customer_id: str, profile: BaseModel, version: int, size: int):
+        # Called with the lock held
+        self._drop(customer_id)
+        self._entries[customer_id] = _Entry(profile, version, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+            metrics.inc("profile_cache_evictions_total")
+        metrics.set_gauge("profile_cache_bytes", self.bytes)
+        metrics.set_gauge("profile_cache_entries", len(self._entries))
+
+    def _version_changed(self, customer_id: str, version: int) -> bool:
+        return self.store is None and self._versions.get(customer_id, 0) != version
+
+    def _drop(self, customer_id: str):
+        entry = self._entries.pop(customer_id, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def invalidate(self, customer_id: str) -> int:
+        """Bump the customer's version (in every process when shared); returns it."""
+        if self.store is not None:
+            version = self.store.bump(customer_id)
+        with self._lock:
+            if self.store is None:
+                version = self._versions[customer_id] = self._versions.get(customer_id, 0) + 1
+            self._drop(customer_id)
+            metrics.set_gauge("profile_cache_bytes", self.bytes)
+            metrics.set_gauge("profile_cache_entries", len(self._entries))
+        metrics.inc("profile_cache_invalidations_total")
+        return version
+
+    def replace(self, customer_id: str, profile: BaseModel) -> int:
+        """Copy-on-write update: ``profile`` becomes the customer's current version.
+
+        Readers holding the previous object keep it unchanged; the next ``get``
+        in any process returns ``profile``. Without the shared tier the new
+        profile lives only in this cache, so the loader's source must be
+        updated too for it to survive an eviction.
+        """
+        data = profile.model_dump_json()
+        if self.store is not None:
+            version = self.store.replace(customer_id, data)
+        with self._lock:
+            if self.store is None:
+                version = self._versions[customer_id] = self._versions.get(customer_id, 0) + 1
+            self._store_entry(customer_id, profile, version, len(data))
+        metrics.inc("profile_cache_invalidations_total")
+        return version
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.store_hits + self.misses
+            return {
+                "hits": self.hits,
+                "store_hits": self.store_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.store_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+# Caché global de perfiles
+_profile_cache = None
+_profile_cache_lock = threading.Lock()
+
+
+def get_profile_cache() -> ProfileCache:
+    """Obtiene o crea la caché global de perfiles de cliente."""
+    global _profile_cache
+    with _profile_cache_lock:
+        if _profile_cache is None:
+            from support_system import CustomerDetails
+            store = SQLiteProfileStore(PROFILE_CACHE_DB) if PROFILE_CACHE_DB else None
+            _profile_cache = ProfileCache(CustomerDetails, profile_cache_max_bytes, store,
+                                          profile_cache_recheck)
+        return _profile_cache
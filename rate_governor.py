@@ -0,0 +1,315 @@
+"""Adaptive rate-limit governor for OpenAI-compatible endpoints.
+
+Hosted endpoints (GitHub Models, OpenAI) throttle with HTTP 429. Instead of
+letting every 429 fail or burn a retry, ``GovernedModel`` admits requests
+through a per-endpoint ``RateGovernor``:
+
+* token buckets for requests/min and tokens/min; a request takes one request
+  token and an estimate of its tokens (prompt characters / 4 plus the output
+  allowance), corrected with the real usage once the response arrives;
+* AIMD concurrency: the in-flight limit grows by ~1 per window of successful
+  requests and is halved on every 429;
+* a 429 pauses the whole endpoint for its ``Retry-After`` (or an exponential
+  backoff) and the request is retried after the pause;
+* other transient failures (connection errors, timeouts, 408/409/5xx) are
+  retried with exponential backoff without touching the limit, as the
+  OpenAI client would (its own retries are off, or they would retry 429s
+  behind the governor's back);
+* callers beyond any limit wait in FIFO order instead of failing.
+
+Limits come from ``RATE_LIMIT_RPM``/``RATE_LIMIT_TPM`` or, per endpoint host,
+from ``RATE_LIMITS`` (JSON, e.g. ``{"models.github.ai": {"rpm": 15, "tpm": 150000}}``).
+Throttle events, queueing, the concurrency limit and the effective
+throughput are exported through ``metrics``.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from openai import APIConnectionError
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.models.wrapper import WrapperModel
+
+from metrics import metrics
+
+rate_governor_enabled = os.getenv('RATE_GOVERNOR_ENABLED', 'true').lower() == 'true'
+DEFAULT_RPM = float(os.getenv('RATE_LIMIT_RPM', '0'))
+DEFAULT_TPM = float(os.getenv('RATE_LIMIT_TPM', '0'))
+ENDPOINT_LIMITS: Dict[str, Dict[str, float]] = json.loads(os.getenv('RATE_LIMITS', '{}'))
+max_concurrency = int(os.getenv('RATE_LIMIT_MAX_CONCURRENCY', '8'))
+max_throttle_retries = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '5'))
+# Reintentos de errores de conexión, timeouts y 5xx (los mismos que el cliente de OpenAI)
+max_transient_retries = int(os.getenv('RATE_LIMIT_TRANSIENT_RETRIES', '2'))
+# Tokens reserved for the answer when the request does not set max_tokens
+DEFAULT_OUTPUT_ALLOWANCE = 512
+# Pause after a 429 even when Retry-After is 0, so the endpoint is not hammered
+MIN_THROTTLE_PAUSE = 0.25
+# Status codes the OpenAI client retries besides 429
+TRANSIENT_STATUS_CODES = {408, 409}
+TRANSIENT_BACKOFF = 0.5
+TRANSIENT_MAX_BACKOFF = 8.0
+
+
+class TokenBucket:
+    """Continuously refilled bucket; ``rate_per_minute`` <= 0 means unlimited."""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.rate = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 if they are now)."""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        # A request larger than the bucket waits for a full bucket, not forever
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount: float, now: float):
+        if not self.unlimited:
+            self._refill(now)
+            self.tokens -= amount
+
+    def adjust(self, delta: float):
+        """Correct a previous estimate (positive ``delta`` takes more tokens)."""
+        if not self.unlimited:
+            self.tokens -= delta
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """``Retry-After`` of a 429 raised by the OpenAI client (seconds or HTTP date)."""
+    response = getattr(error.__cause__, "response", None) or getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+            return seconds / 1000 if name == "retry-after-ms" else seconds
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                continue
+    return None
+
+
+class RateGovernor:
+    """Admission control for one endpoint."""
+
+    def __init__(self, endpoint: str, rpm: float, tpm: float, max_concurrency: int = 8):
+        self.endpoint = endpoint
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.limit = float(max(1, min(max_concurrency, 2)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self._lock = threading.Lock()
+        self._queue: Deque[int] = deque()
+        self._tickets = itertools.count()
+        self._completed: Deque[Tuple[float, int]] = deque()
+        self._labels = {"endpoint": endpoint}
+        metrics.set_gauge("rate_governor_concurrency_limit", self.limit, self._labels)
+
+    def _admission_delay(self, estimate: float, now: float) -> Optional[float]:
+        """Seconds to wait before admitting, or None if only a slot is missing."""
+        delay = max(self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimate, now))
+        if delay > 0:
+            return delay
+        return None if self.in_flight >= int(self.limit) else 0.0
+
+    async def acquire(self, estimate: float) -> float:
+        """Wait for admission in FIFO order; returns the time spent waiting."""
+        start = time.monotonic()
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            metrics.set_gauge("rate_governor_queue_depth", len(self._queue), self._labels)
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    delay = self._admission_delay(estimate, now) if self._queue[0] == ticket else 0.05
+                    if delay == 0.0:
+                        self._queue.popleft()
+                        self.requests.take(1, now)
+                        self.tokens.take(estimate, now)
+                        self.in_flight += 1
+                        break
+                await asyncio.sleep(min(delay or 0.05, 1.0))
+        except BaseException:
+            with self._lock:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+            raise
+        finally:
+            metrics.set_gauge("rate_governor_queue_depth", len(self._queue), self._labels)
+        waited = time.monotonic() - start
+        metrics.observe("rate_governor_wait_seconds", waited, self._labels)
+        return waited
+
+    def release(self, estimate: float, used_tokens: Optional[int]):
+        """Finish a successful request: settle the token estimate and grow the limit."""
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            self.consecutive_throttles = 0
+            if used_tokens is not None:
+                self.tokens.adjust(used_tokens - estimate)
+            # Additive increase: about +1 after a full window of successes
+            self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+            self._completed.append((now, used_tokens or 0))
+            while self._completed and now - self._completed[0][0] > 60:
+                self._completed.popleft()
+            throughput = sum(tokens for _, tokens in self._completed)
+            limit = self.limit
+        metrics.inc("rate_governor_requests_total", 1, self._labels)
+        metrics.inc("rate_governor_tokens_total", used_tokens or 0, self._labels)
+        metrics.set_gauge("rate_governor_tokens_per_minute", throughput, self._labels)
+        metrics.set_gauge("rate_governor_concurrency_limit", limit, self._labels)
+
+    def throttled(self, retry_after: Optional[float]) -> float:
+        """Record a 429: halve the limit and pause the endpoint. Returns the pause."""
+        with self._lock:
+            self.in_flight -= 1
+            self.consecutive_throttles += 1
+            if retry_after is None:
+                retry_after = min(60.0, 2.0 ** self.consecutive_throttles)
+            pause = max(MIN_THROTTLE_PAUSE, retry_after)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            # Multiplicative decrease
+            self.limit = max(1.0, self.limit / 2)
+            limit = self.limit
+        metrics.inc("rate_governor_throttled_total", 1, self._labels)
+        metrics.set_gauge("rate_governor_concurrency_limit", limit, self._labels)
+        print(f"🚦 {self.endpoint}: 429, pausa de {pause:.1f}s y límite de concurrencia {limit:.1f}")
+        return pause
+
+    def abandon(self):
+        """Release the slot of a request that failed for another reason."""
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "endpoint": self.endpoint,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "queued": len(self._queue),
+                "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 2),
+                "tokens_last_minute": sum(tokens for _, tokens in self._completed),
+            }
+
+
+def _transient(error: BaseException) -> bool:
+    """A failure worth retrying on the same endpoint (not a 429)."""
+    if isinstance(error, ModelHTTPError):
+        return error.status_code in TRANSIENT_STATUS_CODES or error.status_code >= 500
+    return isinstance(error, APIConnectionError)
+
+
+def _estimate_tokens(messages, model_settings) -> float:
+    chars = 0
+    for message in messages:
+        for part in message.parts:
+            content = getattr(part, "content", None)
+            chars += len(content) if isinstance(content, str) else len(str(content or ""))
+            args = getattr(part, "args", None)
+            if args:
+                chars += len(args) if isinstance(args, str) else len(json.dumps(args))
+    output = (model_settings or {}).get("max_tokens") or DEFAULT_OUTPUT_ALLOWANCE
+    return chars / 4 + output
+
+
+class GovernedModel(WrapperModel):
+    """Wraps a model so its requests go through a ``RateGovernor``."""
+
+    def __init__(self, wrapped: Any, governor: RateGovernor, max_retries: int = 5,
+                 transient_retries: int = 2):
+        super().__init__(wrapped)
+        self.governor = governor
+        self.max_retries = max_retries
+        self.transient_retries = transient_retries
+
+    async def request(self, messages, model_settings, model_request_parameters, *args, **kwargs):
+        estimate = _estimate_tokens(messages, model_settings)
+        attempt = 0
+        transient_attempt = 0
+        while True:
+            await self.governor.acquire(estimate)
+            try:
+                response = await super().request(messages, model_settings, model_request_parameters,
+                                                 *args, **kwargs)
+            except BaseException as e:
+                if isinstance(e, ModelHTTPError) and e.status_code == 429:
+                    self.governor.throttled(retry_after_seconds(e))
+                    attempt += 1
+                    if attempt > self.max_retries:
+                        raise
+                    continue
+                self.governor.abandon()
+                if not _transient(e) or transient_attempt >= self.transient_retries:
+                    raise
+                transient_attempt += 1
+                await self._backoff(transient_attempt, e)
+                continue
+            self.governor.release(estimate, response.usage.total_tokens)
+            return response
+
+    async def _backoff(self, attempt: int, error: BaseException):
+        # Same schedule as the OpenAI client: 0.5s doubling up to 8s, with jitter
+        delay = min(TRANSIENT_BACKOFF * 2 ** (attempt - 1), TRANSIENT_MAX_BACKOFF) * (1 - 0.25 * random.random())
+        reason = str(error.status_code) if isinstance(error, ModelHTTPError) else type(error).__name__
+        metrics.inc("rate_governor_retries_total", 1, {**self.governor._labels, "reason": reason})
+        await asyncio.sleep(delay)
+
+
+_governors: Dict[str, RateGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(endpoint: str) -> RateGovernor:
+    """Governor shared by every model that talks to ``endpoint``."""
+    host = urlparse(endpoint).netloc or endpoint
+    with _governors_lock:
+        if host not in _governors:
+            limits = ENDPOINT_LIMITS.get(host, {})
+            _governors[host] = RateGovernor(
+                host,
+                rpm=float(limits.get("rpm", DEFAULT_RPM)),
+                tpm=float(limits.get("tpm", DEFAULT_TPM)),
+                max_concurrency=int(limits.get("max_concurrency", max_concurrency)),
+            )
+        return _governors[host]
+
+
+def governed_model(model: Any, endpoint: str) -> Any:
+    """Wrap ``model`` with the governor of ``endpoint``; unchanged when disabled."""
+    if not rate_governor_enabled:
+        return model
+    return GovernedModel(model, get_governor(endpoint), max_throttle_retries, max_transient_retries)
@@ -0,0 +1,156 @@
+"""Record/replay model backend for deterministic, network-free runs.
+
+``RecordReplayModel`` wraps the configured pydantic-ai model:
+
+* ``record``: forwards each request to the real model and appends the
+  request fingerprint, the response (including tool-call turns) and its
+  latency to a cassette file (JSONL, gzip-compressed if the name ends in
+  ``.gz``);
+* ``replay``: never touches the network; each request is matched on its
+  fingerprint and the recorded response is served back, instantly or after
+  the recorded latency (``MODEL_REPLAY_TIMING=recorded``).
+
+The fingerprint is a hash of a normalized view of the request: message
+parts reduced to their kind, text/tool name/arguments (no timestamps, ids or
+usage), the tool and output schemas, and the wrapped model name.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from pydantic_ai.messages import ModelMessagesTypeAdapter, ModelResponse
+from pydantic_ai.models.wrapper import WrapperModel
+
+cassette_mode = os.getenv('MODEL_CASSETTE_MODE', 'off').lower()
+CASSETTE_PATH = os.getenv('MODEL_CASSETTE', 'cassettes/support.jsonl.gz')
+replay_timing = os.getenv('MODEL_REPLAY_TIMING', 'instant').lower()
+
+
+class CassetteMiss(LookupError):
+    """A replayed request has no recorded response."""
+
+
+def _normalize_part(part: Any) -> Dict[str, Any]:
+    normalized = {"kind": part.part_kind}
+    for attr in ("content", "tool_name", "args"):
+        value = getattr(part, attr, None)
+        if value is None:
+            continue
+        if attr == "args" and isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                pass
+        normalized[attr] = value
+    return normalized
+
+
+def request_fingerprint(model_name: str, messages: List[Any], model_request_parameters: Any) -> str:
+    """Stable hash of the parts of a request that determine the model's answer."""
+    params = model_request_parameters
+    view = {
+        "model": model_name,
+        "messages": [[_normalize_part(p) for p in m.parts] for m in messages],
+        "tools": sorted(
+            (t.name, json.dumps(t.parameters_json_schema, sort_keys=True))
+            for t in list(params.function_tools) + list(params.output_tools)
+        ),
+        "allow_text_output": params.allow_text_output,
+    }
+    payload = json.dumps(view, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def _open(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class Cassette:
+    """Recorded interactions, grouped by fingerprint in recording order."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._cursor: Dict[str, int] = defaultdict(int)
+        if os.path.exists(path):
+            with _open(path, "r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self._entries[entry["fingerprint"]].append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def append(self, fingerprint: str, response: ModelResponse, elapsed: float):
+        entry = {
+            "fingerprint": fingerprint,
+            "elapsed": round(elapsed, 4),
+            "response": json.loads(ModelMessagesTypeAdapter.dump_json([response]))[0],
+        }
+        with self._lock:
+            self._entries[fingerprint].append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with _open(self.path, "a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def next(self, fingerprint: str) -> Dict[str, Any]:
+        """Next recorded response for ``fingerprint``; repeats the last one when exhausted."""
+        with self._lock:
+            entries = self._entries.get(fingerprint)
+            if not entries:
+                raise CassetteMiss(
+                    f"No recorded response for request {fingerprint} in {self.path}")
+            index = min(self._cursor[fingerprint], len(entries) - 1)
+            self._cursor[fingerprint] += 1
+            return entries[index]
+
+
+class RecordReplayModel(WrapperModel):
+    """Wraps a model to record its responses to a cassette or replay them from it."""
+
+    def __init__(self, wrapped: Any, cassette: Cassette, mode: str, timing: str = "instant"):
+        super().__init__(wrapped)
+        self.cassette = cassette
+        self.mode = mode
+        self.timing = timing
+
+    async def request(self, messages, model_settings, model_request_parameters, *args, **kwargs):
+        fingerprint = request_fingerprint(self.model_name, messages, model_request_parameters)
+        if self.mode == "replay":
+            entry = self.cassette.next(fingerprint)
+            if self.timing == "recorded":
+                await asyncio.sleep(entry["elapsed"])
+            return ModelMessagesTypeAdapter.validate_python([entry["response"]])[0]
+
+        start = time.perf_counter()
+        response = await super().request(messages, model_settings, model_request_parameters, *args, **kwargs)
+        self.cassette.append(fingerprint, response, time.perf_counter() - start)
+        return response
+
+
+_cassettes: Dict[str, Cassette] = {}
+
+
+def replaying() -> bool:
+    """True when responses come from a cassette and no real backend is needed."""
+    return cassette_mode == "replay"
+
+
+def cassette_model(model: Any) -> Any:
+    """Wrap ``model`` according to ``MODEL_CASSETTE_MODE``; unchanged when it is "off"."""
+    if cassette_mode not in ("record", "replay"):
+        return model
+    if CASSETTE_PATH not in _cassettes:
+        _cassettes[CASSETTE_PATH] = Cassette(CASSETTE_PATH)
+    return RecordReplayModel(model, _cassettes[CASSETTE_PATH], cassette_mode, replay_timing)
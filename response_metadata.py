@@ -0,0 +1,130 @@
+"""Locally computed response metadata for the lean generation schema.
+
+In lean mode the model only writes the answer and its routing flags; the
+remaining ``ResponseModel`` fields are derived here, without extra tokens:
+
+* ``sentiment``: lexicon scorer over the customer's message (negation and
+  intensifier aware);
+* ``references`` / ``knowledge_base_refs``: bookkeeping of the tool calls and
+  tool results of the run;
+* ``satisfaction_prediction``: linear blend of sentiment, confidence and the
+  escalation/follow-up flags;
+* ``escalation_reason`` / ``suggested_actions``: from the flags and category.
+"""
+import re
+from typing import Any, Dict, List, Tuple
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, ToolCallPart, ToolReturnPart
+
+POSITIVE_WORDS = {
+    "thanks", "thank", "great", "good", "love", "excellent", "perfect", "happy", "awesome",
+    "appreciate", "helpful", "nice", "glad", "pleased", "fast", "amazing", "wonderful",
+}
+NEGATIVE_WORDS = {
+    "angry", "upset", "terrible", "awful", "bad", "worst", "broken", "damaged", "late",
+    "wrong", "missing", "lost", "disappointed", "frustrated", "annoyed",
+    "unacceptable", "horrible", "twice", "complaint", "useless", "delay", "delayed",
+    "hate", "ridiculous", "scam",
+}
+NEGATIONS = {"not", "no", "never", "don't", "didn't", "isn't", "wasn't", "won't", "can't"}
+INTENSIFIERS = {"very", "really", "extremely", "so", "totally", "absolutely"}
+
+TOKEN_PATTERN = re.compile(r"[a-z']+|!")
+
+
+def score_sentiment(text: str) -> Tuple[str, float]:
+    """Sentiment label and score in [-1, 1] for ``text``."""
+    score = 0.0
+    hits = 0
+    weight = 1.0
+    negate = False
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token == "!":
+            score *= 1.2
+            continue
+        if token in NEGATIONS:
+            negate = True
+            continue
+        if token in INTENSIFIERS:
+            weight = 1.5
+            continue
+        polarity = (token in POSITIVE_WORDS) - (token in NEGATIVE_WORDS)
+        if polarity:
+            score += -polarity * weight if negate else polarity * weight
+            hits += 1
+        weight, negate = 1.0, False
+    if not hits:
+        return "neutral", 0.0
+    score = max(-1.0, min(1.0, score / (hits + 1)))
+    if score > 0.2:
+        return "positive", score
+    if score < -0.2:
+        return "negative", score
+    return "neutral", score
+
+
+def tool_references(messages: List[Any]) -> Tuple[Dict[str, str], List[str]]:
+    """References (orders, tracking numbers) and knowledge base sections used by the run's tools."""
+    order_ids: List[str] = []
+    tracking: List[str] = []
+    kb_refs: List[str] = []
+    for message in messages:
+        for part in message.parts:
+            if isinstance(message, ModelResponse) and isinstance(part, ToolCallPart):
+                if part.tool_name == "get_policy_info":
+                    args = part.args_as_dict()
+                    ref = f"{args.get('policy_type')}:{args.get('customer_tier')}"
+                    if ref not in kb_refs:
+                        kb_refs.append(ref)
+            elif isinstance(message, ModelRequest) and isinstance(part, ToolReturnPart):
+                content = part.content
+                if not isinstance(content, dict):
+                    continue
+                data = content.get("data") or {}
+                if part.tool_name == "get_order_and_shipping_status":
+                    rows = [{"order_id": data.get("order_id"),
+                             "tracking_number": (data.get("shipping_info") or {}).get("tracking_number")}]
+                elif part.tool_name == "get_orders_status":
+                    rows = data.get("orders") or []
+                else:
+                    continue
+                for row in rows:
+                    if row.get("order_id") and row["order_id"] not in order_ids:
+                        order_ids.append(row["order_id"])
+                        if row.get("tracking_number"):
+                            tracking.append(row["tracking_number"])
+    references = {}
+    if order_ids:
+        references["order_id"] = ", ".join(order_ids)
+    if tracking:
+        references["tracking_number"] = ", ".join(tracking)
+    return references, kb_refs
+
+
+def predict_satisfaction(sentiment_score: float, confidence: float,
+                         needs_escalation: bool, follow_up_required: bool) -> float:
+    value = (0.6 + 0.25 * sentiment_score + 0.2 * (confidence - 0.5)
+             - 0.15 * needs_escalation - 0.05 * follow_up_required)
+    return round(max(0.0, min(1.0, value)), 2)
+
+
+def derive_metadata(user_prompt: str, messages: List[Any], category: str, confidence: float,
+                    needs_escalation: bool, follow_up_required: bool) -> Dict[str, Any]:
+    """The ``ResponseModel`` fields the lean schema leaves out."""
+    sentiment, sentiment_score = score_sentiment(user_prompt or "")
+    references, kb_refs = tool_references(messages)
+    suggested_actions = []
+    if needs_escalation:
+        suggested_actions.append("escalate_to_human_agent")
+    if follow_up_required:
+        suggested_actions.append("schedule_follow_up")
+    return {
+        "sentiment": sentiment,
+        "references": references,
+        "knowledge_base_refs": kb_refs,
+        "satisfaction_prediction": predict_satisfaction(
+            sentiment_score, confidence, needs_escalation, follow_up_required),
+        "escalation_reason": (f"{category} query, {sentiment} sentiment, confidence {confidence:.2f}"
+                              if needs_escalation else None),
+        "suggested_actions": suggested_actions,
+    }
@@ -0,0 +1,254 @@
+"""Tier-aware priority scheduler with admission control for model calls.
+
+Each model backend gets a ``TierScheduler`` whose concurrency cap matches the
+number of requests the backend can serve in parallel (for Ollama, its
+``OLLAMA_NUM_PARALLEL`` slot count). Requests beyond the cap wait in one queue
+per customer tier; free slots are handed out by smooth weighted round-robin so
+VIP requests go first without starving BASIC ones.
+
+Admission control:
+
+* a request whose tier queue is full is rejected immediately with
+  ``SchedulerOverloaded`` (backpressure, with a ``retry_after`` hint);
+* a request that waits longer than its tier's queue deadline is rejected with
+  ``QueueDeadlineExceeded``, or served by the caller's ``degrade`` fallback,
+  instead of timing out late inside the backend.
+
+A request whose cancellation token (see ``cancellation``) is cancelled while
+it is queued leaves the queue and raises ``RunCancelled``.
+
+Queue depth, wait time, rejections and utilization are exported through
+``metrics``.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+from cancellation import current_token
+from metrics import metrics
+
+DEFAULT_WEIGHTS = {"vip": 6, "premium": 3, "basic": 1}
+DEFAULT_QUEUE_DEADLINES = {"vip": 60.0, "premium": 30.0, "basic": 15.0}
+
+scheduler_enabled = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+# Slots per backend; Ollama reads the same OLLAMA_NUM_PARALLEL variable,
+# once per server of the pool (OLLAMA_POOL_SIZE)
+BACKEND_CONCURRENCY = {
+    "ollama": int(os.getenv('OLLAMA_NUM_PARALLEL', '4')) * max(1, int(os.getenv('OLLAMA_POOL_SIZE', '1'))),
+    "openai": int(os.getenv('SCHEDULER_OPENAI_CONCURRENCY', '8')),
+    "external": int(os.getenv('SCHEDULER_EXTERNAL_CONCURRENCY', '8')),
+}
+max_queue_depth = int(os.getenv('SCHEDULER_MAX_QUEUE_DEPTH', '50'))
+
+
+class SchedulerRejected(Exception):
+    """A request was not admitted to the backend."""
+
+    def __init__(self, message: str, tier: str, retry_after: float):
+        super().__init__(message)
+        self.tier = tier
+        self.retry_after = retry_after
+
+
+class SchedulerOverloaded(SchedulerRejected):
+    """The tier queue is full; the caller should back off for ``retry_after`` seconds."""
+
+
+class QueueDeadlineExceeded(SchedulerRejected):
+    """The request waited longer than its tier's queue deadline."""
+
+
+class _Ticket:
+    __slots__ = ("tier", "enqueued_at", "granted")
+
+    def __init__(self, tier: str):
+        self.tier = tier
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class TierScheduler:
+    """Per-tier priority queues in front of a backend with a fixed concurrency cap."""
+
+    def __init__(self, name: str, concurrency: int,
+                 weights: Optional[Dict[str, int]] = None,
+                 queue_deadlines: Optional[Dict[str, float]] = None,
+                 max_queue_depth: int = 50):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.queue_deadlines = dict(queue_deadlines or DEFAULT_QUEUE_DEADLINES)
+        self.max_queue_depth = max_queue_depth
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Ticket]] = {tier: deque() for tier in self.weights}
+        self._current_weight: Dict[str, int] = {tier: 0 for tier in self.weights}
+        self._active = 0
+        # Average service time, used for retry_after hints
+        self._service_avg = 1.0
+
+    def _labels(self, tier: Optional[str] = None) -> Dict[str, str]:
+        labels = {"backend": self.name}
+        if tier is not None:
+            labels["tier"] = tier
+        return labels
+
+    def _publish_depth(self, tier: str):
+        metrics.set_gauge("scheduler_queue_depth", len(self._queues[tier]), self._labels(tier))
+        metrics.set_gauge("scheduler_active", self._active, self._labels())
+
+    def _pick_next(self) -> Optional[_Ticket]:
+        """Smooth weighted round-robin over the non-empty tier queues."""
+        ready = [tier for tier, q in self._queues.items() if q]
+        if not ready:
+            return None
+        total = 0
+        for tier in ready:
+            self._current_weight[tier] += self.weights[tier]
+            total += self.weights[tier]
+        chosen = max(ready, key=lambda tier: self._current_weight[tier])
+        self._current_weight[chosen] -= total
+        return self._queues[chosen].popleft()
+
+    def _dispatch(self):
+        granted = False
+        while self._active < self.concurrency:
+            ticket = self._pick_next()
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._active += 1
+            self._publish_depth(ticket.tier)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _retry_after(self, tier: str) -> float:
+        ahead = sum(len(q) for q in self._queues.values())
+        return round(self._service_avg * (ahead + 1) / self.concurrency, 2)
+
+    def acquire(self, tier: str, deadline: Optional[float] = None) -> float:
+        """Wait for a backend slot. Returns the time spent queued, in seconds."""
+        tier = tier if tier in self._queues else min(self.weights, key=self.weights.get)
+        timeout = deadline if deadline is not None else self.queue_deadlines.get(tier, 30.0)
+        with self._cond:
+            queue = self._queues[tier]
+            if self._active < self.concurrency and not any(self._queues.values()):
+                self._active += 1
+                metrics.set_gauge("scheduler_active", self._active, self._labels())
+                metrics.observe("scheduler_wait_seconds", 0.0, self._labels(tier))
+                return 0.0
+
+            if len(queue) >= self.max_queue_depth:
+                metrics.inc("scheduler_rejected_total", labels={**self._labels(tier), "reason": "overloaded"})
+                raise SchedulerOverloaded(
+                    f"{tier} queue is full ({len(queue)} waiting)", tier, self._retry_after(tier))
+
+            ticket = _Ticket(tier)
+            queue.append(ticket)
+            self._publish_depth(tier)
+            expires = ticket.enqueued_at + timeout
+            token = current_token()
+            remove_callback = token.add_callback(self._wake) if token is not None else None
+            try:
+                while not ticket.granted:
+                    if token is not None and token.is_set():
+                        queue.remove(ticket)
+                        self._publish_depth(tier)
+                        metrics.inc("scheduler_rejected_total", labels={**self._labels(tier), "reason": "cancelled"})
+                        raise token.error()
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        queue.remove(ticket)
+                        self._publish_depth(tier)
+                        metrics.inc("scheduler_rejected_total", labels={**self._labels(tier), "reason": "deadline"})
+                        raise QueueDeadlineExceeded(
+                            f"{tier} request waited more than {timeout:.0f}s for a slot",
+                            tier, self._retry_after(tier))
+                    if token is not None and token.deadline is not None:
+                        remaining = min(remaining, token.remaining() + 0.01)
+                    self._cond.wait(remaining)
+            finally:
+                if remove_callback is not None:
+                    remove_callback()
+
+        waited = time.monotonic() - ticket.enqueued_at
+        metrics.observe("scheduler_wait_seconds", waited, self._labels(tier))
+        return waited
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def release(self, service_time: Optional[float] = None):
+        with self._cond:
+            self._active -= 1
+            if service_time is not None:
+                self._service_avg = 0.8 * self._service_avg + 0.2 * service_time
+            metrics.set_gauge("scheduler_active", self._active, self._labels())
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tier: str, deadline: Optional[float] = None) -> Iterator[float]:
+        """Hold a backend slot for the enclosed block; yields the queue wait time."""
+        waited = self.acquire(tier, deadline)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def run(self, tier: str, fn: Callable[..., Any], *args: Any,
+            degrade: Optional[Callable[[SchedulerRejected], Any]] = None,
+            deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """Run ``fn`` once a slot is free for ``tier``.
+
+        If the request is rejected and ``degrade`` is given, its result is
+        returned instead (e.g. a cheaper model or a canned reply).
+        """
+        try:
+            with self.slot(tier, deadline):
+                return fn(*args, **kwargs)
+        except SchedulerRejected as rejection:
+            if degrade is None:
+                raise
+            metrics.inc("scheduler_degraded_total", labels=self._labels(rejection.tier))
+            return degrade(rejection)
+
+    def pressure(self) -> Dict[str, Any]:
+        """Backpressure signal for callers: queue depths, utilization and a level."""
+        with self._cond:
+            depths = {tier: len(q) for tier, q in self._queues.items()}
+            active = self._active
+        deepest = max(depths.values(), default=0)
+        if deepest >= 0.8 * self.max_queue_depth:
+            level = "overloaded"
+        elif deepest > 0:
+            level = "busy"
+        else:
+            level = "ok"
+        return {
+            "backend": self.name,
+            "level": level,
+            "active": active,
+            "concurrency": self.concurrency,
+            "utilization": active / self.concurrency,
+            "queue_depth": depths,
+        }
+
+
+# Un planificador por backend
+_schedulers: Dict[str, TierScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(backend: str) -> TierScheduler:
+    """Obtiene o crea el planificador del backend indicado."""
+    with _schedulers_lock:
+        if backend not in _schedulers:
+            _schedulers[backend] = TierScheduler(
+                backend, BACKEND_CONCURRENCY.get(backend, 4),
+                max_queue_depth=max_queue_depth)
+        return _schedulers[backend]
@@ -0,0 +1,184 @@
+"""Single-flight coalescing of duplicate agent runs.
+
+Requests are keyed on (scope, normalized prompt, context fingerprint), where
+the scope is the session or customer and the fingerprint hashes the customer
+context the model would see. While a run for a key is in flight, identical
+requests attach to it and share its result instead of starting another
+``agent.run`` and taking another backend slot.
+
+The run itself executes on a worker thread (with a copy of the first caller's
+context variables, so tool caches and trace spans follow it). Every caller
+is a participant that waits on it:
+
+* a participant that gives up (its cancellation token is cancelled or its
+  deadline passes) detaches; the run keeps going for the others;
+* the run has its own token (with the first caller's deadline); when the
+  last participant detaches the flight is dropped if it has not started and
+  its token is cancelled otherwise, which aborts the model request;
+* an exception raised by the run is re-raised to every participant.
+
+A finished result lingers for ``SINGLE_FLIGHT_LINGER`` seconds so that a
+duplicate arriving right after completion (a double-click handled after the
+first one returned) is also served from it.
+"""
+import contextvars
+import hashlib
+import itertools
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cancellation
+from cancellation import CancelToken, RunTimedOut
+from metrics import metrics
+
+single_flight_enabled = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+single_flight_linger = float(os.getenv('SINGLE_FLIGHT_LINGER', '2.0'))
+single_flight_workers = int(os.getenv('SINGLE_FLIGHT_WORKERS', '32'))
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case, whitespace and trailing punctuation insensitive form of ``prompt``."""
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", prompt.strip().lower()))
+
+
+def coalesce_key(scope: str, prompt: str, context_fingerprint: str) -> str:
+    payload = "\x1f".join((scope, normalize_prompt(prompt), context_fingerprint))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Flight:
+    """One in-flight (or lingering) run shared by its participants."""
+    _ids = itertools.count(1)
+
+    def __init__(self, key: str, timeout: Optional[float] = None):
+        self.id = next(self._ids)
+        self.key = key
+        self.future: Future = Future()
+        self.token = CancelToken(timeout)
+        self.participants = 0
+        self.finished_at: Optional[float] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution."""
+
+    def __init__(self, max_workers: int = 32, linger: float = 2.0):
+        self.linger = linger
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="single-flight")
+        self._flights: Dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any,
+           timeout: Optional[float] = None, cancel: Optional[CancelToken] = None,
+           **kwargs: Any) -> Tuple[Any, Flight, bool]:
+        """Run ``fn`` once per key; returns ``(result, flight, shared)``.
+
+        ``shared`` is False only for the caller that started the run. ``cancel``
+        defaults to the caller's current token and ``timeout`` to its remaining
+        time. Raises ``RunCancelled``/``RunTimedOut`` when this caller gives up.
+        """
+        if cancel is None:
+            cancel = cancellation.current_token()
+        if timeout is None and cancel is not None:
+            timeout = cancel.remaining()
+        flight, leader = self._join(key, fn, args, kwargs, timeout)
+        metrics.inc("single_flight_requests_total", 1, {"role": "leader" if leader else "shared"})
+        try:
+            return self._wait(flight, timeout, cancel), flight, not leader
+        finally:
+            self._leave(flight)
+
+    def _join(self, key, fn, args, kwargs, timeout) -> Tuple[Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.finished_at is not None:
+                if (time.monotonic() - flight.finished_at > self.linger
+                        or flight.future.cancelled() or flight.future.exception() is not None):
+                    flight = None
+            if flight is not None:
+                flight.participants += 1
+                return flight, False
+            flight = Flight(key, timeout)
+            flight.participants = 1
+            self._flights[key] = flight
+            metrics.set_gauge("single_flight_in_flight", self._active(), {})
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._execute, flight, fn, args, kwargs)
+        return flight, True
+
+    def _active(self) -> int:
+        return sum(1 for f in self._flights.values() if f.finished_at is None)
+
+    def _execute(self, flight: Flight, fn, args, kwargs):
+        if not flight.future.set_running_or_notify_cancel():
+            return
+        try:
+            with cancellation.scope(flight.token):
+                flight.future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            flight.future.set_exception(e)
+        finally:
+            with self._lock:
+                flight.finished_at = time.monotonic()
+                metrics.set_gauge("single_flight_in_flight", self._active(), {})
+            self._expire_later(flight)
+
+    def _expire_later(self, flight: Flight):
+        def expire():
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+        timer = threading.Timer(self.linger, expire)
+        timer.daemon = True
+        timer.start()
+
+    def _wait(self, flight: Flight, timeout: Optional[float], cancel: Optional[threading.Event]):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            if cancel is not None and cancel.is_set():
+                metrics.inc("single_flight_detached_total", 1, {"reason": cancel.reason})
+                raise cancel.error()
+            step = 0.1 if cancel is not None else None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.inc("single_flight_detached_total", 1, {"reason": "timeout"})
+                    raise RunTimedOut()
+                step = remaining if step is None else min(step, remaining)
+            done, _ = wait([flight.future], timeout=step)
+            if done:
+                return flight.future.result()
+
+    def _leave(self, flight: Flight):
+        with self._lock:
+            flight.participants -= 1
+            abandoned = flight.participants == 0 and not flight.future.done()
+            if abandoned:
+                # Nobody is waiting any more: don't start it, or ask it to stop
+                flight.future.cancel()
+                flight.token.cancel("abandoned")
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                metrics.inc("single_flight_cancelled_total", 1, {})
+                metrics.set_gauge("single_flight_in_flight", self._active(), {})
+
+
+# Instancia global del coalescedor
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Obtiene o crea el coalescedor global."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight(single_flight_workers, single_flight_linger)
+        return _single_flight
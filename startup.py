@@ -0,0 +1,173 @@
+"""Orquestador de arranque no bloqueante para el backend local de Ollama.
+
+Sustituye la secuencia bloqueante de ``ensure_ready`` en el import por una
+máquina de estados que avanza en segundo plano:
+
+    pending → installing → starting → pulling → warming → ready
+                                   ↘ degraded (si algún paso falla)
+
+Los pasos independientes se solapan: la comprobación de instalación solo se
+hace si el servidor no responde ya, las descargas de varios modelos van en
+paralelo y el precalentamiento de cada modelo empieza en cuanto su descarga
+termina. El tiempo de cada fase queda registrado en ``phase_timings`` y en
+las métricas.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+
+from metrics import metrics
+from ollama_manager import OllamaManager, OllamaPool, get_ollama_manager, get_ollama_pool
+
+PENDING = "pending"
+INSTALLING = "installing"
+STARTING = "starting"
+PULLING = "pulling"
+WARMING = "warming"
+READY = "ready"
+DEGRADED = "degraded"
+
+STATES = [PENDING, INSTALLING, STARTING, PULLING, WARMING, READY, DEGRADED]
+
+
+class StartupOrchestrator:
+    """Prepara Ollama y los modelos en segundo plano y expone el estado."""
+
+    def __init__(self, manager: OllamaManager, models: List[str], keep_alive: str = "30m",
+                 pool: Optional[OllamaPool] = None):
+        self.manager = manager
+        self.pool = pool
+        self.models = list(dict.fromkeys(models))
+        self.keep_alive = keep_alive
+        self.state = PENDING
+        self.reason: Optional[str] = None
+        self.phase_timings: Dict[str, float] = {}
+        self._phase_started: Dict[str, float] = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def start(self) -> "StartupOrchestrator":
+        """Lanza el arranque en segundo plano (idempotente)."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="ollama-startup", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta que el arranque termine; True si quedó listo."""
+        self._ready.wait(timeout)
+        return self.ready
+
+    def snapshot(self) -> dict:
+        pulls = self.manager.pull_status()
+        pulling = [pulls[m] for m in self.models if m in pulls]
+        progress = (sum(p["progress"] for p in pulling) / len(pulling)) if pulling else None
+        return {
+            "state": self.state,
+            "reason": self.reason,
+            "models": self.models,
+            "pull_progress": progress,
+            "phase_timings": dict(self.phase_timings),
+        }
+
+    def _enter(self, state: str, only_from: Optional[str] = None):
+        now = time.monotonic()
+        with self._lock:
+            if only_from is not None and self.state != only_from:
+                return
+            if self.state in self._phase_started:
+                self._close_phase(self.state, now)
+            self.state = state
+            self._phase_started[state] = now
+        for s in STATES:
+            metrics.set_gauge("startup_state", 1.0 if s == state else 0.0, {"state": s})
+        print(f"🚦 Arranque de Ollama: {state}")
+
+    def _close_phase(self, state: str, now: float):
+        elapsed = now - self._phase_started.pop(state)
+        self.phase_timings[state] = self.phase_timings.get(state, 0.0) + elapsed
+        metrics.set_gauge("startup_phase_seconds", self.phase_timings[state], {"phase": state})
+
+    def _degrade(self, reason: str):
+        self.reason = reason
+        self._enter(DEGRADED)
+        print(f"⚠️  Ollama no disponible ({reason}); la app sigue con respuestas rápidas")
+
+    def _run(self):
+        try:
+            if self.pool is not None or not self.manager.is_running():
+                self._enter(INSTALLING)
+                if not self.manager._run_setup_if_needed():
+                    return self._degrade("ollama no está instalado")
+                self._enter(STARTING)
+                started = self.pool.start() if self.pool is not None else self.manager.start_server()
+                if not started:
+                    return self._degrade("el servidor no arrancó")
+
+            self._enter(PULLING)
+            # Cada modelo se descarga y precalienta por su cuenta y en paralelo
+            with ThreadPoolExecutor(max_workers=len(self.models) or 1) as pool:
+                results = list(pool.map(self._prepare_model, self.models))
+            failed = [m for m, ok in zip(self.models, results) if not ok]
+            if failed:
+                return self._degrade(f"no se pudo preparar: {', '.join(failed)}")
+            self._enter(READY)
+        except Exception as e:
+            self._degrade(str(e))
+        finally:
+            with self._lock:
+                for phase in list(self._phase_started):
+                    if phase not in (READY, DEGRADED):
+                        self._close_phase(phase, time.monotonic())
+            self._ready.set()
+
+    def _prepare_model(self, model_name: str) -> bool:
+        if not self.manager.model_available(model_name):
+            job = self.manager.pull_model_async(model_name)
+            job.wait()
+            if job.state != job.SUCCESS:
+                print(f"❌ Error descargando modelo '{model_name}': {job.error}")
+                return False
+        self._enter(WARMING, only_from=PULLING)
+        urls = self.pool.urls if self.pool is not None else [self.manager.base_url]
+        # Cada instancia del pool carga su propia copia del modelo
+        with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+            return all(pool.map(lambda url: self._warm(model_name, url), urls))
+
+    def _warm(self, model_name: str, base_url: str) -> bool:
+        """Carga el modelo en memoria con una generación vacía."""
+        try:
+            response = requests.post(
+                f"{base_url}/api/generate",
+                json={"model": model_name, "prompt": "", "keep_alive": self.keep_alive},
+                timeout=300,
+            )
+            return response.status_code == 200
+        except requests.RequestException as e:
+            print(f"⚠️  No se pudo precalentar '{model_name}': {e}")
+            # El modelo está descargado; se cargará en la primera consulta
+            return True
+
+
+# Instancia global del orquestador
+_orchestrator = None
+
+
+def get_orchestrator(models: Optional[List[str]] = None,
+                     base_url: str = "http://localhost:11434") -> StartupOrchestrator:
+    """Obtiene o crea el orquestador global (sin arrancarlo)."""
+    global _orchestrator
+    if _orchestrator is None:
+        _orchestrator = StartupOrchestrator(get_ollama_manager(base_url), models or [],
+                                            pool=get_ollama_pool(base_url))
+    return _orchestrator
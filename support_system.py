@@ -1,13 +1,27 @@
-from ollama_manager import ensure_ollama_ready
-from typing import Dict, List, Optional, Any
+from ollama_manager import ensure_ollama_ready, get_ollama_pool
+from metrics import metrics
+import tool_cache
+import tracing
+import replay_model
+import rate_governor
+import data_source
+from kb_store import get_kb_store
+from startup import get_orchestrator
+from model_pool import BalancedModel
+from response_metadata import derive_metadata
+from profile_cache import get_profile_cache
+from typing import Awaitable, Dict, List, Optional, Any, Tuple
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from enum import Enum
+import asyncio
 import json
 import os
+import threading
 import nest_asyncio
-from pydantic import BaseModel, Field, field_validator
-from pydantic_ai import Agent, ModelRetry, RunContext, Tool
-from pydantic_ai.models.openai import OpenAIChatModel, OpenAIModel
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from pydantic_ai import Agent, ModelRetry, RunContext
+from pydantic_ai.models.openai import OpenAIChatModel
 from pydantic_ai.providers.ollama import OllamaProvider
 from pydantic_ai.providers.openai import OpenAIProvider
 
@@ -46,6 +60,9 @@ class CustomerTier(str, Enum):
 
 class Item(BaseModel):
     """Enhanced structure for order items."""
+    # Profiles are shared between sessions (profile_cache): copy, never update in place
+    model_config = ConfigDict(frozen=True)
+
     item_id: str
     name: str
     quantity: int
@@ -67,6 +84,8 @@ class Item(BaseModel):
 
 class Order(BaseModel):
     """Enhanced structure for order details."""
+    model_config = ConfigDict(frozen=True)
+
     order_id: str
     status: OrderStatus
     items: List[Item]
@@ -94,11 +113,14 @@ class Order(BaseModel):
 
 class CustomerInteraction(BaseModel):
     """Structure for tracking customer interactions."""
+    model_config = ConfigDict(frozen=True)
+
     interaction_id: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     channel: str
     query_type: QueryCategory
     resolved: bool = False
+    escalated: bool = False
     resolution_time: Optional[datetime] = None
     satisfaction_score: Optional[int] = None
     notes: Optional[str] = None
@@ -106,6 +128,8 @@ class CustomerInteraction(BaseModel):
 
 class CustomerDetails(BaseModel):
     """Enhanced structure for customer information."""
+    model_config = ConfigDict(frozen=True)
+
     customer_id: str
     name: str
     email: str
@@ -150,6 +174,15 @@ class ResponseModel(BaseModel):
     satisfaction_prediction: float = Field(ge=0.0, le=1.0)
 
 
+class LeanResponse(BaseModel):
+    """Final answer to the customer."""
+    response: str
+    response_type: QueryCategory
+    needs_escalation: bool
+    follow_up_required: bool
+    confidence_score: float = Field(ge=0.0, le=1.0)
+
+
 # Enhanced shipping information database
 shipping_info_db: Dict[str, Dict[str, Any]] = {
     "#12345": {
@@ -176,24 +209,8 @@ shipping_info_db: Dict[str, Dict[str, Any]] = {
     }
 }
 
-# Knowledge base for quick reference
-knowledge_base: Dict[str, Any] = {
-    "shipping_policies": {
-        "standard": "5-7 business days",
-        "express": "2-3 business days",
-        "overnight": "Next business day"
-    },
-    "return_policies": {
-        "standard": "30 days from delivery",
-        "premium": "60 days from delivery",
-        "vip": "90 days from delivery"
-    },
-    "warranty_info": {
-        "electronics": "1 year standard warranty",
-        "furniture": "5 year limited warranty",
-        "accessories": "90 days limited warranty"
-    }
-}
+# Knowledge base: versioned snapshots loaded from KB_PATH (see kb_store)
+kb_store = get_kb_store()
 
 # Configuración del modelo - soporta múltiples proveedores
 llm_token = os.getenv('LLM_TOKEN')
@@ -202,6 +219,28 @@ llm_model = os.getenv('LLM_MODEL')
 use_openai = os.getenv('USE_OPENAI', 'false').lower() == 'true'
 openai_api_key = os.getenv('OPENAI_API_KEY')
 ollama_model = os.getenv('OLLAMA_MODEL', 'qwen2.5:0.5b')
+# Disposición del prompt: "cache" (por defecto) serializa el contexto de forma
+# determinista para que el proveedor reutilice el prefijo cacheado; "legacy"
+# conserva el formato anterior.
+prompt_layout = os.getenv('PROMPT_LAYOUT', 'cache').lower()
+# Esquema de salida: "full" hace que el modelo genere todo ResponseModel;
+# "lean" solo la respuesta y sus indicadores, y el resto se calcula localmente.
+response_schema = os.getenv('RESPONSE_SCHEMA', 'full').lower()
+# Herramienta de estado de pedidos en bloque: responde preguntas sobre varios
+# pedidos en una sola llamada; BULK_ORDER_MAX_ROWS limita las filas devueltas.
+bulk_order_tool = os.getenv('BULK_ORDER_TOOL', 'true').lower() == 'true'
+bulk_order_max_rows = int(os.getenv('BULK_ORDER_MAX_ROWS', '20'))
+OLLAMA_BASE_URL = "http://localhost:11434"
+# Arranque de Ollama: "background" (por defecto) no bloquea el import y la app
+# sirve respuestas rápidas mientras el modelo se prepara; "blocking" espera.
+ollama_startup = os.getenv('OLLAMA_STARTUP', 'background').lower()
+
+
+def ollama_chat_model(model_name: str, base_url: str = OLLAMA_BASE_URL) -> OpenAIChatModel:
+    """Build a chat model served by the local Ollama OpenAI-compatible API."""
+    provider = OllamaProvider(base_url=f"{base_url}/v1")
+    return OpenAIChatModel(model_name, provider=provider)
+
 
 # Prioridad: GitHub Models > OpenAI > Ollama local
 if llm_token and llm_endpoint and llm_model:
@@ -210,72 +249,138 @@ if llm_token and llm_endpoint and llm_model:
     os.environ['OPENAI_API_KEY'] = llm_token
     from openai import AsyncOpenAI
 
-    # Crear cliente personalizado con endpoint custom
-    provider = OpenAIProvider(api_key=llm_token,
-                              base_url=llm_endpoint
-                              )
-    model = OpenAIChatModel(llm_model, provider=provider)
+    # Crear cliente personalizado con endpoint custom. Con el regulador de
+    # cuota activo el cliente no reintenta: el regulador gestiona los 429 y
+    # reintenta él mismo los errores de conexión, timeouts y 5xx.
+    client = AsyncOpenAI(api_key=llm_token, base_url=llm_endpoint,
+                         max_retries=0 if rate_governor.rate_governor_enabled else 2)
+    provider = OpenAIProvider(openai_client=client)
+    model = rate_governor.governed_model(OpenAIChatModel(llm_model, provider=provider), llm_endpoint)
+    model_backend = "external"
 
 elif use_openai and openai_api_key:
     # Usar OpenAI API
     print("🔗 Usando OpenAI API")
     os.environ['OPENAI_API_KEY'] = openai_api_key
-    model = OpenAIChatModel('gpt-4o-mini')
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=openai_api_key,
+                         max_retries=0 if rate_governor.rate_governor_enabled else 2)
+    model = rate_governor.governed_model(
+        OpenAIChatModel('gpt-4o-mini', provider=OpenAIProvider(openai_client=client)), str(client.base_url))
+    model_backend = "openai"
 
 else:
     # Usar Ollama local
     print(f"🤖 Usando Ollama local con modelo: {ollama_model}")
     # Asegurar que Ollama esté funcionando y el modelo disponible
-    if not ensure_ollama_ready(ollama_model, "http://localhost:11434"):
-        raise RuntimeError(
-            f"Failed to initialize Ollama with model '{ollama_model}'. Please ensure Ollama is installed and try again.")
+    # En modo replay las respuestas salen del cassette: no hace falta Ollama
+    ollama_pool = get_ollama_pool(OLLAMA_BASE_URL)
+    if replay_model.replaying():
+        pass
+    elif ollama_startup == 'blocking':
+        if ollama_pool is not None:
+            ollama_pool.start()
+        if not ensure_ollama_ready(ollama_model, OLLAMA_BASE_URL):
+            raise RuntimeError(
+                f"Failed to initialize Ollama with model '{ollama_model}'. Please ensure Ollama is installed and try again.")
+    else:
+        # Instalar, arrancar, descargar y precalentar en segundo plano
+        get_orchestrator([ollama_model], OLLAMA_BASE_URL).start()
+
+    if ollama_pool is not None:
+        # Un backend por instancia del pool, repartidos por carga
+        model = BalancedModel(
+            [ollama_chat_model(ollama_model, url) for url in ollama_pool.urls],
+            ollama_pool.urls,
+            is_healthy=ollama_pool.is_healthy,
+        )
+    else:
+        model = ollama_chat_model(ollama_model)
+    model_backend = "ollama"
+
+# Grabación/reproducción de respuestas del modelo (MODEL_CASSETTE_MODE)
+model = replay_model.cassette_model(model)
+
+
+def model_ready() -> bool:
+    """True when the configured model can serve requests (always for remote providers)."""
+    if model_backend != "ollama" or replay_model.replaying() or ollama_startup == 'blocking':
+        return True
+    return get_orchestrator().ready
+
+# Static instructions. Keep this byte-stable: together with the tool schemas it
+# forms the cacheable prefix of every request.
+SYSTEM_PROMPT = (
+    "You are an advanced customer support agent with deep knowledge of our systems. "
+    "When customers ask about their order status:"
+    "1. If they don't specify an order ID but have recent orders, tell them about their most recent order"
+    "2. If they specify an order ID, look up that specific order"
+    "3. Include shipping tracking information if available"
+    "4. Be specific about dates and status"
+    "\n\n"
+    "Analyze queries carefully and provide structured, empathetic responses. "
+    "Consider the customer's tier status when providing support. "
+    "Maintain a professional yet friendly tone throughout the interaction."
+)
+
+
+def complete_response(ctx: RunContext[CustomerDetails], answer: LeanResponse) -> ResponseModel:
+    """Final answer to the customer."""
+    metadata = derive_metadata(
+        ctx.prompt if isinstance(ctx.prompt, str) else "", ctx.messages,
+        answer.response_type.value, answer.confidence_score,
+        answer.needs_escalation, answer.follow_up_required)
+    return ResponseModel(**answer.model_dump(), **metadata)
 
-    provider = OllamaProvider(base_url="http://localhost:11434/v1")
-    model = OpenAIChatModel(ollama_model, provider=provider)
 
-# Enhanced agent with additional context
+def response_output_type(schema: str = response_schema):
+    """Agent output type for ``schema``; both produce a ``ResponseModel``."""
+    return complete_response if schema == "lean" else ResponseModel
+
+
+# Enhanced agent with additional context.
+# Prompt order is fixed: static SYSTEM_PROMPT (plus tool schemas), then the
+# customer context from add_customer_context, then the user turn.
 agent = Agent(
-    model=model,
-    output_type=ResponseModel,
+    model=tracing.traced_model(model),
+    output_type=response_output_type(),
     deps_type=CustomerDetails,
     retries=3,
-    system_prompt=(
-        "You are an advanced customer support agent with deep knowledge of our systems. "
-        "When customers ask about their order status:"
-        "1. If they don't specify an order ID but have recent orders, tell them about their most recent order"
-        "2. If they specify an order ID, look up that specific order"
-        "3. Include shipping tracking information if available"
-        "4. Be specific about dates and status"
-        "\n\n"
-        "Analyze queries carefully and provide structured, empathetic responses. "
-        "Consider the customer's tier status when providing support. "
-        "Maintain a professional yet friendly tone throughout the interaction."
-    ),
+    system_prompt=SYSTEM_PROMPT,
 )
 
 
-@agent.system_prompt
-async def add_customer_context(ctx: RunContext[CustomerDetails]) -> str:
-    """Add comprehensive customer context to system prompt."""
-    customer = ctx.deps
+def build_customer_context(customer: CustomerDetails) -> str:
+    """Serialize the customer context that follows the static system prompt.
+
+    With the "cache" prompt layout the output is deterministic for the same
+    customer data: orders and shipping ids are sorted and keys are serialized
+    in sorted order with fixed separators.
+    """
+    stable = prompt_layout == "cache"
+
+    orders = customer.orders or []
+    if stable:
+        orders = sorted(orders, key=lambda o: (o.order_date, o.order_id))
 
     # Get order details
     order_details = []
-    if customer.orders:
-        for order in customer.orders:
-            order_info = {
-                "order_id": order.order_id,
-                "status": order.status.value,
-                "order_date": order.order_date.strftime("%Y-%m-%d"),
-                "tracking_number": order.tracking_number,
-                "items": [{"name": item.name, "quantity": item.quantity} for item in order.items],
-                "total_amount": order.total_amount
-            }
-            # Add shipping info if available
-            if order.order_id in shipping_info_db:
-                order_info["shipping_status"] = shipping_info_db[order.order_id]
-            order_details.append(order_info)
+    for order in orders:
+        order_info = {
+            "order_id": order.order_id,
+            "status": order.status.value,
+            "order_date": order.order_date.strftime("%Y-%m-%d"),
+            "tracking_number": order.tracking_number,
+            "items": [{"name": item.name, "quantity": item.quantity} for item in order.items],
+            "total_amount": order.total_amount
+        }
+        # Add shipping info if available
+        if order.order_id in shipping_info_db:
+            order_info["shipping_status"] = shipping_info_db[order.order_id]
+        order_details.append(order_info)
 
+    shipping_ids = list(shipping_info_db.keys())
     context = {
         "customer_details": {
             "name": customer.name,
@@ -283,63 +388,350 @@ async def add_customer_context(ctx: RunContext[CustomerDetails]) -> str:
             "total_orders": customer.total_orders,
         },
         "orders": order_details,
-        "shipping_info_available": list(shipping_info_db.keys())
+        "shipping_info_available": sorted(shipping_ids) if stable else shipping_ids
     }
 
+    if stable:
+        return json.dumps(context, default=str, sort_keys=True,
+                          separators=(",", ":"), ensure_ascii=False)
     return json.dumps(context, default=str)
 
 
-@agent.tool_plain()
-def get_order_and_shipping_status(order_id: Optional[str] = None) -> Dict[str, Any]:
-    """Get detailed order and shipping status. If no order_id is provided, returns the most recent order."""
-    try:
-        # Get the customer's orders from context
-        customer = agent.current_context.deps
+# Rendered contexts by customer id: (profile object, records revision, context).
+# Profiles are shared read-only objects, so a different object or a record
+# update (which bumps the revision) means the entry is stale.
+_rendered_contexts: "OrderedDict[str, Tuple[CustomerDetails, int, str]]" = OrderedDict()
+_rendered_contexts_lock = threading.Lock()
+RENDERED_CONTEXTS_MAX = 1024
+_records_revision = 0
 
-        if not customer.orders:
-            return {
+
+def customer_context(customer: CustomerDetails) -> str:
+    """``build_customer_context``, memoized until the customer or a record changes."""
+    with _rendered_contexts_lock:
+        entry = _rendered_contexts.get(customer.customer_id)
+        if entry is not None and entry[0] is customer and entry[1] == _records_revision:
+            _rendered_contexts.move_to_end(customer.customer_id)
+            return entry[2]
+        revision = _records_revision
+    context = build_customer_context(customer)
+    with _rendered_contexts_lock:
+        _rendered_contexts[customer.customer_id] = (customer, revision, context)
+        _rendered_contexts.move_to_end(customer.customer_id)
+        while len(_rendered_contexts) > RENDERED_CONTEXTS_MAX:
+            _rendered_contexts.popitem(last=False)
+    return context
+
+
+def _records_changed():
+    global _records_revision
+    with _rendered_contexts_lock:
+        _records_revision += 1
+
+
+@agent.system_prompt
+async def add_customer_context(ctx: RunContext[CustomerDetails]) -> str:
+    """Add comprehensive customer context to system prompt."""
+    with tracing.span("add_customer_context", customer_id=ctx.deps.customer_id) as span:
+        context = customer_context(ctx.deps)
+        span.set_attribute("context_chars", len(context))
+        return context
+
+
+def record_prompt_usage(result) -> Dict[str, Any]:
+    """Report prompt token usage for a finished run, including cached prompt tokens.
+
+    Cached tokens are only non-zero when the provider reports them (OpenAI's
+    ``prompt_tokens_details.cached_tokens``); the totals are also added to the
+    process metrics so the prefill savings can be tracked over time.
+    """
+    usage = result.usage()
+    input_tokens = usage.input_tokens or 0
+    cached_tokens = usage.cache_read_tokens or 0
+    stats = {
+        "input_tokens": input_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": usage.output_tokens or 0,
+        "cached_ratio": cached_tokens / input_tokens if input_tokens else 0.0,
+    }
+    metrics.inc("prompt_input_tokens_total", input_tokens, {"layout": prompt_layout})
+    metrics.inc("prompt_cached_tokens_total", cached_tokens, {"layout": prompt_layout})
+    return stats
+
+
+def normalize_order_id(order_id: str) -> str:
+    """Normalize a user-supplied order id: strip whitespace and add the '#' prefix."""
+    order_id = order_id.strip()
+    if not order_id.startswith('#'):
+        order_id = f"#{order_id}"
+    return order_id
+
+
+def update_shipping_record(order_id: str, **changes: Any) -> None:
+    """Update a shipping record and invalidate tool results built from it.
+
+    Raises ``KeyError`` for an order without a shipping record, so no
+    partial records are created.
+    """
+    order_id = normalize_order_id(order_id)
+    if order_id not in shipping_info_db:
+        raise KeyError(f"No shipping record for order {order_id}")
+    shipping_info_db[order_id].update(changes)
+    _records_changed()
+    tool_cache.invalidate(tool_cache.order_tag(order_id))
+
+
+# Serializes read-modify-replace of shared profiles
+_order_update_lock = threading.Lock()
+
+
+def update_order_record(customer: CustomerDetails, order_id: str, **changes: Any) -> CustomerDetails:
+    """Update one of the customer's orders and invalidate tool results built from it.
+
+    Profiles are shared by every session viewing the customer, so nothing is
+    updated in place: the current cached profile (``customer`` if none is
+    cached) is copied with the change and the copy replaces it. Returns the
+    updated profile; holders of older snapshots keep them unchanged. Raises
+    ``KeyError`` for an order the customer does not have and
+    ``pydantic.ValidationError`` for an invalid change.
+    """
+    order_id = normalize_order_id(order_id)
+    profiles = get_profile_cache()
+    with _order_update_lock:
+        current = profiles.get(customer.customer_id, lambda: customer)
+        orders = list(current.orders or [])
+        index = next((i for i, o in enumerate(orders) if o.order_id == order_id), None)
+        if index is None:
+            raise KeyError(f"Order {order_id} not found for customer {customer.customer_id}")
+        orders[index] = Order.model_validate({**orders[index].model_dump(), **changes})
+        updated = current.model_copy(update={"orders": orders})
+        profiles.replace(customer.customer_id, updated)
+    _records_changed()
+    tool_cache.invalidate(tool_cache.order_tag(order_id))
+    # The "most recent order" lookup may resolve differently now
+    tool_cache.invalidate(tool_cache.customer_tag(customer.customer_id))
+    return updated
+
+
+def _select_order(customer: CustomerDetails, order_id: Optional[str]) -> Tuple[Optional[Order], Optional[Dict[str, Any]]]:
+    """Find the requested (or most recent) order; returns ``(order, error_payload)``."""
+    if not customer.orders:
+        return None, {
+            "status": "error",
+            "message": "No orders found for this customer.",
+            "data": None
+        }
+
+    if order_id:
+        # Find specific order
+        order = next(
+            (o for o in customer.orders if o.order_id == order_id), None)
+        if not order:
+            return None, {
                 "status": "error",
-                "message": "No orders found for this customer.",
+                "message": f"Order {order_id} not found. Please check the order number and try again.",
                 "data": None
             }
+    else:
+        # Get most recent order
+        order = sorted(customer.orders,
+                       key=lambda x: x.order_date, reverse=True)[0]
+    return order, None
+
+
+def _order_payload(order: Order, shipping: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the order/shipping status payload returned by the tool."""
+    response = {
+        "status": "success",
+        "message": "Order information retrieved successfully",
+        "data": {
+            "order_id": order.order_id,
+            "status": order.status.value,
+            "order_date": order.order_date.strftime("%Y-%m-%d"),
+            "total_amount": order.total_amount,
+            "items": [{"name": item.name, "quantity": item.quantity} for item in order.items]
+        }
+    }
+
+    # Add shipping info if available
+    if shipping:
+        response["data"]["shipping_info"] = shipping
+
+    return response
 
+
+def _order_status_response(customer: CustomerDetails, order_id: Optional[str]) -> Dict[str, Any]:
+    """Order status from the in-process records (no I/O, used by the fast path)."""
+    order, error = _select_order(customer, order_id)
+    if error:
+        return error
+    return _order_payload(order, shipping_info_db.get(order.order_id))
+
+
+async def _fetch_order_status(customer: CustomerDetails, order_id: Optional[str]) -> Dict[str, Any]:
+    """Order status with the shipping record read from the data source."""
+    order, error = _select_order(customer, order_id)
+    if error:
+        return error
+    shipping = await data_source.get_data_source().get_shipping_info(order.order_id)
+    return _order_payload(order, shipping)
+
+
+def _order_status_tags(customer: CustomerDetails, order_id: Optional[str]):
+    def tags(result: Dict[str, Any]) -> List[str]:
+        found = [tool_cache.order_tag(result["data"]["order_id"])]
+        if order_id is None:
+            found.append(tool_cache.customer_tag(customer.customer_id))
+        return found
+    return tags
+
+
+def order_status_lookup(customer: CustomerDetails, order_id: Optional[str]) -> Awaitable[Dict[str, Any]]:
+    """The tool's lookup, through the conversation's tool cache when one is active."""
+    cache = tool_cache.current_cache()
+    if cache is None:
+        return _fetch_order_status(customer, order_id)
+    return cache.aget_or_compute(
+        "get_order_and_shipping_status",
+        {"customer_id": customer.customer_id, "order_id": order_id},
+        lambda: _fetch_order_status(customer, order_id),
+        tags=_order_status_tags(customer, order_id),
+        cacheable=lambda result: result["status"] == "success",
+    )
+
+
+@agent.tool()
+async def get_order_and_shipping_status(ctx: RunContext[CustomerDetails], order_id: Optional[str] = None) -> Dict[str, Any]:
+    """Get detailed order and shipping status. If no order_id is provided, returns the most recent order."""
+    try:
+        customer = ctx.deps
         if order_id:
-            # Clean up order_id format if needed
-            if not order_id.startswith('#'):
-                order_id = f"#{order_id.strip()}"
-
-            # Find specific order
-            order = next(
-                (o for o in customer.orders if o.order_id == order_id), None)
-            if not order:
-                return {
-                    "status": "error",
-                    "message": f"Order {order_id} not found. Please check the order number and try again.",
-                    "data": None
-                }
-        else:
-            # Get most recent order
-            order = sorted(customer.orders,
-                           key=lambda x: x.order_date, reverse=True)[0]
-
-        # Prepare response
-        response = {
-            "status": "success",
-            "message": "Order information retrieved successfully",
-            "data": {
-                "order_id": order.order_id,
-                "status": order.status.value,
-                "order_date": order.order_date.strftime("%Y-%m-%d"),
-                "total_amount": order.total_amount,
-                "items": [{"name": item.name, "quantity": item.quantity} for item in order.items]
-            }
+            order_id = normalize_order_id(order_id)
+
+        with tracing.span("tool.get_order_and_shipping_status", order_id=order_id):
+            lookup = order_status_lookup(customer, order_id)
+            return await data_source.with_timeout("get_order_and_shipping_status", lookup)
+
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"An error occurred while retrieving order information: {str(e)}",
+            "data": None
         }
 
-        # Add shipping info if available
-        if order.order_id in shipping_info_db:
-            response["data"]["shipping_info"] = shipping_info_db[order.order_id]
 
-        return response
+def _order_row(order: Order, shipping: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact status row of an order for the bulk tool."""
+    row = {
+        "order_id": order.order_id,
+        "status": order.status.value,
+        "order_date": order.order_date.strftime("%Y-%m-%d"),
+        "total_amount": order.total_amount,
+        "items": sum(item.quantity for item in order.items),
+    }
+    if shipping:
+        row["shipping_status"] = shipping.get("status")
+        row["tracking_number"] = shipping.get("tracking_number")
+        row["estimated_delivery"] = shipping.get("estimated_delivery")
+    elif order.tracking_number:
+        row["tracking_number"] = order.tracking_number
+    return row
+
+
+async def _fetch_orders_status(customer: CustomerDetails, order_ids: Optional[List[str]],
+                              status: Optional[str], date_from: Optional[str],
+                              date_to: Optional[str]) -> Dict[str, Any]:
+    """Build the bulk order status payload: matching orders, newest first, capped."""
+    orders = sorted(customer.orders or [], key=lambda o: o.order_date, reverse=True)
+    not_found = []
+    if order_ids:
+        wanted = set(order_ids)
+        not_found = sorted(wanted - {o.order_id for o in orders})
+        orders = [o for o in orders if o.order_id in wanted]
+    if status:
+        orders = [o for o in orders if o.status.value == status.lower()]
+    if date_from:
+        start = datetime.strptime(date_from, "%Y-%m-%d")
+        orders = [o for o in orders if o.order_date >= start]
+    if date_to:
+        end = datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)
+        orders = [o for o in orders if o.order_date < end]
+
+    page = orders[:bulk_order_max_rows]
+    # Shipping lookups of all rows run concurrently
+    source = data_source.get_data_source()
+    shipping = await asyncio.gather(*(source.get_shipping_info(o.order_id) for o in page))
+    rows = [_order_row(o, s) for o, s in zip(page, shipping)]
+    response = {
+        "status": "success" if rows else "error",
+        "message": (f"{len(rows)} of {len(orders)} matching orders" if rows
+                    else "No orders match the request."),
+        "data": {"orders": rows, "total_matching": len(orders), "truncated": len(orders) > len(rows)},
+    }
+    if not_found:
+        response["data"]["not_found"] = not_found
+    return response
+
+
+def _orders_status_tags(customer: CustomerDetails):
+    def tags(result: Dict[str, Any]) -> List[str]:
+        # Filters depend on every order of the customer, not only the rows returned
+        return ([tool_cache.order_tag(row["order_id"]) for row in result["data"]["orders"]]
+                + [tool_cache.customer_tag(customer.customer_id)])
+    return tags
+
+
+def orders_status_lookup(customer: CustomerDetails, order_ids: Optional[List[str]] = None,
+                         status: Optional[str] = None, date_from: Optional[str] = None,
+                         date_to: Optional[str] = None) -> Awaitable[Dict[str, Any]]:
+    """The bulk tool's lookup, through the conversation's tool cache when one is active."""
+    cache = tool_cache.current_cache()
+    if cache is None:
+        return _fetch_orders_status(customer, order_ids, status, date_from, date_to)
+    return cache.aget_or_compute(
+        "get_orders_status",
+        {"customer_id": customer.customer_id, "order_ids": order_ids, "status": status,
+         "date_from": date_from, "date_to": date_to},
+        lambda: _fetch_orders_status(customer, order_ids, status, date_from, date_to),
+        tags=_orders_status_tags(customer),
+        cacheable=lambda result: result["status"] == "success",
+    )
+
+
+async def _bulk_tool_enabled(ctx: RunContext[CustomerDetails], tool_def):
+    return tool_def if bulk_order_tool else None
+
+
+@agent.tool(prepare=_bulk_tool_enabled)
+async def get_orders_status(ctx: RunContext[CustomerDetails], order_ids: Optional[List[str]] = None,
+                      status: Optional[str] = None, date_from: Optional[str] = None,
+                      date_to: Optional[str] = None) -> Dict[str, Any]:
+    """Get compact status rows for several orders in one call.
+
+    Use this instead of calling get_order_and_shipping_status once per order when
+    the question is about more than one order (e.g. "where are all my orders?").
+    Without arguments returns all orders, newest first.
+
+    Args:
+        order_ids: Specific order IDs to look up.
+        status: Only orders with this status (pending, processing, shipped, delivered, cancelled, returned, on_hold).
+        date_from: Only orders placed on or after this date (YYYY-MM-DD).
+        date_to: Only orders placed on or before this date (YYYY-MM-DD).
+    """
+    for name, value in (("date_from", date_from), ("date_to", date_to)):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError as e:
+                raise ModelRetry(f"Invalid {name}, use YYYY-MM-DD: {e}")
+    try:
+        customer = ctx.deps
+        if order_ids:
+            order_ids = sorted({normalize_order_id(order_id) for order_id in order_ids})
+
+        with tracing.span("tool.get_orders_status", orders=len(order_ids or [])):
+            lookup = orders_status_lookup(customer, order_ids, status, date_from, date_to)
+            return await data_source.with_timeout("get_orders_status", lookup)
 
     except Exception as e:
         return {
@@ -350,11 +742,34 @@ def get_order_and_shipping_status(order_id: Optional[str] = None) -> Dict[str, A
 
 
 @agent.tool_plain()
-def get_policy_info(policy_type: str, customer_tier: str) -> Dict[str, Any]:
+async def get_policy_info(policy_type: str, customer_tier: str) -> Dict[str, Any]:
     """Get policy information based on customer tier."""
-    if policy_type not in knowledge_base:
-        raise ModelRetry(f"Unknown policy type: {policy_type}")
-    return knowledge_base[policy_type]
+    with tracing.span("tool.get_policy_info", policy_type=policy_type):
+        snapshot = kb_store.current()
+        cache = tool_cache.current_cache()
+        if cache is None:
+            lookup = data_source.get_data_source().get_policy(policy_type)
+        else:
+            # Keyed on the article's content hash: a new KB version never hits an old entry
+            lookup = cache.aget_or_compute(
+                "get_policy_info",
+                {"policy_type": policy_type, "revision": snapshot.hashes.get(policy_type)},
+                lambda: data_source.get_data_source().get_policy(policy_type),
+                tags=lambda result: [tool_cache.kb_tag(policy_type)],
+                cacheable=lambda result: result is not None,
+            )
+        try:
+            policy = await data_source.with_timeout("get_policy_info", lookup)
+        except Exception as e:
+            return {
+                "status": "error",
+                "message": f"An error occurred while retrieving policy information: {str(e)}",
+                "data": None
+            }
+        if policy is None:
+            suggestions = snapshot.search(policy_type) or snapshot.names
+            raise ModelRetry(f"Unknown policy type: {policy_type}. Try one of: {', '.join(suggestions)}")
+        return policy
 
 # Example usage (commented out to avoid running on import)
 # customer = CustomerDetails(
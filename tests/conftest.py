@@ -0,0 +1,122 @@
+"""Shared fixtures.
+
+The modules live at the repository root, and importing ``support_system``
+configures the model: point it at a dummy OpenAI-compatible endpoint so the
+tests never start Ollama or reach the network. Agent runs use pydantic-ai's
+``FunctionModel`` through ``agent.override``.
+"""
+import copy
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["LLM_TOKEN"] = "test"
+os.environ["LLM_ENDPOINT"] = "http://127.0.0.1:9/v1"
+os.environ["LLM_MODEL"] = "test-model"
+os.environ["MODEL_CASSETTE_MODE"] = "off"
+os.environ["KB_WATCH_INTERVAL"] = "0"
+os.environ["SESSION_PREFILL"] = "false"
+os.environ["CUSTOMER_DIRECTORY_DEMO_SIZE"] = "1000"
+os.environ["WORK_QUEUE_DB"] = os.path.join(tempfile.mkdtemp(prefix="support-tests-"), "queue.sqlite3")
+os.environ.setdefault("TRACING_ENABLED", "false")
+
+import pytest
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+import support_system
+from support_system import CustomerDetails, CustomerTier, Item, Order, OrderStatus
+
+
+def make_order(order_id: str, days_ago: int = 1, status: OrderStatus = OrderStatus.SHIPPED,
+               price: float = 49.99) -> Order:
+    return Order(
+        order_id=order_id,
+        status=status,
+        items=[Item(item_id=f"ITEM{order_id[1:]}", name="Headphones", quantity=1, price=price,
+                    sku="SKU1", category="Electronics")],
+        total_amount=price,
+        order_date=datetime(2024, 12, 10 - days_ago),
+        tracking_number=f"TRK{order_id[1:]}",
+    )
+
+
+def make_customer(customer_id: str = "CUST900", tier: CustomerTier = CustomerTier.PREMIUM,
+                  orders=None) -> CustomerDetails:
+    if orders is None:
+        orders = [make_order("#12345", 1), make_order("#67890", 3, OrderStatus.DELIVERED)]
+    return CustomerDetails(
+        customer_id=customer_id,
+        name="Test Customer",
+        email=f"{customer_id.lower()}@example.com",
+        tier=tier,
+        orders=orders,
+        total_orders=len(orders),
+        total_spent=round(sum(o.total_amount for o in orders), 2),
+    )
+
+
+def wait_until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+ANSWER = {
+    "response": "Your order is on its way.",
+    "needs_escalation": False,
+    "follow_up_required": False,
+    "sentiment": "neutral",
+    "response_type": "shipping",
+    "confidence_score": 0.9,
+    "satisfaction_prediction": 0.8,
+}
+
+
+def answer_model(tool_calls=(), **answer) -> FunctionModel:
+    """A model that makes ``tool_calls`` on its first turn and then answers."""
+    async def respond(messages, info):
+        if tool_calls and len(messages) == 1:
+            return ModelResponse(parts=[ToolCallPart(name, args) for name, args in tool_calls])
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {**ANSWER, **answer})])
+    return FunctionModel(respond)
+
+
+@pytest.fixture
+def customer() -> CustomerDetails:
+    return make_customer()
+
+
+@pytest.fixture
+def shipping_db():
+    """The demo shipping records, restored after the test."""
+    saved = copy.deepcopy(support_system.shipping_info_db)
+    yield support_system.shipping_info_db
+    support_system.shipping_info_db.clear()
+    support_system.shipping_info_db.update(saved)
+
+
+@pytest.fixture
+def http_server():
+    """Serves a ``BaseHTTPRequestHandler`` subclass on a local port; returns its base URL."""
+    servers = []
+
+    def serve(handler) -> str:
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,70 @@
+import math
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics import InteractionStore, load_demo_interactions
+from support_system import CustomerInteraction, CustomerTier, QueryCategory
+
+NOW = datetime(2024, 12, 10, 12, 0)
+
+
+def interaction(i, category, channel="chat", days_ago=1, resolved_after=None, escalated=False, csat=None):
+    timestamp = NOW - timedelta(days=days_ago)
+    return CustomerInteraction(
+        interaction_id=f"I{i}", timestamp=timestamp, channel=channel, query_type=category,
+        resolved=resolved_after is not None, escalated=escalated,
+        resolution_time=timestamp + timedelta(minutes=resolved_after) if resolved_after is not None else None,
+        satisfaction_score=csat)
+
+
+@pytest.fixture
+def store():
+    store = InteractionStore(capacity=2)
+    store.extend([
+        interaction(1, QueryCategory.SHIPPING, resolved_after=10, csat=5),
+        interaction(2, QueryCategory.SHIPPING, "email", resolved_after=30, csat=3),
+        interaction(3, QueryCategory.BILLING, escalated=True, csat=1),
+    ], CustomerTier.PREMIUM)
+    store.append(interaction(4, QueryCategory.BILLING, "phone", days_ago=40, resolved_after=60, escalated=True),
+                 CustomerTier.VIP)
+    return store
+
+
+def test_columns_grow_past_initial_capacity(store):
+    assert len(store) == 4
+    assert store.channels == ["chat", "email", "phone"]
+
+
+def test_rates_and_percentiles(store):
+    assert store.resolution_rate() == 0.75
+    assert store.ttr_percentiles((50,)) == {50: 30 * 60.0}
+    summary = store.summary(since=NOW - timedelta(days=7))
+    assert summary["interactions"] == 3 and summary["csat"] == 3.0
+    assert summary["escalation_rate"] == pytest.approx(1 / 3)
+
+
+def test_group_by_dimensions(store):
+    assert store.csat_by("category") == {"shipping": {"mean": 4.0, "count": 2}, "billing": {"mean": 1.0, "count": 1}}
+    assert store.escalation_rate_by("tier") == {"premium": {"rate": 1 / 3, "count": 3}, "vip": {"rate": 1.0, "count": 1}}
+    assert set(store.escalation_rate_by("channel")) == {"chat", "email", "phone"}
+    with pytest.raises(ValueError):
+        store.csat_by("region")
+
+
+def test_empty_store():
+    store = InteractionStore()
+    assert store.resolution_rate() == 0.0
+    assert math.isnan(store.ttr_percentiles((50,))[50])
+    assert store.csat_by("tier") == {}
+
+
+def test_demo_interactions_are_reproducible():
+    first, second = InteractionStore(), InteractionStore()
+    load_demo_interactions(first, 5000, seed=7)
+    load_demo_interactions(second, 5000, seed=7)
+
+    assert len(first) == 5000
+    assert first.escalation_rate_by("category") == second.escalation_rate_by("category")
+    billing = first.escalation_rate_by("category")["billing"]["rate"]
+    assert billing > first.escalation_rate_by("category")["shipping"]["rate"]
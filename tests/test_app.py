@@ -0,0 +1,94 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from cancellation import CancelToken
+from scheduler import SchedulerRejected
+
+from conftest import ROOT
+
+APP = os.path.join(ROOT, "app.py")
+
+
+@pytest.fixture
+def app():
+    return AppTest.from_file(APP, default_timeout=60)
+
+
+def history(count):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(count)]
+
+
+def chat_messages(app):
+    return [m.value for m in app.markdown if m.value.lstrip().startswith('<div class="') and "-message" in m.value]
+
+
+def test_page_renders_with_the_demo_customer(app):
+    app.run()
+
+    assert not app.exception
+    assert app.session_state.current_customer.customer_id == "CUST001"
+
+
+def test_only_the_latest_window_of_the_chat_is_rendered(app):
+    app.session_state.chat_history = history(30)
+    app.run()
+
+    rendered = chat_messages(app)
+    assert len(rendered) == 20 and "message 29" in rendered[-1]
+    show_older = [b for b in app.button if b.key == "show_older"]
+    assert show_older and "10 hidden" in show_older[0].label
+
+    show_older[0].click().run()
+
+    assert len(chat_messages(app)) == 30
+
+
+def test_rendered_message_html_is_kept_with_the_message(app):
+    app.session_state.chat_history = history(2)
+    app.run()
+
+    assert all("html" in message for message in app.session_state.chat_history)
+
+
+def test_new_session_after_the_resource_cache_is_cleared(app):
+    app.run()
+    st.cache_resource.clear()
+
+    fresh = AppTest.from_file(APP, default_timeout=60)
+    fresh.run()
+
+    assert not fresh.exception
+    assert fresh.session_state.current_customer.customer_id == "CUST001"
+
+
+def pending_reply(user_input="where is my order?", error=None):
+    return SimpleNamespace(user_input=user_input, token=CancelToken(), done=threading.Event(), error=error)
+
+
+def test_clear_stops_the_pending_reply(app):
+    app.run()
+    pending = pending_reply()
+    app.session_state.pending_reply = pending
+    app.session_state.chat_history = [{"role": "user", "content": pending.user_input}]
+
+    next(b for b in app.button if b.label == "Clear").click().run()
+
+    assert not app.exception
+    assert pending.token.is_set()
+    assert app.session_state.pending_reply is None and app.session_state.chat_history == []
+
+
+def test_rejected_reply_after_a_clear_leaves_the_new_chat_alone(app):
+    app.session_state.chat_history = history(2)
+    pending = pending_reply(error=SchedulerRejected("basic queue is full", "basic", 3.0))
+    pending.done.set()
+    app.session_state.pending_reply = pending
+    app.run()
+
+    assert not app.exception
+    assert [m["content"] for m in app.session_state.chat_history] == ["message 0", "message 1"]
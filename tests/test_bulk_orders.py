@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelResponse, RetryPromptPart, ToolCallPart, ToolReturnPart
+from pydantic_ai.models.function import FunctionModel
+
+import support_system
+from support_system import OrderStatus, orders_status_lookup
+
+from conftest import ANSWER, make_customer, make_order
+
+
+@pytest.fixture
+def many_orders():
+    return make_customer(orders=[
+        make_order("#12345", 1),
+        make_order("#67890", 3, OrderStatus.DELIVERED),
+        make_order("#11111", 5, OrderStatus.DELIVERED),
+        make_order("#22222", 7, OrderStatus.PROCESSING),
+    ])
+
+
+def lookup(customer, **filters):
+    return asyncio.run(orders_status_lookup(customer, **filters))
+
+
+def test_all_orders_newest_first_with_shipping(many_orders, shipping_db):
+    result = lookup(many_orders)
+
+    rows = result["data"]["orders"]
+    assert [row["order_id"] for row in rows] == ["#12345", "#67890", "#11111", "#22222"]
+    assert rows[0]["tracking_number"] == "FDX123456789" and rows[0]["shipping_status"] == "Shipped on 2024-12-01"
+    # No shipping record: the order's own tracking number
+    assert rows[2]["tracking_number"] == "TRK11111" and "shipping_status" not in rows[2]
+    assert result["message"] == "4 of 4 matching orders"
+
+
+def test_filters_combine(many_orders, shipping_db):
+    result = lookup(many_orders, status="DELIVERED", date_from="2024-12-05", date_to="2024-12-07")
+
+    assert [row["order_id"] for row in result["data"]["orders"]] == ["#67890", "#11111"]
+
+
+def test_unknown_ids_are_reported(many_orders, shipping_db):
+    data = lookup(many_orders, order_ids=["#12345", "#99999"])["data"]
+
+    assert [row["order_id"] for row in data["orders"]] == ["#12345"]
+    assert data["not_found"] == ["#99999"]
+
+
+def test_rows_are_capped(many_orders, shipping_db, monkeypatch):
+    monkeypatch.setattr(support_system, "bulk_order_max_rows", 2)
+
+    data = lookup(many_orders)["data"]
+
+    assert len(data["orders"]) == 2 and data["total_matching"] == 4 and data["truncated"]
+
+
+def tool_model(args, seen):
+    async def respond(messages, info):
+        seen.append(info)
+        if len(messages) == 1 and any(t.name == "get_orders_status" for t in info.function_tools):
+            return ModelResponse(parts=[ToolCallPart("get_orders_status", args)])
+        seen.extend(p for m in messages for p in m.parts if isinstance(p, (ToolReturnPart, RetryPromptPart)))
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, ANSWER)])
+    return FunctionModel(respond)
+
+
+def run(customer, args, seen):
+    with support_system.agent.override(model=tool_model(args, seen)):
+        support_system.agent.run_sync("where are all my orders?", deps=customer)
+
+
+def test_tool_normalizes_and_deduplicates_ids(many_orders, shipping_db):
+    seen = []
+    run(many_orders, {"order_ids": ["67890", " #12345", "12345"]}, seen)
+
+    [returned] = [p for p in seen if isinstance(p, ToolReturnPart)]
+    assert [row["order_id"] for row in returned.content["data"]["orders"]] == ["#12345", "#67890"]
+
+
+def test_invalid_date_asks_the_model_to_retry(many_orders, shipping_db):
+    seen = []
+    run(many_orders, {"date_from": "last week"}, seen)
+
+    [retry] = [p for p in seen if isinstance(p, RetryPromptPart)]
+    assert "YYYY-MM-DD" in retry.model_response()
+
+
+def test_tool_is_hidden_when_disabled(customer, monkeypatch):
+    monkeypatch.setattr(support_system, "bulk_order_tool", False)
+    seen = []
+    run(customer, {}, seen)
+
+    assert "get_orders_status" not in {t.name for t in seen[0].function_tools}
+    assert "get_order_and_shipping_status" in {t.name for t in seen[0].function_tools}
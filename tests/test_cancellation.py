@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from pydantic_ai.models.function import FunctionModel
+
+import cancellation
+import support_system
+from cancellation import CancelToken, RunCancelled, RunTimedOut, run_sync, scope
+from metrics import metrics
+
+
+def test_token_cancels_itself_at_its_deadline():
+    token = CancelToken(timeout=0.01)
+    assert not token.is_set() and token.remaining() > 0
+
+    time.sleep(0.02)
+
+    assert token.is_set() and token.reason == "timeout"
+    assert isinstance(token.error(), RunTimedOut)
+
+
+def test_callbacks_run_once_and_can_be_removed():
+    token, calls = CancelToken(), []
+    token.add_callback(lambda: calls.append("kept"))
+    remove = token.add_callback(lambda: calls.append("removed"))
+    remove()
+
+    token.cancel("stopped")
+    token.cancel("again")
+    token.add_callback(lambda: calls.append("late"))
+
+    assert calls == ["kept", "late"] and token.reason == "stopped"
+
+
+def test_cancel_from_another_thread_aborts_the_running_task():
+    token, cleaned_up = CancelToken(), threading.Event()
+    before = metrics.counter("agent_runs_cancelled_total", {"reason": "stopped"})
+
+    async def slow_request():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            cleaned_up.set()
+
+    threading.Timer(0.05, token.cancel, args=("stopped",)).start()
+    start = time.monotonic()
+    with scope(token), pytest.raises(RunCancelled) as raised:
+        run_sync(slow_request)
+
+    assert raised.value.reason == "stopped" and time.monotonic() - start < 5
+    assert cleaned_up.is_set()
+    assert metrics.counter("agent_runs_cancelled_total", {"reason": "stopped"}) == before + 1
+
+
+def test_deadline_aborts_an_agent_run(customer):
+    async def hang(messages, info):
+        await asyncio.sleep(10)
+
+    with support_system.agent.override(model=FunctionModel(hang)), \
+            scope(CancelToken(timeout=0.05)), pytest.raises(RunTimedOut):
+        run_sync(support_system.agent.run, "where is my order?", deps=customer)
+
+
+def test_cancelled_token_does_not_start_the_run():
+    token, started = CancelToken(), []
+    token.cancel("superseded")
+
+    async def run():
+        started.append(True)
+
+    with scope(token), pytest.raises(RunCancelled):
+        run_sync(run)
+    assert not started
+    assert cancellation.current_token() is None
@@ -0,0 +1,73 @@
+import pytest
+
+from cascade import ModelCascade
+
+from conftest import answer_model
+
+
+def make_cascade(small, large=None, threshold=0.7):
+    cascade = ModelCascade("small-test", large or answer_model(response="large answer"), threshold, {"billing"})
+    cascade._small_model = small
+    return cascade
+
+
+def test_confident_small_answer_is_kept(customer):
+    cascade = make_cascade(answer_model(response="small answer", confidence_score=0.95))
+
+    result = cascade.run_sync("where is my order?", deps=customer)
+
+    assert result.tier == "small" and result.escalation_reason is None
+    assert result.output.response == "small answer"
+    assert cascade.stats()["small_answers"] == 1
+
+
+@pytest.mark.parametrize("answer, reason", [
+    ({"confidence_score": 0.3}, "low_confidence"),
+    ({"confidence_score": 0.95, "response_type": "billing"}, "category:billing"),
+])
+def test_weak_or_sensitive_answers_escalate(customer, answer, reason):
+    cascade = make_cascade(answer_model(**answer))
+
+    result = cascade.run_sync("I was charged twice", deps=customer)
+
+    assert result.tier == "large" and result.escalation_reason == reason
+    assert result.output.response == "large answer"
+    assert result.large_latency is not None
+
+
+def test_invalid_small_output_escalates(customer):
+    cascade = make_cascade(answer_model(confidence_score="not a number"))
+
+    result = cascade.run_sync("help", deps=customer)
+
+    assert result.tier == "large" and result.escalation_reason == "validation_failed"
+
+
+def test_latency_savings_are_only_claimed_after_a_large_answer(customer):
+    cascade = make_cascade(answer_model(confidence_score=0.95))
+    assert cascade.run_sync("hi", deps=customer).latency_saved == 0.0
+
+    cascade._record_large_answer(10.0, "low_confidence")
+    result = cascade.run_sync("hi", deps=customer)
+
+    assert result.latency_saved > 9.0
+    assert cascade.stats()["small_tier_share"] == pytest.approx(2 / 3)
+
+
+def test_escalated_runs_report_both_tiers_usage_and_lose_the_small_tier_time(customer):
+    cascade = make_cascade(answer_model(confidence_score=0.2))
+
+    result = cascade.run_sync("help", deps=customer)
+
+    large_only = result.result.usage()
+    assert result.usage().requests == large_only.requests + 1
+    assert result.usage().input_tokens > large_only.input_tokens
+    assert result.latency_saved == -result.small_latency < 0
+    assert cascade.stats()["latency_saved_seconds"] == pytest.approx(-result.small_latency)
+
+
+def test_usage_of_a_failed_small_run_is_kept(customer):
+    result = make_cascade(answer_model(confidence_score="not a number")).run_sync("help", deps=customer)
+
+    assert result.escalation_reason == "validation_failed"
+    assert result.usage().requests > result.result.usage().requests
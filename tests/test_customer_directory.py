@@ -0,0 +1,72 @@
+import pytest
+
+from customer_directory import (CustomerDirectory, CustomerSummary, PrefixIndex, demo_profile,
+                                demo_summaries, get_customer_directory)
+from profile_cache import get_profile_cache
+from support_system import CustomerTier
+
+from conftest import make_customer
+
+
+@pytest.fixture
+def directory():
+    directory = CustomerDirectory(loader=demo_profile)
+    directory.extend(demo_summaries(500))
+    return directory
+
+
+def summary(number, email=None, phone=""):
+    return CustomerSummary(f"CUSTX{number:03d}", "New Customer", email or f"new{number}@example.com",
+                           phone, CustomerTier.BASIC)
+
+
+def test_exact_lookups_normalize_the_query(directory):
+    first = directory.lookup("customer_id", "CUST0000002")
+
+    assert directory.lookup("customer_id", " cust0000002 ") == first
+    assert directory.lookup("email", first.email.upper()) == first
+    assert directory.find("+1 (555) 000-0002") == first
+    assert directory.lookup("email", "nobody@example.com") is None
+
+
+def test_search_picks_fields_from_the_query_shape(directory):
+    assert [s.customer_id for s in directory.search("cust000001", limit=3)] == \
+        ["CUST0000010", "CUST0000011", "CUST0000012"]
+    assert all(s.phone.startswith("15550000") for s in directory.search("+1 555-0000", limit=5))
+    assert directory.search("") == []
+
+
+def test_added_customers_are_found_before_and_after_the_merge(directory, monkeypatch):
+    monkeypatch.setattr(PrefixIndex, "MIN_MERGE", 4)
+    # Out of key order, spread over the main index and the side list
+    for number in (7, 1, 5, 3, 2, 6):
+        directory.add(summary(number))
+        found = [s.customer_id for s in directory.prefix("customer_id", "CUSTX", limit=10)]
+        assert found == sorted(found)
+
+    assert [s.customer_id for s in directory.prefix("customer_id", "custx", limit=4)] == \
+        ["CUSTX001", "CUSTX002", "CUSTX003", "CUSTX005"]
+    assert len(directory._prefix["customer_id"]) == len(directory)
+    assert directory.search("new6@")[0].customer_id == "CUSTX006"
+
+
+def test_duplicate_ids_are_rejected(directory):
+    with pytest.raises(ValueError):
+        directory.add(summary(1)._replace(customer_id="cust0000002"))
+
+
+def test_profiles_are_loaded_lazily_and_shared(directory):
+    customer = make_customer("CUSTP01")
+    directory.add_profile(customer)
+
+    loaded = directory.get_profile("custp01")
+    assert loaded == customer and loaded is not customer
+    assert directory.get_profile("CUSTP01") is loaded
+    generated = directory.get_profile("CUST0000003")
+    assert generated.customer_id == "CUST0000003" and generated is get_profile_cache().get("CUST0000003", None)
+    assert directory.get_profile("CUST9999999") is None
+
+
+def test_global_directory_is_loaded_once():
+    assert get_customer_directory() is get_customer_directory()
+    assert len(get_customer_directory()) >= 1000
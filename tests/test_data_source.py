@@ -0,0 +1,141 @@
+import asyncio
+import http.server
+import json
+import time
+
+import httpx
+import pytest
+
+import data_source
+import support_system
+from data_source import DataSource, HTTPDataSource, InMemoryDataSource, ToolTimeout, with_timeout
+from kb_store import get_kb_store
+from metrics import metrics
+
+from conftest import answer_model
+
+
+class SlowSource(DataSource):
+    def __init__(self, delay):
+        self.delay = delay
+
+    async def get_shipping_info(self, order_id):
+        await asyncio.sleep(self.delay)
+        return {"status": "In transit", "tracking_number": f"SLOW{order_id[1:]}"}
+
+    async def get_policy(self, policy_type):
+        await asyncio.sleep(self.delay)
+        return {"standard": "30 days"}
+
+
+@pytest.fixture
+def use_source():
+    saved = data_source._data_source
+
+    def use(source):
+        data_source.set_data_source(source)
+        return source
+
+    yield use
+    data_source.set_data_source(saved)
+
+
+def test_interface_methods_are_abstract():
+    class Partial(DataSource):
+        async def get_policy(self, policy_type):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_in_memory_source_sees_writes(shipping_db):
+    source = InMemoryDataSource(shipping_db, get_kb_store())
+    support_system.update_shipping_record("12345", status="Delivered")
+
+    assert asyncio.run(source.get_shipping_info("#12345"))["status"] == "Delivered"
+    assert asyncio.run(source.get_policy("return_policies"))["vip"] == "90 days from delivery"
+    assert asyncio.run(source.get_shipping_info("#00000")) is None
+
+
+def test_http_source_maps_404_to_missing(http_server):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = {"/shipping/12345": (200, {"status": "Shipped"}),
+                            "/policies/broken": (500, {})}.get(self.path, (404, {}))
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    source = HTTPDataSource(http_server(Handler))
+
+    async def lookups():
+        try:
+            found = await source.get_shipping_info("#12345")
+            missing = await source.get_policy("nothing")
+            with pytest.raises(httpx.HTTPStatusError):
+                await source.get_policy("broken")
+            return found, missing
+        finally:
+            await source.aclose()
+
+    assert asyncio.run(lookups()) == ({"status": "Shipped"}, None)
+
+
+def test_slow_lookup_times_out(monkeypatch):
+    monkeypatch.setitem(data_source.TOOL_TIMEOUTS, "slow_tool", 0.05)
+    before = metrics.counter("tool_timeouts_total", {"tool": "slow_tool"})
+
+    with pytest.raises(ToolTimeout):
+        asyncio.run(with_timeout("slow_tool", asyncio.sleep(1)))
+    assert metrics.counter("tool_timeouts_total", {"tool": "slow_tool"}) == before + 1
+
+
+def test_tool_calls_of_one_turn_overlap(customer, use_source):
+    use_source(SlowSource(0.3))
+    model = answer_model(tool_calls=[("get_order_and_shipping_status", {"order_id": "12345"}),
+                                     ("get_order_and_shipping_status", {"order_id": "67890"}),
+                                     ("get_policy_info", {"policy_type": "return_policies",
+                                                          "customer_tier": "standard"})])
+
+    start = time.perf_counter()
+    with support_system.agent.override(model=model):
+        result = support_system.agent.run_sync("where are my orders?", deps=customer)
+
+    assert time.perf_counter() - start < 0.6
+    returns = [p.content for m in result.all_messages() for p in m.parts if p.part_kind == "tool-return"]
+    assert {r["data"]["shipping_info"]["tracking_number"] for r in returns[:2]} == {"SLOW12345", "SLOW67890"}
+
+
+def test_backend_errors_come_back_as_error_payloads(customer, use_source, http_server):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            # Shipping answers garbage, policies fail
+            status, data = (200, b"<html>") if self.path.startswith("/shipping/") else (500, b"{}")
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    use_source(HTTPDataSource(http_server(Handler)))
+    model = answer_model(tool_calls=[("get_orders_status", {"date_from": "2024-12-01"}),
+                                     ("get_policy_info", {"policy_type": "return_policies",
+                                                          "customer_tier": "standard"})])
+
+    with support_system.agent.override(model=model):
+        result = support_system.agent.run_sync("where are my orders?", deps=customer)
+
+    parts = [p for m in result.all_messages() for p in m.parts]
+    assert not [p for p in parts if p.part_kind == "retry-prompt"]
+    returns = {p.tool_name: p.content for p in parts if p.part_kind == "tool-return"}
+    assert returns["get_orders_status"]["status"] == "error"
+    assert "YYYY-MM-DD" not in returns["get_orders_status"]["message"]
+    assert returns["get_policy_info"]["status"] == "error" and returns["get_policy_info"]["data"] is None
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+import tool_cache
+from kb_store import KBSnapshot, KnowledgeBaseStore
+from metrics import metrics
+from tool_cache import ToolResultCache
+
+ARTICLES = {
+    "return_policies": {"standard": "30 days from delivery", "vip": "90 days from delivery"},
+    "warranty_info": {"electronics": "1 year manufacturer warranty"},
+}
+
+
+def write(path, name, content):
+    (path / f"{name}.json").write_text(content if isinstance(content, str) else json.dumps(content))
+
+
+@pytest.fixture
+def kb(tmp_path):
+    for name, content in ARTICLES.items():
+        write(tmp_path, name, content)
+    return KnowledgeBaseStore(str(tmp_path))
+
+
+def test_reads_are_copies(kb):
+    article = kb.current().article("return_policies")
+    article["vip"] = "forever"
+
+    assert kb.current().article("return_policies") == ARTICLES["return_policies"]
+    assert kb.current().names == ["return_policies", "warranty_info"]
+
+
+def test_search_ranks_articles_by_shared_words():
+    snapshot = KBSnapshot(1, ARTICLES)
+
+    assert snapshot.search("how many days to return?") == ["return_policies"]
+    assert snapshot.search("warranty for electronics")[0] == "warranty_info"
+
+
+def test_reload_swaps_only_changed_articles(kb, tmp_path):
+    cache = ToolResultCache()
+    for name in ARTICLES:
+        cache.get_or_compute("get_policy_info", {"policy_type": name}, lambda: {"status": "success"},
+                             tags=lambda result, name=name: [tool_cache.kb_tag(name)])
+    write(tmp_path, "return_policies", {**ARTICLES["return_policies"], "vip": "120 days from delivery"})
+
+    assert kb.reload() == ["return_policies"]
+    assert kb.current().version == 2
+    assert kb.current().article("return_policies")["vip"] == "120 days from delivery"
+    # Only the changed article's cached tool results are dropped
+    assert cache.stats()["entries"] == 1 and cache.stats()["invalidations"] == 1
+    assert kb.reload() == [] and kb.current().version == 2
+
+
+def test_invalid_file_keeps_the_current_version(kb, tmp_path):
+    before = metrics.counter("kb_reload_failures_total")
+    write(tmp_path, "warranty_info", "{not json")
+
+    assert kb.reload() == []
+    assert kb.current().version == 1 and "warranty_info" in kb.current()
+    assert metrics.counter("kb_reload_failures_total") == before + 1
+
+
+def test_pinned_run_finishes_on_its_version(kb, tmp_path):
+    with kb.pinned() as snapshot:
+        write(tmp_path, "shipping_policies", {"express": "1-2 days"})
+        kb.reload()
+        assert kb.current() is snapshot and "shipping_policies" not in kb.current()
+
+    assert kb.current().version == 2 and "shipping_policies" in kb.current()
@@ -0,0 +1,72 @@
+import tracemalloc
+
+import pytest
+
+import memory_profile
+from memory_profile import MemoryProfiler
+
+
+@pytest.fixture
+def traced():
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(4)
+    yield
+    if started:
+        tracemalloc.stop()
+
+
+@pytest.fixture
+def snapshots(monkeypatch):
+    taken = []
+    real = memory_profile._snapshot
+
+    def counting():
+        taken.append(1)
+        return real()
+
+    monkeypatch.setattr(memory_profile, "_snapshot", counting)
+    return taken
+
+
+def test_unsampled_requests_record_the_delta_without_snapshots(traced, snapshots, tmp_path):
+    profiler = MemoryProfiler(str(tmp_path / "memory.json"), sample=0)
+    with profiler.request("reply"):
+        kept = [bytearray(1024) for _ in range(100)]
+
+    record, = profiler.requests
+    assert record["name"] == "reply"
+    assert record["delta"] >= 100 * 1024
+    assert "groups" not in record
+    assert snapshots == []
+    del kept
+
+
+def test_sampled_requests_are_grouped_by_file(traced, snapshots, tmp_path):
+    profiler = MemoryProfiler(str(tmp_path / "memory.json"), sample=0.5)
+    for _ in range(4):
+        with profiler.request("reply"):
+            kept = [bytearray(1024) for _ in range(100)]
+
+    records = list(profiler.requests)
+    assert [("groups" in r) for r in records] == [True, False, True, False]
+    assert len(snapshots) == 4
+    groups = records[0]["groups"]
+    assert groups["other"] >= 100 * 1024
+    assert records[0]["top_files"][0][0] == "test_memory_profile.py"
+    del kept
+
+
+def test_report_keeps_the_full_traceback_diffs(traced, tmp_path):
+    profiler = MemoryProfiler(str(tmp_path / "memory.json"), sample=0)
+    profiler._baseline = profiler._previous = memory_profile._snapshot()
+    kept = [bytearray(1024) for _ in range(100)]
+    with profiler.request("reply"):
+        pass
+
+    report = profiler.dump()
+    assert (tmp_path / "memory.json").exists()
+    assert set(report["groups"]) == set(memory_profile.GROUPS)
+    assert report["top_growers"]
+    assert report["recent_requests"][0]["name"] == "reply"
+    del kept
@@ -0,0 +1,182 @@
+import threading
+import time
+import types
+
+import httpx
+import pytest
+from openai import APIConnectionError
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+import ollama_manager
+import support_system
+from metrics import metrics
+from model_pool import BalancedModel
+from ollama_manager import OllamaManager
+
+from conftest import ANSWER, wait_until
+
+
+def backend(calls, name, fail=False):
+    async def respond(messages, info):
+        calls.append(name)
+        if fail:
+            raise APIConnectionError(request=httpx.Request("POST", f"http://{name}/v1/chat/completions"))
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, ANSWER)])
+    return FunctionModel(respond)
+
+
+def ask(model, customer, times=1):
+    with support_system.agent.override(model=model):
+        for _ in range(times):
+            support_system.agent.run_sync("where is my order?", deps=customer)
+
+
+def test_requests_rotate_over_healthy_backends(customer):
+    calls = []
+    model = BalancedModel([backend(calls, n) for n in "abc"], list("abc"), is_healthy=lambda i: i != 1)
+
+    ask(model, customer, times=4)
+
+    assert sorted(calls) == ["a", "a", "c", "c"]
+    assert model.in_flight == [0, 0, 0]
+
+
+def test_refused_connection_fails_over_once(customer):
+    calls = []
+    before = metrics.counter("model_pool_failovers_total", {"backend": "down"})
+    model = BalancedModel([backend(calls, "down", fail=True), backend(calls, "up")], ["down", "up"],
+                          is_healthy=lambda i: True)
+    model._tiebreak = iter([0, 0])
+
+    ask(model, customer)
+
+    assert calls == ["down", "up"]
+    assert metrics.counter("model_pool_failovers_total", {"backend": "down"}) == before + 1
+
+
+class FakeProcess:
+    pid = 4242
+
+    def poll(self):
+        return None
+
+
+@pytest.fixture
+def popen(monkeypatch):
+    launched = []
+
+    def fake_popen(command, **kwargs):
+        launched.append((command, kwargs))
+        return FakeProcess()
+
+    monkeypatch.setattr(ollama_manager.subprocess, "Popen", fake_popen)
+    monkeypatch.setattr(OllamaManager, "is_running", lambda self: bool(launched))
+    monkeypatch.setattr(ollama_manager.shutil, "which", lambda name: f"/usr/bin/{name}")
+    return launched
+
+
+def test_pinned_server_is_started_through_taskset(monkeypatch, popen):
+    monkeypatch.setattr(ollama_manager, "_TASKSET", "/usr/bin/taskset")
+
+    assert OllamaManager("http://127.0.0.1:11435", cpus={3, 2}).start_server()
+
+    [(command, kwargs)] = popen
+    assert command == ["/usr/bin/taskset", "-c", "2,3", "ollama", "serve"]
+    assert "preexec_fn" not in kwargs
+
+
+def test_without_taskset_affinity_is_set_after_popen(monkeypatch, popen):
+    pinned = []
+    monkeypatch.setattr(ollama_manager, "_TASKSET", None)
+    monkeypatch.setattr(ollama_manager.os, "sched_setaffinity", lambda pid, cpus: pinned.append((pid, cpus)),
+                        raising=False)
+
+    assert OllamaManager("http://127.0.0.1:11435", cpus={1}).start_server()
+
+    assert popen[0][0] == ["ollama", "serve"] and "preexec_fn" not in popen[0][1]
+    assert pinned == [(FakeProcess.pid, {1})]
+
+
+class FlakyServer:
+    """``start_server`` for a pool instance: fails ``failures`` times, optionally blocking first."""
+
+    def __init__(self, instance, failures=0, gate=None):
+        self.instance = instance
+        self.failures = failures
+        self.gate = gate
+        self.starts = 0
+
+    def __call__(self):
+        self.starts += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.starts <= self.failures:
+            self.instance.process = None
+            return False
+        self.instance.process = FakeProcess()
+        return True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(OllamaManager, "is_running", lambda self: self.process is not None)
+    monkeypatch.setattr(OllamaManager, "stop_server", lambda self: setattr(self, "process", None))
+    pools = []
+
+    def make(size):
+        pool = ollama_manager.OllamaPool(OllamaManager("http://127.0.0.1:11435"), size,
+                                         pin_cpus=False, check_interval=0.01)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop()
+
+
+def test_failed_start_is_retried_with_backoff(pool):
+    pool = pool(1)
+    server = FlakyServer(pool.instances[0], failures=2)
+    pool.instances[0].start_server = server
+
+    assert not pool.start()
+    wait_until(lambda: pool.is_healthy(0))
+
+    assert server.starts == 3 and pool.restarts[0] == 2
+
+
+def test_slow_restart_does_not_hold_up_other_instances(pool):
+    pool = pool(2)
+    gate = threading.Event()
+    slow = FlakyServer(pool.instances[0], failures=1, gate=gate)
+    crashing = FlakyServer(pool.instances[1])
+    for instance, server in zip(pool.instances, (slow, crashing)):
+        instance.start_server = server
+    gate.set()
+    pool.start()
+    gate.clear()
+    wait_until(lambda: slow.starts == 2)  # the retry is now blocked in start_server
+
+    crashed = types.SimpleNamespace(pid=4243, returncode=1, poll=lambda: 1)
+    pool.instances[1].process = crashed
+    wait_until(lambda: crashing.starts == 2 and pool.is_healthy(1))
+
+    assert not pool.is_healthy(0)
+    gate.set()
+    wait_until(lambda: pool.is_healthy(0))
+
+
+def test_external_server_is_not_restarted(pool):
+    pool = pool(1)
+    instance = pool.instances[0]
+    running = [True]
+    instance.is_running = lambda: running[0]
+    instance.start_server = lambda: running[0]
+
+    assert pool.start()
+    running[0] = False
+    wait_until(lambda: not pool.is_healthy(0))
+    time.sleep(0.05)
+
+    assert pool.restarts[0] == 0
@@ -0,0 +1,87 @@
+import http.server
+import json
+import time
+import types
+
+import pytest
+
+import ollama_manager
+from ollama_manager import OllamaManager, PullJob
+
+LAYER = {"status": "pulling abc", "digest": "sha256:abc", "total": 100, "completed": 100}
+VERIFYING = {"status": "verifying sha256 digest"}
+SUCCESS = {"status": "success"}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(ollama_manager, "time", types.SimpleNamespace(time=time.time, sleep=lambda s: None))
+
+
+def pull_server(http_server, *attempts):
+    """``/api/pull`` answering the n-th request with ``attempts[n]``: (status, events)."""
+    requests_seen = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            status, events = attempts[min(len(requests_seen), len(attempts) - 1)]
+            requests_seen.append(self.path)
+            body = b"".join(json.dumps(event).encode() + b"\n" for event in events)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return OllamaManager(http_server(Handler)), requests_seen
+
+
+def pull(manager, max_attempts=5) -> PullJob:
+    job = PullJob(manager, "qwen2.5:0.5b", max_attempts=max_attempts, read_timeout=5)
+    job.start()
+    assert job.wait(10)
+    return job
+
+
+def test_interrupted_pull_resumes_until_verified(http_server):
+    manager, seen = pull_server(http_server, (200, [LAYER]), (200, [LAYER, VERIFYING, SUCCESS]))
+
+    job = pull(manager)
+
+    assert job.state == PullJob.SUCCESS and job.attempts == 2 and len(seen) == 2
+    assert job.progress() == 1.0
+
+
+@pytest.mark.parametrize("attempt", [
+    (200, [LAYER, {"error": "pull model manifest: file does not exist"}]),
+    (404, [{"error": "model 'nope' not found"}]),
+])
+def test_server_reported_errors_fail_without_retrying(http_server, attempt):
+    manager, seen = pull_server(http_server, attempt)
+
+    job = pull(manager)
+
+    assert job.state == PullJob.ERROR and job.attempts == 1 and len(seen) == 1
+    assert job.error == attempt[1][-1]["error"]
+
+
+def test_digest_mismatch_is_retried(http_server):
+    mismatch = {"error": "digest mismatch, file must be downloaded again: want sha256:abc, got sha256:def"}
+    manager, seen = pull_server(http_server, (200, [LAYER, mismatch]), (200, [LAYER, VERIFYING, SUCCESS]))
+
+    job = pull(manager)
+
+    assert job.state == PullJob.SUCCESS and len(seen) == 2
+
+
+def test_unverified_layers_give_up_after_max_attempts(http_server):
+    manager, seen = pull_server(http_server, (200, [LAYER, SUCCESS]))
+
+    job = pull(manager, max_attempts=3)
+
+    assert job.state == PullJob.ERROR and len(seen) == 3
+    assert "no verificó" in job.error
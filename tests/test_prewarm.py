@@ -0,0 +1,117 @@
+import pytest
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+import cascade
+import prewarm
+from cancellation import RunCancelled
+from scheduler import TierScheduler
+from support_system import agent
+from tool_cache import ToolResultCache, conversation_cache
+
+from conftest import ANSWER, answer_model, wait_until
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """A one-slot scheduler the prefill has to queue on."""
+    scheduler = TierScheduler("test", concurrency=1)
+    monkeypatch.setattr(prewarm, "get_scheduler", lambda backend: scheduler)
+    monkeypatch.setattr(prewarm, "scheduler_enabled", True)
+    return scheduler
+
+
+@pytest.fixture
+def entry_model(monkeypatch):
+    """The model settings of every request the entry model receives."""
+    requests = []
+
+    async def respond(messages, info):
+        requests.append(info.model_settings)
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, ANSWER)])
+
+    model = FunctionModel(respond)
+    monkeypatch.setattr(prewarm, "_entry_model", lambda: model)
+    return requests
+
+
+def test_prefetch_warms_the_first_tool_calls(customer, shipping_db):
+    cache = ToolResultCache()
+
+    handle = prewarm.prewarm_session(customer, cache, with_prefill=False)
+
+    assert handle.error is None and handle.done.is_set()
+    assert handle.prefetched >= 3  # most recent order plus each of the two by id
+    with agent.override(model=answer_model(tool_calls=[("get_order_and_shipping_status", {"order_id": "12345"})])), \
+            conversation_cache(cache):
+        agent.run_sync("where is it?", deps=customer)
+    assert cache.stats()["hits"] == 1
+
+
+def test_prefill_queues_at_basic_priority_behind_replies(customer, shipping_db, scheduler, entry_model):
+    scheduler.acquire("vip")
+    handle = prewarm.start_prewarm(customer, ToolResultCache(), with_prefill=True)
+
+    wait_until(lambda: scheduler.pressure()["queue_depth"]["basic"] == 1)
+    assert handle.state == "pending" and not entry_model
+    scheduler.release()
+
+    assert handle.done.wait(5)
+    assert handle.error is None and handle.prefilled
+    assert entry_model == [{"max_tokens": 1}]
+    assert handle.prefill_usage["input_tokens"] > 0
+
+
+def test_selecting_another_customer_cancels_a_queued_prefill(customer, shipping_db, scheduler, entry_model):
+    scheduler.acquire("vip")
+    handle = prewarm.start_prewarm(customer, ToolResultCache(), with_prefill=True)
+    wait_until(lambda: scheduler.pressure()["queue_depth"]["basic"] == 1)
+
+    handle.cancel()
+
+    assert handle.done.wait(5)
+    assert isinstance(handle.error, RunCancelled)
+    assert not handle.prefilled and not entry_model
+    assert scheduler.pressure()["queue_depth"]["basic"] == 0
+    scheduler.release()
+
+
+def test_cascade_prefill_waits_for_the_small_tier_without_starting_it(customer, shipping_db, monkeypatch):
+    def never(*args):
+        raise AssertionError("the prewarm must not start the small model")
+
+    monkeypatch.setattr(cascade, "cascade_enabled", True)
+    monkeypatch.setattr(cascade, "ensure_ollama_ready", never)
+    monkeypatch.setattr(cascade, "_cascade", None)
+    assert not prewarm.prefill_available()
+
+    small = answer_model()
+    cascaded = cascade.ModelCascade("small-test", answer_model(), 0.7, set())
+    cascaded._small_model = small
+    monkeypatch.setattr(cascade, "_cascade", cascaded)
+    assert prewarm.prefill_available()
+    assert prewarm._entry_model() is small
+
+
+def test_prefill_skips_an_uninitialized_small_tier(customer, shipping_db, monkeypatch):
+    monkeypatch.setattr(cascade, "cascade_enabled", True)
+    monkeypatch.setattr(cascade, "_cascade", None)
+    monkeypatch.setattr(prewarm, "prefill_available", lambda: True)
+
+    handle = prewarm.prewarm_session(customer, ToolResultCache(), with_prefill=True)
+
+    assert handle.error is None and handle.prefetched >= 3
+    assert not handle.prefilled
+
+
+def test_prefill_failure_keeps_the_prefetch(customer, shipping_db, monkeypatch):
+    def broken():
+        raise RuntimeError("model down")
+
+    monkeypatch.setattr(prewarm, "_entry_model", broken)
+    monkeypatch.setattr(prewarm, "prefill_available", lambda: True)
+
+    handle = prewarm.prewarm_session(customer, ToolResultCache(), with_prefill=True)
+
+    assert handle.error is None and handle.prefetched >= 3
+    assert not handle.prefilled
@@ -0,0 +1,119 @@
+import pydantic
+import pytest
+
+import tool_cache
+from customer_directory import CustomerDirectory
+from profile_cache import ProfileCache, SQLiteProfileStore
+from support_system import CustomerDetails, OrderStatus, update_order_record
+from tool_cache import ToolResultCache, conversation_cache
+
+from conftest import make_customer
+
+
+def loader(customer, calls):
+    def load():
+        calls.append(customer.customer_id)
+        return customer
+    return load
+
+
+def test_read_through_and_invalidate():
+    cache, calls = ProfileCache(CustomerDetails), []
+    customer = make_customer("CUSTA")
+
+    assert cache.get("CUSTA", loader(customer, calls)) is customer
+    assert cache.get("CUSTA", loader(customer, calls)) is customer
+    cache.invalidate("CUSTA")
+    cache.get("CUSTA", loader(customer, calls))
+
+    assert calls == ["CUSTA", "CUSTA"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_profiles_are_evicted_by_size():
+    size = len(make_customer("CUST1").model_dump_json())
+    cache = ProfileCache(CustomerDetails, max_bytes=int(size * 2.5))
+    for customer_id in ("CUST1", "CUST2"):
+        cache.get(customer_id, lambda customer_id=customer_id: make_customer(customer_id))
+    cache.get("CUST1", None)
+    cache.get("CUST3", lambda: make_customer("CUST3"))
+
+    assert list(cache._entries) == ["CUST1", "CUST3"]
+    assert cache.stats()["evictions"] == 1 and cache.bytes <= cache.max_bytes
+
+
+def test_replacement_reaches_other_processes(tmp_path):
+    path = str(tmp_path / "profiles.sqlite3")
+    first = ProfileCache(CustomerDetails, store=SQLiteProfileStore(path), recheck=0)
+    second = ProfileCache(CustomerDetails, store=SQLiteProfileStore(path), recheck=0)
+    original = make_customer("CUSTB")
+    first.get("CUSTB", lambda: original)
+    assert second.get("CUSTB", None).name == original.name and second.stats()["store_hits"] == 1
+
+    updated = original.model_copy(update={"name": "Renamed"})
+    first.replace("CUSTB", updated)
+
+    assert second.get("CUSTB", None).name == "Renamed"
+    assert first.get("CUSTB", None) is updated
+
+
+def test_stale_load_does_not_overwrite_a_newer_profile(tmp_path):
+    store = SQLiteProfileStore(str(tmp_path / "profiles.sqlite3"))
+    version = store.replace("CUSTC", make_customer("CUSTC").model_copy(update={"name": "New"}).model_dump_json())
+
+    store.put("CUSTC", version - 1, make_customer("CUSTC").model_dump_json())
+
+    stored_version, data = store.get("CUSTC")
+    assert stored_version == version and CustomerDetails.model_validate_json(data).name == "New"
+
+
+def test_profiles_are_frozen():
+    customer = make_customer()
+
+    with pytest.raises(pydantic.ValidationError):
+        customer.orders[0].status = OrderStatus.CANCELLED
+    with pytest.raises(pydantic.ValidationError):
+        customer.name = "Someone else"
+
+
+def test_order_update_is_copy_on_write(shipping_db):
+    directory = CustomerDirectory()
+    directory.add_profile(make_customer("CUSTD"))
+    shared = directory.get_profile("CUSTD")
+    conversation = ToolResultCache()
+    with conversation_cache(conversation):
+        conversation.get_or_compute("get_order_and_shipping_status", {"order_id": "#12345"},
+                                    lambda: {"status": "success"}, tags=lambda result: [tool_cache.order_tag("#12345")])
+
+    updated = update_order_record(shared, "12345", status=OrderStatus.CANCELLED)
+
+    assert shared.orders[0].status == OrderStatus.SHIPPED
+    assert updated.orders[0].status == OrderStatus.CANCELLED and updated.orders[1] is shared.orders[1]
+    assert directory.get_profile("CUSTD") is updated
+    assert conversation.stats()["entries"] == 0
+
+
+def test_order_updates_from_stale_snapshots_are_not_lost(shipping_db):
+    directory = CustomerDirectory()
+    directory.add_profile(make_customer("CUSTE"))
+    snapshot = directory.get_profile("CUSTE")
+
+    update_order_record(snapshot, "12345", status=OrderStatus.CANCELLED)
+    update_order_record(snapshot, "67890", status=OrderStatus.PROCESSING)
+
+    current = directory.get_profile("CUSTE")
+    assert [o.status for o in current.orders] == [OrderStatus.CANCELLED, OrderStatus.PROCESSING]
+
+
+def test_order_update_validates_the_change(shipping_db):
+    directory = CustomerDirectory()
+    directory.add_profile(make_customer("CUSTF"))
+    shared = directory.get_profile("CUSTF")
+
+    updated = update_order_record(shared, "12345", status="cancelled")
+
+    assert updated.orders[0].status is OrderStatus.CANCELLED
+    with pytest.raises(pydantic.ValidationError):
+        update_order_record(updated, "12345", status="lost")
+    with pytest.raises(KeyError, match="#99999"):
+        update_order_record(updated, "99999", status=OrderStatus.CANCELLED)
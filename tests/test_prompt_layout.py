@@ -0,0 +1,60 @@
+import json
+from types import SimpleNamespace
+
+import support_system
+from metrics import MetricsRegistry
+from support_system import build_customer_context, record_prompt_usage
+
+from conftest import make_customer, make_order
+
+
+def test_cache_layout_is_independent_of_order_sequence():
+    orders = [make_order("#12345", 1), make_order("#67890", 3), make_order("#11111", 5)]
+    forward = make_customer(orders=orders)
+    backward = make_customer(orders=list(reversed(orders)))
+
+    assert build_customer_context(forward) == build_customer_context(backward)
+
+
+def test_cache_layout_is_compact_sorted_json(customer):
+    context = build_customer_context(customer)
+
+    parsed = json.loads(context)
+    assert context == json.dumps(parsed, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    assert [o["order_id"] for o in parsed["orders"]] == ["#67890", "#12345"]  # oldest first
+    assert parsed["shipping_info_available"] == sorted(parsed["shipping_info_available"])
+
+
+def test_legacy_layout_keeps_insertion_order(customer, monkeypatch):
+    monkeypatch.setattr(support_system, "prompt_layout", "legacy")
+
+    parsed = json.loads(build_customer_context(customer))
+
+    assert list(parsed) == ["customer_details", "orders", "shipping_info_available"]
+    assert [o["order_id"] for o in parsed["orders"]] == ["#12345", "#67890"]
+
+
+def test_static_system_prompt_comes_first():
+    prompts = support_system.agent._system_prompts
+    assert prompts[0] == support_system.SYSTEM_PROMPT
+
+
+def test_record_prompt_usage_reports_cached_ratio_and_metrics(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(support_system, "metrics", registry)
+    usage = SimpleNamespace(input_tokens=1000, cache_read_tokens=800, output_tokens=50)
+    result = SimpleNamespace(usage=lambda: usage)
+
+    stats = record_prompt_usage(result)
+
+    assert stats == {"input_tokens": 1000, "cached_tokens": 800, "output_tokens": 50, "cached_ratio": 0.8}
+    assert registry.counter("prompt_input_tokens_total", {"layout": "cache"}) == 1000
+    assert registry.counter("prompt_cached_tokens_total", {"layout": "cache"}) == 800
+
+
+def test_record_prompt_usage_without_usage_data():
+    usage = SimpleNamespace(input_tokens=None, cache_read_tokens=None, output_tokens=None)
+
+    stats = record_prompt_usage(SimpleNamespace(usage=lambda: usage))
+
+    assert stats["cached_ratio"] == 0.0 and stats["input_tokens"] == 0
@@ -0,0 +1,184 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+from openai import APIConnectionError, AsyncOpenAI
+from pydantic_ai.exceptions import ModelHTTPError
+from pydantic_ai.models.openai import OpenAIChatModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+import support_system
+from metrics import metrics
+from rate_governor import GovernedModel, RateGovernor, TokenBucket, retry_after_seconds
+
+from conftest import ANSWER
+
+
+class RecordingGovernor(RateGovernor):
+    """Keeps the concurrency limit after every outcome and the queue seen by each caller."""
+
+    def __init__(self, endpoint, max_concurrency=4):
+        super().__init__(endpoint, rpm=0, tpm=0, max_concurrency=max_concurrency)
+        self.limits = [self.limit]
+        self.queue_seen = []
+
+    async def acquire(self, estimate):
+        self.queue_seen.append(len(self._queue))
+        return await super().acquire(estimate)
+
+    def release(self, estimate, used_tokens):
+        super().release(estimate, used_tokens)
+        self.limits.append(self.limit)
+
+    def throttled(self, retry_after):
+        pause = super().throttled(retry_after)
+        self.limits.append(self.limit)
+        return pause
+
+
+def completions_server(http_server, per_window=None, window=0.5, failures=()):
+    """Chat completions endpoint; at most ``per_window`` requests per ``window``
+    seconds (429 with Retry-After beyond that), and the first requests answered
+    with the status codes in ``failures``."""
+    lock, hits, stats = threading.Lock(), [], {"ok": 0, "429": 0, "requests": 0}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            now = time.monotonic()
+            with lock:
+                index = stats["requests"]
+                stats["requests"] += 1
+                while hits and now - hits[0] > window:
+                    hits.pop(0)
+                if index < len(failures):
+                    status = failures[index]
+                elif per_window is None or len(hits) < per_window:
+                    status = 200
+                    hits.append(now)
+                    stats["ok"] += 1
+                else:
+                    status = 429
+                    stats["429"] += 1
+                retry_after = window - (now - hits[0]) if status == 429 else 0
+            if status != 200:
+                return self.reply(status, {"error": {"message": "nope", "type": "error"}},
+                                  {"Retry-After": f"{retry_after:.2f}"} if status == 429 else {})
+            time.sleep(0.05)
+            call = {"name": "final_result", "arguments": json.dumps(ANSWER)}
+            self.reply(200, {
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 1, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "tool_calls", "message": {
+                    "role": "assistant", "content": None,
+                    "tool_calls": [{"id": f"call-{time.time_ns()}", "type": "function", "function": call}]}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+            })
+
+        def reply(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in {"Content-Type": "application/json", **(headers or {})}.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return http_server(Handler), stats
+
+
+def governed(url, governor, transient_retries=2):
+    # Same client setup as support_system with the governor enabled
+    client = AsyncOpenAI(api_key="test", base_url=f"{url}/v1", max_retries=0)
+    model = OpenAIChatModel("test-model", provider=OpenAIProvider(openai_client=client))
+    return GovernedModel(model, governor, max_retries=10, transient_retries=transient_retries)
+
+
+def ask_all(model, customer, count):
+    async def run():
+        return await asyncio.gather(*(support_system.agent.run("where is my order?", deps=customer)
+                                      for _ in range(count)))
+
+    with support_system.agent.override(model=model):
+        return asyncio.run(run())
+
+
+def test_throttled_callers_queue_and_concurrency_recovers(http_server, customer):
+    url, stats = completions_server(http_server, per_window=2, window=0.4)
+    governor = RecordingGovernor("throttle-test")
+
+    results = ask_all(governed(url, governor), customer, 8)
+
+    assert [r.output.response for r in results] == [ANSWER["response"]] * 8
+    assert stats["ok"] == 8 and stats["429"] > 0
+    assert max(governor.queue_seen) > 0
+    # Halved on the 429s, then grown back by the successes that followed
+    lowest = min(governor.limits)
+    assert lowest < governor.limits[0]
+    assert governor.limits[-1] > lowest
+    labels = {"endpoint": "throttle-test"}
+    assert metrics.counter("rate_governor_throttled_total", labels) == stats["429"]
+    assert metrics.counter("rate_governor_requests_total", labels) == 8
+    assert metrics.counter("rate_governor_tokens_total", labels) == 8 * 120
+    assert metrics.gauge("rate_governor_concurrency_limit", labels) == governor.limits[-1]
+    assert metrics.gauge("rate_governor_queue_depth", labels) == 0
+    assert metrics.summary("rate_governor_wait_seconds", labels)["max"] > 0
+    assert governor.stats()["in_flight"] == 0
+
+
+def test_server_errors_are_retried_without_cutting_concurrency(http_server, customer):
+    url, stats = completions_server(http_server, failures=(503,))
+    governor = RecordingGovernor("transient-test")
+
+    [result] = ask_all(governed(url, governor), customer, 1)
+
+    assert result.output.response == ANSWER["response"] and stats["requests"] == 2
+    assert governor.limits == [2.0, 2.5]
+    assert metrics.counter("rate_governor_retries_total", {"endpoint": "transient-test", "reason": "503"}) == 1
+    assert metrics.counter("rate_governor_throttled_total", {"endpoint": "transient-test"}) == 0
+
+
+def test_client_errors_are_not_retried(http_server, customer):
+    url, stats = completions_server(http_server, failures=(400,))
+    governor = RecordingGovernor("client-error-test")
+
+    with pytest.raises(ModelHTTPError):
+        ask_all(governed(url, governor), customer, 1)
+
+    assert stats["requests"] == 1 and governor.in_flight == 0
+
+
+def test_connection_errors_give_up_after_the_transient_retries(customer):
+    governor = RecordingGovernor("refused-test")
+
+    with pytest.raises(APIConnectionError):
+        ask_all(governed("http://127.0.0.1:9", governor, transient_retries=1), customer, 1)
+
+    assert governor.queue_seen == [0, 0] and governor.in_flight == 0
+    assert metrics.counter("rate_governor_retries_total",
+                           {"endpoint": "refused-test", "reason": "APIConnectionError"}) == 1
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.take(60, now=bucket.updated)
+
+    assert bucket.wait_time(1, now=bucket.updated) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now=bucket.updated + 1.0) == 0.0
+
+
+def test_retry_after_is_read_in_seconds_or_milliseconds():
+    class Response:
+        def __init__(self, headers):
+            self.headers = headers
+
+    error = Exception()
+    error.response = Response({"retry-after-ms": "1500", "retry-after": "9"})
+    assert retry_after_seconds(error) == 1.5
+    error.response = Response({"retry-after": "2"})
+    assert retry_after_seconds(error) == 2.0
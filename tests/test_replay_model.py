@@ -0,0 +1,53 @@
+import pytest
+from pydantic_ai.models.function import FunctionModel
+
+import support_system
+from replay_model import Cassette, CassetteMiss, RecordReplayModel
+
+from conftest import answer_model
+
+TOOL_CALLS = [("get_order_and_shipping_status", {"order_id": "12345"})]
+
+
+def offline_model() -> FunctionModel:
+    """Same model name as ``answer_model`` but fails if it is ever called."""
+    async def respond(messages, info):
+        raise AssertionError("replay reached the model")
+    return FunctionModel(respond)
+
+
+def run(model, customer, question="where is my order?"):
+    with support_system.agent.override(model=model):
+        return support_system.agent.run_sync(question, deps=customer)
+
+
+def test_replay_serves_the_recorded_run_without_the_model(tmp_path, customer):
+    path = str(tmp_path / "cassette.jsonl.gz")
+    recorded = run(RecordReplayModel(answer_model(TOOL_CALLS), Cassette(path), "record"), customer)
+
+    cassette = Cassette(path)
+    replayed = run(RecordReplayModel(offline_model(), cassette, "replay"), customer)
+
+    # The tool-call turn and the final answer
+    assert len(cassette) == 2
+    assert replayed.output.model_dump(exclude={"response_time"}) == \
+        recorded.output.model_dump(exclude={"response_time"})
+    assert [m.parts[0].part_kind for m in replayed.all_messages()] == \
+        [m.parts[0].part_kind for m in recorded.all_messages()]
+
+
+def test_unrecorded_request_is_a_cassette_miss(tmp_path, customer):
+    path = str(tmp_path / "cassette.jsonl")
+    run(RecordReplayModel(answer_model(), Cassette(path), "record"), customer)
+
+    with pytest.raises(CassetteMiss):
+        run(RecordReplayModel(offline_model(), Cassette(path), "replay"), customer, "cancel my order")
+
+
+def test_repeated_requests_replay_in_order_then_repeat_the_last(tmp_path, customer):
+    path = str(tmp_path / "cassette.jsonl")
+    for response in ("first", "second"):
+        run(RecordReplayModel(answer_model(response=response), Cassette(path), "record"), customer)
+
+    model = RecordReplayModel(offline_model(), Cassette(path), "replay")
+    assert [run(model, customer).output.response for _ in range(3)] == ["first", "second", "second"]
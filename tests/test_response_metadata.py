@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+import support_system
+from response_metadata import predict_satisfaction, score_sentiment
+
+LEAN_ANSWER = {
+    "response": "Order #12345 is on its way with FedEx.",
+    "response_type": "shipping",
+    "needs_escalation": True,
+    "follow_up_required": False,
+    "confidence_score": 0.8,
+}
+
+
+def lean_model(tool_calls):
+    async def respond(messages, info):
+        if len(messages) == 1:
+            return ModelResponse(parts=[ToolCallPart(name, args) for name, args in tool_calls])
+        tool = info.output_tools[0]
+        assert set(tool.parameters_json_schema["properties"]) == set(LEAN_ANSWER)
+        return ModelResponse(parts=[ToolCallPart(tool.name, LEAN_ANSWER)])
+    return FunctionModel(respond)
+
+
+@pytest.mark.parametrize("text, label", [
+    ("Thanks, that was really helpful!", "positive"),
+    ("My package is late and the box arrived damaged", "negative"),
+    ("I am not happy with this", "negative"),
+    ("Where is my order?", "neutral"),
+])
+def test_sentiment_lexicon(text, label):
+    assert score_sentiment(text)[0] == label
+
+
+def test_satisfaction_blends_sentiment_confidence_and_flags():
+    assert predict_satisfaction(1.0, 1.0, False, False) == 0.95
+    assert predict_satisfaction(-1.0, 0.0, True, True) == 0.05
+    assert predict_satisfaction(0.0, 0.5, True, False) < predict_satisfaction(0.0, 0.5, False, False)
+
+
+def test_lean_output_is_completed_from_the_run(customer, shipping_db):
+    model = lean_model([("get_order_and_shipping_status", {"order_id": "12345"}),
+                        ("get_policy_info", {"policy_type": "return", "customer_tier": "premium"})])
+
+    with support_system.agent.override(model=model):
+        # The output function is sync, so it runs on an AnyIO worker thread
+        # that only exits when its event loop is closed
+        result = asyncio.run(support_system.agent.run(
+            "My order is late, this is unacceptable!", deps=customer,
+            output_type=support_system.response_output_type("lean")))
+
+    output = result.output
+    assert output.response == LEAN_ANSWER["response"] and output.confidence_score == 0.8
+    assert output.sentiment == "negative"
+    assert output.references == {"order_id": "#12345", "tracking_number": "FDX123456789"}
+    assert output.knowledge_base_refs == ["return:premium"]
+    assert output.suggested_actions == ["escalate_to_human_agent"]
+    assert output.escalation_reason == "shipping query, negative sentiment, confidence 0.80"
@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from cancellation import CancelToken, RunCancelled, scope
+from scheduler import QueueDeadlineExceeded, SchedulerOverloaded, TierScheduler
+
+from conftest import wait_until
+
+
+def queued(scheduler):
+    return sum(scheduler.pressure()["queue_depth"].values())
+
+
+def test_free_slot_is_granted_immediately():
+    scheduler = TierScheduler("test", concurrency=2)
+
+    with scheduler.slot("basic") as waited:
+        assert waited == 0.0
+        assert scheduler.pressure()["active"] == 1
+    assert scheduler.pressure()["active"] == 0
+
+
+def test_higher_tiers_are_served_first_without_starving_basic():
+    scheduler = TierScheduler("test", concurrency=1)
+    order = []
+
+    def request(tier):
+        scheduler.run(tier, order.append, tier)
+
+    scheduler.acquire("basic")
+    threads = []
+    for tier in ["basic", "basic", "vip", "vip", "premium"]:
+        threads.append(threading.Thread(target=request, args=(tier,)))
+        threads[-1].start()
+        wait_until(lambda: queued(scheduler) == len(threads))
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+
+    assert order[0] == "vip"
+    assert sorted(order) == ["basic", "basic", "premium", "vip", "vip"]
+
+
+def test_full_tier_queue_is_rejected_with_retry_hint():
+    scheduler = TierScheduler("test", concurrency=1, max_queue_depth=1)
+    scheduler.acquire("basic")
+    waiter = threading.Thread(target=lambda: scheduler.run("basic", lambda: None))
+    waiter.start()
+    wait_until(lambda: queued(scheduler) == 1)
+
+    with pytest.raises(SchedulerOverloaded) as rejected:
+        scheduler.acquire("basic")
+
+    assert rejected.value.retry_after > 0
+    scheduler.release()
+    waiter.join(5)
+
+
+def test_queue_deadline_rejects_or_degrades():
+    scheduler = TierScheduler("test", concurrency=1)
+    scheduler.acquire("vip")
+
+    with pytest.raises(QueueDeadlineExceeded):
+        scheduler.acquire("basic", deadline=0.05)
+    assert scheduler.run("basic", lambda: "model", deadline=0.05,
+                         degrade=lambda rejection: f"degraded:{rejection.tier}") == "degraded:basic"
+    assert queued(scheduler) == 0
+
+
+def test_cancelled_request_leaves_the_queue():
+    scheduler = TierScheduler("test", concurrency=1)
+    scheduler.acquire("vip")
+    token = CancelToken()
+    errors = []
+
+    def request():
+        with scope(token):
+            try:
+                scheduler.acquire("basic")
+            except RunCancelled as e:
+                errors.append(e)
+
+    waiter = threading.Thread(target=request)
+    waiter.start()
+    wait_until(lambda: queued(scheduler) == 1)
+    token.cancel("stopped")
+    waiter.join(5)
+
+    assert errors and errors[0].reason == "stopped"
+    assert queued(scheduler) == 0 and scheduler.pressure()["active"] == 1
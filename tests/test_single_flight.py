@@ -0,0 +1,114 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cancellation
+from cancellation import CancelToken, RunCancelled
+from single_flight import SingleFlight, coalesce_key, normalize_prompt
+
+from conftest import wait_until
+
+
+class Gate:
+    """A run that blocks until released and counts its executions."""
+
+    def __init__(self):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.saw_cancel = threading.Event()
+
+    def __call__(self, value):
+        self.calls += 1
+        self.started.set()
+        token = cancellation.current_token()
+        while not self.release.wait(0.01):
+            if token.is_set():
+                self.saw_cancel.set()
+                raise token.error()
+        return value
+
+
+def test_prompts_differing_in_case_spacing_or_punctuation_share_a_key():
+    assert normalize_prompt("  Where is   my ORDER?! ") == "where is my order"
+    assert coalesce_key("C1", "Where is my order?", "fp") == coalesce_key("C1", "where is my order", "fp")
+    assert coalesce_key("C1", "where is my order", "fp") != coalesce_key("C2", "where is my order", "fp")
+
+
+def test_concurrent_duplicates_run_once():
+    flights, gate = SingleFlight(linger=0), Gate()
+    with ThreadPoolExecutor(3) as pool:
+        leader = pool.submit(flights.do, "k", gate, "answer")
+        assert gate.started.wait(5)
+        followers = [pool.submit(flights.do, "k", gate, "other") for _ in range(2)]
+        wait_until(lambda: flights._flights["k"].participants == 3)
+        gate.release.set()
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert gate.calls == 1
+    assert [(value, shared) for value, _, shared in results] == [("answer", False), ("answer", True), ("answer", True)]
+
+
+def test_errors_reach_every_participant_and_are_not_lingered():
+    flights = SingleFlight(linger=60)
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("backend down")
+
+    with ThreadPoolExecutor(2) as pool:
+        calls = [pool.submit(flights.do, "k", fail) for _ in range(2)]
+        wait_until(lambda: "k" in flights._flights and flights._flights["k"].participants == 2)
+        release.set()
+        for call in calls:
+            with pytest.raises(ValueError):
+                call.result(5)
+
+    assert flights.do("k", lambda: "retried")[0] == "retried"
+
+
+def test_detached_participant_leaves_the_run_to_the_others():
+    flights, gate = SingleFlight(linger=0), Gate()
+    impatient = CancelToken()
+    with ThreadPoolExecutor(2) as pool:
+        patient = pool.submit(flights.do, "k", gate, "answer")
+        assert gate.started.wait(5)
+        detached = pool.submit(flights.do, "k", gate, "answer", cancel=impatient)
+        wait_until(lambda: flights._flights["k"].participants == 2)
+        impatient.cancel("user")
+        with pytest.raises(RunCancelled):
+            detached.result(5)
+        gate.release.set()
+        assert patient.result(5)[0] == "answer"
+
+    assert not gate.saw_cancel.is_set()
+
+
+def test_last_participant_leaving_cancels_the_run():
+    flights, gate = SingleFlight(linger=0), Gate()
+    token = CancelToken()
+    with ThreadPoolExecutor(1) as pool:
+        call = pool.submit(flights.do, "k", gate, "answer", cancel=token)
+        assert gate.started.wait(5)
+        token.cancel("user")
+        with pytest.raises(RunCancelled):
+            call.result(5)
+
+    assert gate.saw_cancel.wait(5)
+    assert "k" not in flights._flights
+
+
+def test_finished_result_lingers_for_late_duplicates():
+    flights = SingleFlight(linger=60)
+    calls = []
+
+    def run():
+        calls.append(1)
+        return len(calls)
+
+    assert flights.do("k", run)[0] == 1
+    value, _, shared = flights.do("k", run)
+
+    assert (value, shared, len(calls)) == (1, True, 1)
@@ -0,0 +1,145 @@
+import http.server
+import json
+
+import fast_path
+import startup
+from startup import StartupOrchestrator
+
+
+class FakeJob:
+    SUCCESS = "success"
+
+    def __init__(self, state, error=None):
+        self.state, self.error = state, error
+
+    def wait(self):
+        return True
+
+
+class FakeManager:
+    """The parts of ``OllamaManager`` the orchestrator drives."""
+
+    def __init__(self, base_url, running=True, installed=True, pulls=None):
+        self.base_url = base_url
+        self.running = running
+        self.installed = installed
+        self.pulls = pulls or {}
+        self.pulled = []
+
+    def is_running(self):
+        return self.running
+
+    def _run_setup_if_needed(self):
+        return self.installed
+
+    def start_server(self):
+        self.running = True
+        return True
+
+    def model_available(self, model_name):
+        return model_name not in self.pulls
+
+    def pull_model_async(self, model_name):
+        self.pulled.append(model_name)
+        return self.pulls[model_name]
+
+    def pull_status(self):
+        return {}
+
+
+def generate_server(http_server):
+    warmed = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            warmed.append(json.loads(self.rfile.read(int(self.headers["Content-Length"])))["model"])
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    return http_server(Handler), warmed
+
+
+def test_models_are_pulled_and_warmed_until_ready(http_server):
+    url, warmed = generate_server(http_server)
+    manager = FakeManager(url, running=False, pulls={"large": FakeJob(FakeJob.SUCCESS)})
+
+    orchestrator = StartupOrchestrator(manager, ["small", "large", "small"]).start()
+
+    assert orchestrator.wait_ready(10)
+    assert orchestrator.state == startup.READY and orchestrator.reason is None
+    assert manager.pulled == ["large"] and sorted(warmed) == ["large", "small"]
+    assert set(orchestrator.snapshot()["phase_timings"]) == {
+        startup.INSTALLING, startup.STARTING, startup.PULLING, startup.WARMING}
+
+
+def test_running_server_skips_install_and_start(http_server):
+    url, _ = generate_server(http_server)
+
+    orchestrator = StartupOrchestrator(FakeManager(url), ["small"]).start()
+
+    assert orchestrator.wait_ready(10)
+    assert startup.INSTALLING not in orchestrator.phase_timings
+
+
+def test_missing_binary_degrades():
+    orchestrator = StartupOrchestrator(FakeManager("http://127.0.0.1:9", running=False, installed=False), ["m"])
+
+    assert not orchestrator.start().wait_ready(10)
+    assert orchestrator.state == startup.DEGRADED and orchestrator.reason == "ollama no está instalado"
+
+
+def test_failed_pull_degrades(http_server):
+    url, warmed = generate_server(http_server)
+    manager = FakeManager(url, pulls={"large": FakeJob("error", "no space left on device")})
+
+    orchestrator = StartupOrchestrator(manager, ["small", "large"]).start()
+
+    assert not orchestrator.wait_ready(10)
+    assert orchestrator.reason == "no se pudo preparar: large"
+    assert warmed == ["small"]
+
+
+def test_fast_path_answers_order_status(customer, shipping_db):
+    output = fast_path.answer("where is order 12345?", customer).output
+
+    assert output.references == {"order_id": "#12345"}
+    assert "FedEx" in output.response and not output.follow_up_required
+
+
+def test_fast_path_answers_tier_return_policy(customer):
+    output = fast_path.answer("can I get a refund?", customer).output
+
+    assert output.response == "As a premium customer you can return items within 60 days from delivery."
+    assert output.knowledge_base_refs == ["return_policies"]
+
+
+def test_fast_path_uses_only_the_shipping_fields_it_has(customer, shipping_db):
+    shipping_db["#12345"] = {"status": "Delayed", "tracking_number": "FDX123456789"}
+
+    output = fast_path.answer("where is order 12345?", customer).output
+
+    assert output.response.endswith("Shipping: status Delayed.")
+
+
+def test_fast_path_return_policy_without_the_standard_window(customer, monkeypatch):
+    class Snapshot:
+        def article(self, section):
+            return {"vip": "90 days"} if section == "return_policies" else None
+
+    monkeypatch.setattr(fast_path.kb_store, "current", lambda: Snapshot())
+
+    output = fast_path.answer("can I get a refund?", customer).output
+
+    assert output.follow_up_required and output.knowledge_base_refs != ["return_policies"]
+
+
+def test_fast_path_flags_other_questions_for_follow_up(customer):
+    result = fast_path.answer("can you change my email?", customer)
+
+    assert result.tier == "fast_path" and result.output.follow_up_required
+    assert result.usage().requests == 0
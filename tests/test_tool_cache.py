@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+import support_system
+import tool_cache
+from support_system import agent, update_shipping_record
+from tool_cache import ToolResultCache, conversation_cache
+
+from conftest import answer_model
+
+
+def test_hit_after_miss_and_stats():
+    cache = ToolResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"status": "success"}
+
+    first = cache.get_or_compute("tool", {"b": 2, "a": 1}, compute)
+    second = cache.get_or_compute("tool", {"a": 1, "b": 2}, compute)
+
+    assert first is second and len(calls) == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1, "invalidations": 0}
+
+
+def test_uncacheable_results_are_returned_but_not_stored():
+    cache = ToolResultCache()
+    results = iter([{"status": "error"}, {"status": "success"}])
+    ok = lambda result: result["status"] == "success"
+
+    assert cache.get_or_compute("tool", {}, lambda: next(results), cacheable=ok)["status"] == "error"
+    assert cache.get_or_compute("tool", {}, lambda: next(results), cacheable=ok)["status"] == "success"
+    assert cache.stats()["entries"] == 1
+
+
+def test_none_is_a_cacheable_result():
+    cache = ToolResultCache()
+    calls = []
+    compute = lambda: calls.append(1)
+
+    cache.get_or_compute("tool", {}, compute)
+    cache.get_or_compute("tool", {}, compute)
+
+    assert len(calls) == 1
+
+
+def test_async_and_sync_paths_share_entries():
+    cache = ToolResultCache()
+
+    async def compute():
+        return "async"
+
+    assert asyncio.run(cache.aget_or_compute("tool", {"x": 1}, compute)) == "async"
+    assert cache.get_or_compute("tool", {"x": 1}, lambda: "sync") == "async"
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidate_drops_only_tagged_entries_in_every_live_cache():
+    first, second = ToolResultCache(), ToolResultCache()
+    for cache in (first, second):
+        cache.get_or_compute("order", {"id": 1}, lambda: 1, tags=lambda r: [tool_cache.order_tag("#1")])
+        cache.get_or_compute("order", {"id": 2}, lambda: 2, tags=lambda r: [tool_cache.order_tag("#2")])
+
+    assert tool_cache.invalidate(tool_cache.order_tag("#1")) >= 2
+
+    for cache in (first, second):
+        assert cache.stats()["entries"] == 1 and cache.stats()["invalidations"] == 1
+
+
+def test_result_computed_across_an_invalidation_is_not_stored():
+    cache = ToolResultCache()
+    tags = lambda r: [tool_cache.order_tag("#1")]
+
+    def compute():
+        # The record changes after the tool has read it
+        cache.invalidate(tool_cache.order_tag("#1"))
+        return "stale"
+
+    assert cache.get_or_compute("order", {"id": 1}, compute, tags=tags) == "stale"
+    assert cache.get_or_compute("order", {"id": 1}, lambda: "fresh", tags=tags) == "fresh"
+    assert cache.get_or_compute("order", {"id": 1}, lambda: "later", tags=tags) == "fresh"
+
+
+def test_shipping_update_rejects_unknown_orders(shipping_db):
+    with pytest.raises(KeyError, match="#99999"):
+        update_shipping_record("99999", status="Delivered")
+
+    assert "#99999" not in shipping_db
+
+
+def test_conversation_cache_is_scoped():
+    cache = ToolResultCache()
+    assert tool_cache.current_cache() is None
+    with conversation_cache(cache):
+        assert tool_cache.current_cache() is cache
+    assert tool_cache.current_cache() is None
+
+
+def test_repeated_tool_calls_in_a_conversation_hit_until_the_record_changes(customer, shipping_db):
+    cache = ToolResultCache()
+    model = answer_model(tool_calls=[("get_order_and_shipping_status", {"order_id": "12345"})])
+
+    with agent.override(model=model), conversation_cache(cache):
+        agent.run_sync("where is it?", deps=customer)
+        agent.run_sync("and now?", deps=customer)
+        assert cache.stats()["hits"] == 1
+
+        update_shipping_record("12345", status="Delivered")
+        assert cache.stats()["entries"] == 0
+        agent.run_sync("and now?", deps=customer)
+
+    assert cache.stats()["misses"] == 2
+    assert support_system.shipping_info_db["#12345"]["status"] == "Delivered"
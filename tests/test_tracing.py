@@ -0,0 +1,91 @@
+import io
+import json
+import logging
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def traces(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracing.configure(True, str(path), sample_rate=1.0)
+
+    def read():
+        tracing.flush()
+        return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+    yield read
+    tracing.configure(False)
+
+
+def test_nested_spans_share_the_trace(traces):
+    with tracing.span("agent.run", customer_id="C1") as run:
+        with tracing.span("tool.lookup") as tool:
+            tool.set_attribute("hits", 1)
+
+    child, parent = traces()
+    assert (child["name"], parent["name"]) == ("tool.lookup", "agent.run")
+    assert child["trace_id"] == parent["trace_id"] == run.trace_id
+    assert child["parent_span_id"] == parent["span_id"] and parent["parent_span_id"] is None
+    assert child["attributes"] == {"hits": 1} and parent["attributes"] == {"customer_id": "C1"}
+
+
+def test_failed_span_records_the_error(traces):
+    with pytest.raises(ValueError):
+        with tracing.span("agent.run"):
+            raise ValueError("bad output")
+
+    [span] = traces()
+    assert span["status"] == {"code": "ERROR", "message": "ValueError: bad output"}
+
+
+def test_unsampled_traces_are_not_exported(traces):
+    tracing.configure(True, sample_rate=0.0)
+    with tracing.span("agent.run"):
+        with tracing.span("model.request"):
+            pass
+
+    assert traces() == []
+
+
+def test_disabled_tracing_is_a_shared_noop():
+    assert tracing.span("agent.run") is tracing.span("other")
+    assert tracing.current_trace_id() is None
+
+
+def test_log_lines_carry_the_active_trace_and_span_ids(traces):
+    root, logger = logging.getLogger(), logging.getLogger("support.test")
+    existing = logging.StreamHandler(io.StringIO())
+    existing.setFormatter(logging.Formatter("%(message)s"))
+    root.addHandler(existing)
+    saved_level = root.level
+    logger.setLevel(logging.INFO)
+    try:
+        tracing.install_log_correlation("INFO")
+        stream = io.StringIO()
+        tracing._log_handler.setStream(stream)
+        with tracing.span("agent.run") as span:
+            logger.info("calling the model")
+        logger.info("idle")
+        logging.getLogger("support.quiet").info("below the logger's level")
+    finally:
+        root.removeHandler(existing)
+        logger.setLevel(logging.NOTSET)
+
+    inside, outside = stream.getvalue().splitlines()
+    assert f"[trace_id={span.trace_id} span_id={span.span_id}] calling the model" in inside
+    assert "[trace_id=- span_id=-] idle" in outside
+    # Other handlers and levels are not touched
+    assert existing.stream.getvalue().splitlines() == ["calling the model", "idle"]
+    assert root.level == saved_level
+
+
+def test_disabling_tracing_detaches_the_log_handler(traces):
+    handler = tracing._log_handler
+    assert handler in logging.getLogger().handlers
+
+    tracing.configure(False)
+
+    assert handler not in logging.getLogger().handlers and tracing._log_handler is None
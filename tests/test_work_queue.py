@@ -0,0 +1,119 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from work_queue import DEFAULT_HANDLERS, WorkerPool, WorkQueue, enqueue_response_side_effects
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(str(tmp_path / "queue.sqlite3"), lease_seconds=0.05, backoff_base=0.05)
+
+
+def test_claimed_job_is_invisible_until_its_lease_expires(queue):
+    job_id = queue.enqueue("escalation", {"customer_id": "C1"})
+
+    job = queue.claim()
+    assert job.id == job_id and job.attempts == 1
+    assert queue.claim() is None
+
+    time.sleep(0.06)
+    again = queue.claim()
+    assert again.id == job_id and again.attempts == 2
+
+
+def test_acked_job_is_removed(queue):
+    queue.enqueue("escalation", {"customer_id": "C1"})
+    queue.ack(queue.claim())
+
+    time.sleep(0.06)
+    assert queue.claim() is None
+    assert queue.depth() == {"pending": 0, "dead_letters": 0}
+
+
+def test_worker_whose_lease_expired_cannot_ack_or_fail_the_job(queue):
+    job_id = queue.enqueue("escalation", {"customer_id": "C1"})
+    stale = queue.claim()
+    time.sleep(0.06)
+    current = queue.claim()
+
+    assert not queue.ack(stale)
+    assert not queue.fail(stale, "late failure")
+    with queue.connect() as conn:
+        row = conn.execute("SELECT status, lease_until, last_error FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert (row["status"], row["lease_until"], row["last_error"]) == ("running", current.lease_until, None)
+
+    assert queue.ack(current)
+    assert queue.depth()["pending"] == 0
+
+
+def test_failed_job_is_retried_with_exponential_backoff(queue):
+    queue.enqueue("escalation", {"customer_id": "C1"}, max_attempts=5)
+    delays = []
+    for _ in range(3):
+        job = queue.claim()
+        failed_at = time.time()
+        queue.fail(job, "boom")
+        with queue.connect() as conn:
+            available_at = conn.execute("SELECT available_at FROM jobs").fetchone()[0]
+        delays.append(available_at - failed_at)
+        assert queue.claim() is None
+        time.sleep(delays[-1] + 0.01)
+
+    # base * 2 ** (attempt - 1), with ±20% jitter
+    for attempt, delay in enumerate(delays, start=1):
+        assert 0.8 * 0.05 * 2 ** (attempt - 1) - 0.01 <= delay <= 1.2 * 0.05 * 2 ** (attempt - 1)
+
+
+def test_job_is_dead_lettered_after_max_attempts(queue):
+    queue.enqueue("escalation", {"customer_id": "C1"}, max_attempts=2)
+    queue.fail(queue.claim(), "first")
+    time.sleep(0.15)
+    queue.fail(queue.claim(), "second")
+
+    assert queue.claim() is None
+    [dead] = queue.dead_letters()
+    assert dead["attempts"] == 2 and dead["last_error"] == "second"
+
+
+def test_poison_job_whose_lease_keeps_expiring_is_dead_lettered(queue):
+    queue.enqueue("escalation", {"customer_id": "C1"}, max_attempts=2)
+    # The worker dies mid-job twice: the job is never acked nor failed
+    assert queue.claim().attempts == 1
+    time.sleep(0.06)
+    assert queue.claim().attempts == 2
+    time.sleep(0.06)
+
+    assert queue.claim() is None
+    assert queue.depth() == {"pending": 0, "dead_letters": 1}
+    assert queue.dead_letters()[0]["last_error"] == "lease expired"
+
+
+def test_worker_pool_runs_handlers_and_side_effects_are_idempotent(queue):
+    output = SimpleNamespace(response="ok", needs_escalation=True, escalation_reason="angry",
+                             follow_up_required=True, auto_actions_taken=["refund"])
+    job_ids = enqueue_response_side_effects(queue, "C1", "refund please", output)
+    pool = WorkerPool(queue, DEFAULT_HANDLERS)
+
+    while pool.run_once():
+        pass
+
+    assert len(job_ids) == 3
+    with queue.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0] == 1
+        assert conn.execute("SELECT COUNT(*) FROM follow_ups").fetchone()[0] == 1
+        assert conn.execute("SELECT action FROM action_log").fetchone()[0] == "refund"
+    # Redelivery of the same job (at-least-once) does not duplicate the ticket
+    DEFAULT_HANDLERS["escalation"](SimpleNamespace(dedupe_key="x", payload={"customer_id": "C1"}), queue)
+    DEFAULT_HANDLERS["escalation"](SimpleNamespace(dedupe_key="x", payload={"customer_id": "C1"}), queue)
+    with queue.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0] == 2
+
+
+def test_unknown_job_kind_is_dead_lettered(queue):
+    queue.enqueue("unknown", {}, max_attempts=1)
+
+    assert WorkerPool(queue, {}).run_once()
+
+    assert "No handler" in queue.dead_letters()[0]["last_error"]
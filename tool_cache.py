@@ -0,0 +1,172 @@
+"""Per-conversation memoization of tool results.
+
+A ``ToolResultCache`` lives as long as a conversation (e.g. one Streamlit chat
+session) and is activated around each agent run with ``conversation_cache``.
+Entries are keyed by tool name plus normalized arguments and tagged with the
+records they were built from (``order:#12345``, ``customer:CUST001``), so
+``invalidate`` can drop exactly the stale entries when a record changes.
+A result computed while one of its records was invalidated is returned but
+not stored, since it may have been read before the change.
+"""
+import json
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from metrics import metrics
+
+CacheKey = Tuple[str, str]
+
+# Lookup result for a key that is not cached (``None`` is a valid result)
+_MISS = object()
+
+
+class ToolResultCache:
+    """Memoized tool results for a single conversation."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[CacheKey, Tuple[Any, frozenset]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Invalidation counter and the value it had at each tag's last invalidation
+        self._generation = 0
+        self._invalidated_at: Dict[str, int] = {}
+        _live_caches.add(self)
+
+    @staticmethod
+    def make_key(tool_name: str, args: Dict[str, Any]) -> CacheKey:
+        return tool_name, json.dumps(args, sort_keys=True, default=str)
+
+    def get_or_compute(
+        self,
+        tool_name: str,
+        args: Dict[str, Any],
+        compute: Callable[[], Any],
+        tags: Callable[[Any], Iterable[str]] = lambda result: (),
+        cacheable: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """Return the cached result for ``tool_name(**args)`` or compute and store it.
+
+        ``args`` must already be normalized by the caller. ``tags`` maps the
+        result to the record tags it depends on; results rejected by
+        ``cacheable`` (e.g. errors) are returned but not stored.
+        """
+        key = self.make_key(tool_name, args)
+        cached, generation = self._lookup(tool_name, key)
+        if cached is not _MISS:
+            return cached
+        return self._store(key, compute(), tags, cacheable, generation)
+
+    async def aget_or_compute(
+        self,
+        tool_name: str,
+        args: Dict[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        tags: Callable[[Any], Iterable[str]] = lambda result: (),
+        cacheable: Callable[[Any], bool] = lambda result: True,
+    ) -> Any:
+        """Async ``get_or_compute`` for tools whose ``compute`` is a coroutine function."""
+        key = self.make_key(tool_name, args)
+        cached, generation = self._lookup(tool_name, key)
+        if cached is not _MISS:
+            return cached
+        return self._store(key, await compute(), tags, cacheable, generation)
+
+    def _lookup(self, tool_name: str, key: CacheKey) -> Tuple[Any, int]:
+        """The cached result for ``key`` (counted as a hit), else ``_MISS`` (counted as a miss).
+
+        Also returns the invalidation generation, to pass to ``_store``.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            generation = self._generation
+        metrics.inc("tool_cache_misses_total" if entry is None else "tool_cache_hits_total",
+                    labels={"tool": tool_name})
+        return (_MISS if entry is None else entry[0]), generation
+
+    def _store(self, key: CacheKey, result: Any, tags: Callable[[Any], Iterable[str]],
+               cacheable: Callable[[Any], bool], generation: int) -> Any:
+        if cacheable(result):
+            result_tags = frozenset(tags(result))
+            with self._lock:
+                # A record it depends on changed while it was being computed
+                if not any(self._invalidated_at.get(tag, 0) > generation for tag in result_tags):
+                    self._entries[key] = (result, result_tags)
+        return result
+
+    def invalidate(self, tag: str) -> int:
+        """Drop every entry that depends on ``tag``. Returns the number removed."""
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at[tag] = self._generation
+            stale = [k for k, (_, tags) in self._entries.items() if tag in tags]
+            for k in stale:
+                del self._entries[k]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the conversation, suitable for run metadata."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "invalidations": self.invalidations,
+            }
+
+
+# All live conversation caches, so record-change events can reach them
+_live_caches: "weakref.WeakSet[ToolResultCache]" = weakref.WeakSet()
+
+_current_cache: ContextVar[Optional[ToolResultCache]] = ContextVar(
+    "tool_result_cache", default=None)
+
+
+def current_cache() -> Optional[ToolResultCache]:
+    """The cache of the conversation being served, or None outside a conversation."""
+    return _current_cache.get()
+
+
+@contextmanager
+def conversation_cache(cache: ToolResultCache) -> Iterator[ToolResultCache]:
+    """Make ``cache`` the active tool-result cache for the enclosed agent run."""
+    token = _current_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _current_cache.reset(token)
+
+
+def invalidate(tag: str) -> int:
+    """Broadcast a record-change event to every live conversation cache."""
+    removed = sum(cache.invalidate(tag) for cache in list(_live_caches))
+    if removed:
+        metrics.inc("tool_cache_invalidations_total", removed)
+    return removed
+
+
+def order_tag(order_id: str) -> str:
+    return f"order:{order_id}"
+
+
+def customer_tag(customer_id: str) -> str:
+    return f"customer:{customer_id}"
+
+
+def kb_tag(article: str) -> str:
+    return f"kb:{article}"
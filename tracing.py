@@ -0,0 +1,277 @@
+"""Span-based tracing of agent runs, exported to a local JSONL file.
+
+Spans follow the OpenTelemetry data model (trace id, span id, parent, start/end
+in unix nanoseconds, attributes, status) and are written one JSON object per
+line by a background batch exporter. The current span travels in a context
+variable, so it follows asyncio tasks and the threads pydantic-ai uses for
+sync tools; ``install_log_correlation`` adds ``trace_id``/``span_id`` to every
+``logging`` record and prints them through a handler of its own.
+
+Tracing is off by default. When disabled, ``span()`` returns a shared no-op
+context manager after a single flag check.
+"""
+import atexit
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+tracing_enabled = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+# Nivel del handler que imprime los logs con sus ids de traza (no cambia el de
+# los loggers: solo ve lo que estos ya dejan pasar)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING').upper()
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [trace_id=%(trace_id)s span_id=%(span_id)s] %(message)s"
+
+
+class Span:
+    """A recording span."""
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "sampled",
+                 "start_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str],
+                 sampled: bool, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.sampled = sampled
+        self.start_ns = time.time_ns()
+        self.attributes = attributes
+        self.status = "OK"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self, end_ns: int) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": end_ns,
+            "duration_ms": (end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": {"code": self.status, "message": self.error},
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _SpanContext:
+    __slots__ = ("_exporter", "_span", "_token")
+
+    def __init__(self, exporter: "BatchExporter", name: str, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        if parent is None:
+            trace_id = f"{random.getrandbits(128):032x}"
+            sampled = random.random() < TRACE_SAMPLE_RATE
+            parent_id = None
+        else:
+            trace_id, sampled, parent_id = parent.trace_id, parent.sampled, parent.span_id
+        self._exporter = exporter
+        self._span = Span(name, trace_id, parent_id, sampled, attributes)
+
+    def __enter__(self) -> Span:
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if exc is not None:
+            self._span.status = "ERROR"
+            self._span.error = f"{exc_type.__name__}: {exc}"
+        if self._span.sampled:
+            self._exporter.export(self._span.to_dict(time.time_ns()))
+        return False
+
+
+class BatchExporter:
+    """Buffers finished spans and appends them to a JSONL file from a background thread."""
+
+    def __init__(self, path: str, max_batch: int = 256, flush_interval: float = 2.0):
+        self.path = path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._buffer: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Dict[str, Any]):
+        with self._cond:
+            self._buffer.append(span)
+            if len(self._buffer) >= self.max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        with self._cond:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(s, default=str) + "\n" for s in batch)
+        except OSError as e:
+            print(f"⚠️  No se pudieron exportar {len(batch)} spans: {e}")
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait(self.flush_interval)
+            self.flush()
+
+
+_exporter: Optional[BatchExporter] = None
+
+
+def configure(enabled: bool = True, path: Optional[str] = None,
+              sample_rate: Optional[float] = None):
+    """Enable or disable tracing at runtime (overrides the environment settings)."""
+    global tracing_enabled, TRACE_FILE, TRACE_SAMPLE_RATE, _exporter
+    if path is not None and path != TRACE_FILE:
+        if _exporter is not None:
+            _exporter.flush()
+        TRACE_FILE, _exporter = path, None
+    if sample_rate is not None:
+        TRACE_SAMPLE_RATE = sample_rate
+    tracing_enabled = enabled
+    if enabled and _exporter is None:
+        _exporter = BatchExporter(TRACE_FILE)
+        atexit.register(_exporter.flush)
+    if enabled:
+        install_log_correlation()
+    else:
+        remove_log_correlation()
+
+
+def span(name: str, **attributes: Any):
+    """Context manager that records ``name`` as a child of the current span."""
+    if not tracing_enabled:
+        return _NOOP_SPAN
+    return _SpanContext(_exporter, name, attributes)
+
+
+def traced(name: str):
+    """Decorator that records each call of the function as a span named ``name``."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracing_enabled:
+                return func(*args, **kwargs)
+            string_args = [a for a in args if isinstance(a, str)]
+            with _SpanContext(_exporter, name, {"args": string_args} if string_args else {}) as s:
+                result = func(*args, **kwargs)
+                if isinstance(result, bool):
+                    s.set_attribute("result", result)
+                return result
+        return wrapper
+    return decorator
+
+
+def current_span():
+    """The active span, or a no-op span outside of any trace."""
+    return _current_span.get() or _NOOP_SPAN
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active is not None else None
+
+
+def flush():
+    if _exporter is not None:
+        _exporter.flush()
+
+
+_log_handler: Optional[logging.Handler] = None
+
+
+def install_log_correlation(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Stamp every ``logging`` record with ``trace_id``/``span_id`` and print them.
+
+    The ids are added by the record factory, so any handler may use them. A
+    dedicated stderr handler on the root logger prints records at ``level``
+    or above with both ids, so log lines emitted during a run can be joined
+    with its spans. Existing handlers, formatters and logger levels are left
+    alone.
+    """
+    global _log_handler
+    previous = logging.getLogRecordFactory()
+    if not getattr(previous, "_trace_correlation", False):
+        def factory(*args, **kwargs):
+            record = previous(*args, **kwargs)
+            active = _current_span.get()
+            record.trace_id = active.trace_id if active is not None else "-"
+            record.span_id = active.span_id if active is not None else "-"
+            return record
+
+        factory._trace_correlation = True
+        logging.setLogRecordFactory(factory)
+
+    if _log_handler is None:
+        _log_handler = logging.StreamHandler()
+        logging.getLogger().addHandler(_log_handler)
+    _log_handler.setFormatter(logging.Formatter(fmt))
+    _log_handler.setLevel(level)
+
+
+def remove_log_correlation():
+    """Detach the handler added by ``install_log_correlation``."""
+    global _log_handler
+    if _log_handler is not None:
+        logging.getLogger().removeHandler(_log_handler)
+        _log_handler = None
+
+
+def traced_model(model):
+    """Wrap a pydantic-ai model so every request is recorded as a span.
+
+    Returns ``model`` unchanged when tracing is disabled.
+    """
+    if not tracing_enabled:
+        return model
+    from pydantic_ai.messages import ModelResponse, RetryPromptPart
+    from pydantic_ai.models.wrapper import WrapperModel
+
+    class TracedModel(WrapperModel):
+        async def request(self, messages, *args, **kwargs):
+            attempt = sum(isinstance(m, ModelResponse) for m in messages) + 1
+            # Retries so far in this run (output validation or ModelRetry from tools)
+            retry = sum(isinstance(p, RetryPromptPart) for m in messages for p in m.parts)
+            with span("model.request", model=self.model_name, attempt=attempt, retry=retry) as s:
+                response = await super().request(messages, *args, **kwargs)
+                s.set_attribute("input_tokens", response.usage.input_tokens)
+                s.set_attribute("output_tokens", response.usage.output_tokens)
+                return response
+
+    return TracedModel(model)
+
+
+if tracing_enabled:
+    configure(True)
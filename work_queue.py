@@ -0,0 +1,363 @@
+"""Durable local work queue for escalation and follow-up side effects.
+
+When a reply comes back with ``needs_escalation``, ``follow_up_required`` or
+``auto_actions_taken``, the side effects (tickets, follow-ups, CRM writes...)
+are enqueued here and handled by a worker pool after the reply has been shown,
+instead of adding latency to it.
+
+The queue is a SQLite database with at-least-once delivery: a claimed job that
+is not acknowledged before its lease expires (e.g. the worker crashed) becomes
+visible again, and the worker that lost the lease can no longer ack or fail
+it. Failed jobs are retried with exponential backoff and moved to
+the ``dead_letters`` table after ``max_attempts``. Handlers must therefore be
+idempotent; the default ones key their writes on the job's ``dedupe_key``.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from metrics import metrics
+
+WORK_QUEUE_DB = os.getenv('WORK_QUEUE_DB', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'support_queue.sqlite3'))
+work_queue_workers = int(os.getenv('WORK_QUEUE_WORKERS', '2'))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    job_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    failed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tickets (
+    dedupe_key TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    reason TEXT,
+    summary TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS follow_ups (
+    dedupe_key TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    due_at REAL NOT NULL,
+    summary TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS action_log (
+    dedupe_key TEXT PRIMARY KEY,
+    customer_id TEXT NOT NULL,
+    action TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class Job:
+    """A claimed job."""
+
+    def __init__(self, row: sqlite3.Row):
+        self.id: int = row["id"]
+        self.kind: str = row["kind"]
+        self.dedupe_key: str = row["dedupe_key"]
+        self.payload: Dict[str, Any] = json.loads(row["payload"])
+        self.attempts: int = row["attempts"]
+        # Identifies this worker's lease: ack/fail only apply while it is current
+        self.lease_until: Optional[float] = row["lease_until"]
+
+
+class WorkQueue:
+    """SQLite-backed job queue with leases, backoff retries and a dead-letter table."""
+
+    def __init__(self, path: str = WORK_QUEUE_DB, lease_seconds: float = 60.0,
+                 backoff_base: float = 2.0, backoff_max: float = 300.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Short-lived connection; one per call keeps the queue thread-safe."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any],
+                dedupe_key: Optional[str] = None, max_attempts: int = 5) -> int:
+        now = time.time()
+        with self.connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, dedupe_key, payload, max_attempts, available_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, dedupe_key or uuid.uuid4().hex, json.dumps(payload, default=str),
+                 max_attempts, now, now))
+        metrics.inc("work_queue_enqueued_total", labels={"kind": kind})
+        return cur.lastrowid
+
+    def claim(self) -> Optional[Job]:
+        """Lease the next ready job, including jobs whose previous lease expired."""
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A job whose lease expired on its last attempt (e.g. it keeps
+                # killing the worker) is dead-lettered instead of leased again
+                exhausted = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'running' AND lease_until < ? "
+                    "AND attempts >= max_attempts", (now,)).fetchall()
+                for expired in exhausted:
+                    self._dead_letter(conn, expired, expired["last_error"] or "lease expired", now)
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = 'pending' AND available_at <= ?) "
+                    "OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY available_at, id LIMIT 1", (now, now)).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ? "
+                        "WHERE id = ?", (now + self.lease_seconds, row["id"]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        for expired in exhausted:
+            metrics.inc("work_queue_dead_lettered_total", labels={"kind": expired["kind"]})
+        if row is None:
+            return None
+        job = Job(row)
+        job.attempts += 1
+        job.lease_until = now + self.lease_seconds
+        return job
+
+    def _lease_lost(self, job: Job):
+        metrics.inc("work_queue_lease_lost_total", labels={"kind": job.kind})
+        print(f"⚠️  Trabajo {job.kind}#{job.id}: la concesión expiró y la tiene otro trabajador")
+
+    def ack(self, job: Job) -> bool:
+        """Remove a completed job. False if this worker's lease expired meanwhile."""
+        with self.connect() as conn:
+            cur = conn.execute("DELETE FROM jobs WHERE id = ? AND status = 'running' AND lease_until = ?",
+                               (job.id, job.lease_until))
+        if cur.rowcount == 0:
+            self._lease_lost(job)
+            return False
+        metrics.inc("work_queue_completed_total", labels={"kind": job.kind})
+        return True
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Schedule a retry with exponential backoff, or dead-letter the job.
+
+        False if this worker's lease expired meanwhile (the job is left alone).
+        """
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT * FROM jobs WHERE id = ? AND status = 'running' AND lease_until = ?",
+                                   (job.id, job.lease_until)).fetchone()
+                if row is None:
+                    dead = None
+                elif row["attempts"] >= row["max_attempts"]:
+                    dead = True
+                    self._dead_letter(conn, row, error, now)
+                else:
+                    dead = False
+                    delay = min(self.backoff_base * 2 ** (row["attempts"] - 1), self.backoff_max)
+                    delay *= random.uniform(0.8, 1.2)
+                    conn.execute(
+                        "UPDATE jobs SET status = 'pending', available_at = ?, lease_until = NULL, "
+                        "last_error = ? WHERE id = ?", (now + delay, error, job.id))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if dead is None:
+            self._lease_lost(job)
+            return False
+        metrics.inc("work_queue_dead_lettered_total" if dead else "work_queue_retried_total",
+                    labels={"kind": job.kind})
+        return True
+
+    @staticmethod
+    def _dead_letter(conn: sqlite3.Connection, row: sqlite3.Row, error: str, now: float):
+        """Move ``row`` to ``dead_letters``; the caller owns the transaction."""
+        conn.execute(
+            "INSERT OR REPLACE INTO dead_letters "
+            "(job_id, kind, dedupe_key, payload, attempts, last_error, failed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (row["id"], row["kind"], row["dedupe_key"], row["payload"],
+             row["attempts"], error, now))
+        conn.execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+
+    def depth(self) -> Dict[str, int]:
+        with self.connect() as conn:
+            pending = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+            dead = conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        metrics.set_gauge("work_queue_depth", pending)
+        metrics.set_gauge("work_queue_dead_letters", dead)
+        return {"pending": pending, "dead_letters": dead}
+
+    def dead_letters(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM dead_letters ORDER BY failed_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+Handler = Callable[[Job, WorkQueue], None]
+
+
+class WorkerPool:
+    """Background threads that drain a ``WorkQueue`` through per-kind handlers."""
+
+    def __init__(self, queue: WorkQueue, handlers: Dict[str, Handler],
+                 workers: int = 2, poll_interval: float = 0.5):
+        self.queue = queue
+        self.handlers = dict(handlers)
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._loop, name=f"work-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self) -> bool:
+        """Process a single job if one is ready. Returns False when the queue is idle."""
+        job = self.queue.claim()
+        if job is None:
+            return False
+        handler = self.handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            handler(job, self.queue)
+        except Exception as e:
+            print(f"⚠️  Trabajo {job.kind}#{job.id} falló (intento {job.attempts}): {e}")
+            self.queue.fail(job, str(e))
+        else:
+            self.queue.ack(job)
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except sqlite3.Error as e:
+                print(f"⚠️  Error en la cola de trabajos: {e}")
+                busy = False
+            if not busy:
+                self._stop.wait(self.poll_interval)
+
+
+def handle_escalation(job: Job, queue: WorkQueue):
+    """Open a support ticket for a reply flagged for escalation."""
+    with queue.connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO tickets (dedupe_key, customer_id, reason, summary, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job.dedupe_key, job.payload["customer_id"], job.payload.get("escalation_reason"),
+             job.payload.get("user_prompt"), time.time()))
+
+
+def handle_follow_up(job: Job, queue: WorkQueue):
+    """Schedule a follow-up with the customer."""
+    due_at = time.time() + float(job.payload.get("follow_up_in_hours", 24)) * 3600
+    with queue.connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO follow_ups (dedupe_key, customer_id, due_at, summary, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (job.dedupe_key, job.payload["customer_id"], due_at,
+             job.payload.get("user_prompt"), time.time()))
+
+
+def handle_auto_action(job: Job, queue: WorkQueue):
+    """Record an action the agent reported as taken (CRM write placeholder)."""
+    with queue.connect() as conn:
+        conn.execute(
+            "INSERT OR IGNORE INTO action_log (dedupe_key, customer_id, action, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (job.dedupe_key, job.payload["customer_id"], job.payload["action"], time.time()))
+
+
+DEFAULT_HANDLERS: Dict[str, Handler] = {
+    "escalation": handle_escalation,
+    "follow_up": handle_follow_up,
+    "auto_action": handle_auto_action,
+}
+
+
+def enqueue_response_side_effects(queue: WorkQueue, customer_id: str,
+                                  user_prompt: str, output: Any) -> List[int]:
+    """Enqueue the side effects requested by a ``ResponseModel``. Returns the job ids."""
+    reply_id = uuid.uuid4().hex
+    base = {"customer_id": customer_id, "user_prompt": user_prompt, "response": output.response}
+    job_ids = []
+    if output.needs_escalation:
+        job_ids.append(queue.enqueue(
+            "escalation", {**base, "escalation_reason": output.escalation_reason},
+            dedupe_key=f"{reply_id}:escalation"))
+    if output.follow_up_required:
+        job_ids.append(queue.enqueue(
+            "follow_up", base, dedupe_key=f"{reply_id}:follow_up"))
+    for i, action in enumerate(output.auto_actions_taken):
+        job_ids.append(queue.enqueue(
+            "auto_action", {**base, "action": action}, dedupe_key=f"{reply_id}:action:{i}"))
+    return job_ids
+
+
+# Instancias globales de la cola y sus trabajadores
+_queue = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_work_queue() -> WorkQueue:
+    """Obtiene o crea la cola global y arranca sus trabajadores."""
+    global _queue, _pool
+    with _lock:
+        if _queue is None:
+            _queue = WorkQueue()
+            _pool = WorkerPool(_queue, DEFAULT_HANDLERS, workers=work_queue_workers)
+            _pool.start()
+        return _queue